@@ -0,0 +1,605 @@
+# Бенчмарки бота на справжніх хендлерах з фейковим Bot API (штучна затримка на кожен виклик).
+# Дані й логи — у тимчасовій теці, справжні data/ та .env не чіпаються.
+#
+#   python benchmark.py [suite] [--scale 1] [--latency-ms 10] [--scenario flood ...] [--json out.json] [--baseline old.json]
+#       сценарії (steady, flood, voice, locked, commands, users_100k): пов/с, p50/p99 затримки хендлера,
+#       виклики API на повідомлення, байти записані в data/, пікова пам'ять; --json — машиночитний звіт
+#   python benchmark.py concurrency [--messages 2000] [--users 400] [--latency-ms 50] [--concurrency 64]
+#       пропускна здатність Application: послідовна обробка проти CONCURRENT_UPDATES
+#   python benchmark.py startup [--users 100000] [--stamps 10] [--expired 0.5]
+#       холодний старт шарда для кожного STORAGE_BACKEND: розмір даних, час і пам'ять завантаження,
+#       вартість першого повідомлення користувача, що повернувся (лінива гідратація у binary)
+#   python benchmark.py logging [--scale 1] [--repeat 3]
+#       ціна логування на одне повідомлення: рівні INFO/DEBUG, запис у файл з event loop проти LOG_QUEUE, text проти json
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+BENCH_CHAT_ID = -1000000000001
+BENCH_OWNER_ID = 1
+REPO_DIR = Path(__file__).resolve().parent
+
+# Змінні середовища задаються до імпорту bot.py і мають пріоритет над .env
+os.environ["BOT_TOKEN"] = "123456:benchmark"
+os.environ["OWNER_ID"] = str(BENCH_OWNER_ID)
+os.environ["OWNER_PRIVATE_ID"] = str(BENCH_OWNER_ID)
+os.environ["ALLOWED_CHAT_IDS"] = str(BENCH_CHAT_ID)
+os.environ.setdefault("LOGGER_LEVEL", "WARNING")
+WORK_DIR = Path(tempfile.mkdtemp(prefix="abcwarrior-bench-"))
+os.chdir(WORK_DIR)
+sys.path.insert(0, str(REPO_DIR))
+
+from telegram import Bot, Update  # noqa: E402
+from telegram.ext import TypeHandler  # noqa: E402
+
+import bot  # noqa: E402
+from fake_bot_api import FakeBotRequest  # noqa: E402
+
+
+def make_updates(count: int, users: int, seed: int = 1) -> list[dict]:
+    # Кожен користувач пише кілька повідомлень поспіль; частина — голосові, частина впирається у флуд
+    rng = random.Random(seed)
+    now = int(time.time())
+    updates = []
+    for i in range(count):
+        user_id = 1000 + rng.randrange(users)
+        message = {"message_id": i + 1, "date": now,
+                   "chat": {"id": BENCH_CHAT_ID, "type": "supergroup", "title": "bench"},
+                   "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}}
+        if rng.random() < 0.02:
+            message["voice"] = {"file_id": "v", "file_unique_id": "v", "duration": 1}
+        else:
+            message["text"] = f"повідомлення {i}"
+        updates.append({"update_id": i + 1, "message": message})
+    return updates
+
+
+def reset_state(run_dir: Path, unthrottled: bool = False):
+    # Кожен прогін — з чистим станом і власною текою даних
+    for shard in bot.shards.values():
+        shard.store.close()
+    shutil.rmtree(run_dir, ignore_errors=True)
+    run_dir.mkdir(parents=True)
+    os.chdir(run_dir)
+    bot.shards.clear()
+    bot._legacy_backend = None
+    bot._legacy_import_chats = None
+    bot.member_cache = bot.MemberStatusCache(bot.MEMBER_CACHE_TTL_SECONDS, bot.MEMBER_CACHE_MAX_ENTRIES)
+    if unthrottled:
+        # Вимірюємо роботу бота, а не ліміти Telegram: черга вихідних без обмежень швидкості
+        bot.outbox = bot.Outbox(1e9, 1e9, 1e9, 64, bot.MUTE_NOTICE_COALESCE_MS / 1000)
+    else:
+        bot.outbox = bot.Outbox(bot.OUTBOX_GLOBAL_PER_SECOND, bot.OUTBOX_GROUP_PER_MINUTE,
+                                bot.OUTBOX_PRIVATE_PER_SECOND, bot.OUTBOX_CONCURRENCY,
+                                bot.MUTE_NOTICE_COALESCE_MS / 1000)
+
+
+# ─── Сценарії для suite ───
+class FakeContext:
+    def __init__(self, fake_bot, args=None):
+        self.bot = fake_bot
+        self.args = args or []
+        self.job_queue = None
+        self.application = None
+
+
+class Workload:
+    # Що викликати: список (назва хендлера, хендлер, апдейт, args) і підготовка стану перед заміром
+    def __init__(self):
+        self.calls: list[tuple[str, object, Update, list[str]]] = []
+        self.setup = None
+        self._next_id = 0
+
+    def message(self, fake_bot, user_id: int, ts: int, text: str = None, voice: bool = False, args=None,
+                handler=None, name: str = "handle_message"):
+        self._next_id += 1
+        data = {"message_id": self._next_id, "date": ts,
+                "chat": {"id": BENCH_CHAT_ID, "type": "supergroup", "title": "bench"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}}
+        if voice:
+            data["voice"] = {"file_id": "v", "file_unique_id": "v", "duration": 1}
+        else:
+            data["text"] = text or f"повідомлення {self._next_id}"
+            if data["text"].startswith("/"):
+                data["entities"] = [{"type": "bot_command", "offset": 0, "length": len(data["text"].split()[0])}]
+        update = Update.de_json({"update_id": self._next_id, "message": data}, fake_bot)
+        self.calls.append((name, handler or bot.handle_message, update, args or []))
+
+
+def scenario_steady(fake_bot, scale: float, rng: random.Random) -> Workload:
+    # Звичайний чат: багато користувачів, кожен пише рідко, нікого не мутять
+    work = Workload()
+    count = int(5000 * scale)
+    users = max(50, count // 4)
+    start = int(time.time()) - count // 20
+    for i in range(count):
+        work.message(fake_bot, 10_000 + rng.randrange(users), start + i // 20)
+    return work
+
+
+def scenario_flood(fake_bot, scale: float, rng: random.Random) -> Workload:
+    # Рейд: кілька десятків акаунтів шлють повідомлення пачками — мути, видалення, сповіщення
+    work = Workload()
+    count = int(5000 * scale)
+    users = max(10, int(40 * scale))
+    start = int(time.time()) - count // 200
+    for i in range(count):
+        work.message(fake_bot, 20_000 + rng.randrange(users), start + i // 200)
+    return work
+
+
+def scenario_voice(fake_bot, scale: float, rng: random.Random) -> Workload:
+    # Спам голосовими: кожне видаляється, автор отримує мут
+    work = Workload()
+    count = int(3000 * scale)
+    users = max(50, count // 3)
+    start = int(time.time()) - count // 50
+    for i in range(count):
+        work.message(fake_bot, 30_000 + rng.randrange(users), start + i // 50, voice=True)
+    return work
+
+
+def scenario_locked(fake_bot, scale: float, rng: random.Random) -> Workload:
+    # Група заблокована: усі повідомлення не-адмінів видаляються
+    work = Workload()
+    count = int(5000 * scale)
+    users = max(50, count // 5)
+    start = int(time.time()) - count // 50
+    for i in range(count):
+        work.message(fake_bot, 40_000 + rng.randrange(users), start + i // 50)
+    work.setup = lambda shard: shard.set_locked(True)
+    return work
+
+
+def scenario_commands(fake_bot, scale: float, rng: random.Random) -> Workload:
+    # Команди: невідомі (auto_delete_commands), /stats від учасників і /listmute від власника при 1000 мутів
+    work = Workload()
+    count = int(2000 * scale)
+    now = int(time.time())
+    for i in range(count):
+        kind = i % 10
+        if kind < 6:
+            work.message(fake_bot, 50_000 + rng.randrange(500), now, text="/somecommand",
+                         handler=bot.auto_delete_commands, name="auto_delete_commands")
+        elif kind < 9:
+            work.message(fake_bot, 50_000 + rng.randrange(500), now, text="/stats", handler=bot.stats, name="stats")
+        else:
+            work.message(fake_bot, BENCH_OWNER_ID, now, text="/listmute", args=[str(1 + rng.randrange(20))],
+                         handler=bot.listmute, name="listmute")
+
+    def setup(shard):
+        until = datetime.now(timezone.utc) + timedelta(hours=1)
+        for uid in range(1000):
+            shard.mute(60_000 + uid, until + timedelta(seconds=uid))
+    work.setup = setup
+    return work
+
+
+def scenario_users_100k(fake_bot, scale: float, rng: random.Random) -> Workload:
+    # 100k користувачів з лічильниками і 5k мутів у стані; звичайний трафік плюс /stats і /listmute
+    work = Workload()
+    tracked = int(100_000 * scale)
+    count = int(5000 * scale)
+    now = int(time.time())
+    for i in range(count):
+        # Кожне 500-те — /listmute, решта кожного 100-го — /stats (499 теж ділиться на 100 з залишком 99)
+        if i % 500 == 499:
+            work.message(fake_bot, BENCH_OWNER_ID, now, text="/listmute", args=[str(1 + rng.randrange(50))],
+                         handler=bot.listmute, name="listmute")
+        elif i % 100 == 99:
+            work.message(fake_bot, 100_000 + rng.randrange(tracked), now, text="/stats", handler=bot.stats, name="stats")
+        else:
+            work.message(fake_bot, 100_000 + rng.randrange(tracked), now - (count - i) // 20)
+
+    def setup(shard):
+        day = datetime.now(timezone.utc).date().toordinal()
+        for uid in range(tracked):
+            shard.rate_limiter.restore(100_000 + uid, [now - 3600 - uid % 3000, now - 600 - uid % 500], day, 2)
+            shard.store.mark_dirty("rates", 100_000 + uid)
+        until = datetime.now(timezone.utc) + timedelta(hours=2)
+        for uid in range(tracked // 20):
+            shard.mute(100_000 + tracked + uid, until + timedelta(seconds=uid))
+    work.setup = setup
+    return work
+
+
+SCENARIOS = {
+    "steady": scenario_steady,
+    "flood": scenario_flood,
+    "voice": scenario_voice,
+    "locked": scenario_locked,
+    "commands": scenario_commands,
+    "users_100k": scenario_users_100k,
+}
+
+
+def written_bytes() -> int | None:
+    # Байти, записані процесом (усі потоки, включно з write-behind); лише Linux
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def data_size() -> int:
+    return sum(p.stat().st_size for p in Path("data").rglob("*") if p.is_file())
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def drain():
+    # Дочекатися всіх фонових запитів (видалення, сповіщення) і скинути стан на диск
+    for shard in list(bot.shards.values()):
+        await shard.deletions.flush()
+    await bot.outbox.flush(timeout=60)
+    bot.outbox._draining = False
+    for shard in list(bot.shards.values()):
+        await shard.store.flush()
+
+
+async def run_scenario(name: str, scale: float, latency: float, seed: int, trace_memory: bool) -> dict:
+    reset_state(WORK_DIR / f"suite-{name}-{'mem' if trace_memory else 'time'}", unthrottled=True)
+    request = FakeBotRequest(latency)
+    fake_bot = Bot("123456:benchmark", request=request)
+    await fake_bot.initialize()
+    if trace_memory:
+        tracemalloc.start()
+    work = SCENARIOS[name](fake_bot, scale, random.Random(seed))
+    shard = bot.get_shard(BENCH_CHAT_ID)
+    if work.setup:
+        work.setup(shard)
+    await bot.member_cache.refresh_admins(fake_bot, BENCH_CHAT_ID)
+    await drain()
+    calls_before = sum(request.calls.values())
+    wchar_before = written_bytes()
+    size_before = data_size()
+
+    # Скидання на диск — як flush_state_job кожні SAVE_INTERVAL_SECONDS при 200 пов/с;
+    # воно входить у пов/с, але не в затримки хендлерів
+    flush_every = max(1, int(bot.SAVE_INTERVAL_SECONDS * 200))
+    latencies: dict[str, list[float]] = {}
+    started = time.perf_counter()
+    for i, (handler_name, handler, update, args) in enumerate(work.calls, 1):
+        context = FakeContext(fake_bot, args)
+        t0 = time.perf_counter()
+        await handler(update, context)
+        latencies.setdefault(handler_name, []).append(time.perf_counter() - t0)
+        if i % flush_every == 0:
+            await shard.store.flush()
+    elapsed = time.perf_counter() - started
+    await drain()
+
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    wchar_after = written_bytes()
+    api_calls = sum(request.calls.values()) - calls_before
+    everything = [value for values in latencies.values() for value in values]
+    await fake_bot.shutdown()
+    return {
+        "scenario": name,
+        "messages": len(work.calls),
+        "seconds": round(elapsed, 4),
+        "msgs_per_sec": round(len(work.calls) / elapsed, 1),
+        "p50_ms": round(percentile(everything, 50) * 1000, 3),
+        "p99_ms": round(percentile(everything, 99) * 1000, 3),
+        "handlers": {h: {"count": len(v), "p50_ms": round(percentile(v, 50) * 1000, 3),
+                         "p99_ms": round(percentile(v, 99) * 1000, 3)} for h, v in latencies.items()},
+        "api_calls_per_msg": round(api_calls / len(work.calls), 4),
+        "api_calls": dict(sorted(request.calls.items())),
+        "bytes_written": (wchar_after - wchar_before) if wchar_before is not None else data_size() - size_before,
+        "peak_memory_mb": round(peak / 1024 / 1024, 2) if peak is not None else None,
+    }
+
+
+def bot_version() -> str:
+    found = re.search(r"Поточна версія: (\S+)", (REPO_DIR / "bot.py").read_text(encoding="utf-8"))
+    return found.group(1) if found else "?"
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def run_suite(args):
+    names = args.scenario or list(SCENARIOS)
+    results = []
+    for name in names:
+        result = await run_scenario(name, args.scale, args.latency_ms / 1000, args.seed, trace_memory=False)
+        # Пам'ять — окремим прогоном: tracemalloc сильно сповільнює і спотворив би затримки
+        memory = await run_scenario(name, args.scale, args.latency_ms / 1000, args.seed, trace_memory=True)
+        result["peak_memory_mb"] = memory["peak_memory_mb"]
+        results.append(result)
+    for shard in bot.shards.values():
+        shard.store.close()
+
+    report = {
+        "version": bot_version(),
+        "git": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"scale": args.scale, "latency_ms": args.latency_ms, "seed": args.seed,
+                   "storage_backend": bot.STORAGE_BACKEND},
+        "results": results,
+    }
+    baseline = {}
+    if args.baseline:
+        baseline = {r["scenario"]: r for r in json.loads(Path(args.baseline).read_text(encoding="utf-8"))["results"]}
+
+    print(f"версія {report['version']} ({report['git']}), масштаб {args.scale}, затримка API {args.latency_ms:.0f} мс, "
+          f"сховище {bot.STORAGE_BACKEND}")
+    print(f"{'сценарій':<12}{'пов.':>7}{'пов/с':>10}{'p50 мс':>9}{'p99 мс':>9}{'API/пов':>9}{'записано':>12}{'пам. МБ':>9}")
+    for r in results:
+        print(f"{r['scenario']:<12}{r['messages']:>7}{r['msgs_per_sec']:>10}{r['p50_ms']:>9}{r['p99_ms']:>9}"
+              f"{r['api_calls_per_msg']:>9}{r['bytes_written']:>12}{r['peak_memory_mb']:>9}")
+        old = baseline.get(r["scenario"])
+        if old:
+            print(f"{'':<12}проти {Path(args.baseline).name}: пов/с {change(old['msgs_per_sec'], r['msgs_per_sec'])}, "
+                  f"p99 {change(old['p99_ms'], r['p99_ms'])}, записано {change(old['bytes_written'], r['bytes_written'])}, "
+                  f"пам'ять {change(old['peak_memory_mb'], r['peak_memory_mb'])}")
+    if args.json:
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.json == "-":
+            print(text)
+        else:
+            Path(args.json).write_text(text + "\n", encoding="utf-8")
+            print(f"звіт: {args.json}")
+
+
+def change(old, new) -> str:
+    if not old or new is None:
+        return "—"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+# ─── Послідовно проти CONCURRENT_UPDATES ───
+async def run_once(name: str, updates: list[dict], latency: float, concurrency: int, admins_ok: bool) -> dict:
+    reset_state(WORK_DIR / f"{name}-{concurrency}")
+    request = FakeBotRequest(latency, admins_ok)
+    app = bot.build_application(request=request, concurrent_updates=concurrency)
+    done = asyncio.Event()
+    processed = 0
+
+    async def count_processed(update, context):
+        nonlocal processed
+        processed += 1
+        if processed == len(updates):
+            done.set()
+
+    # Група 1 виконується після хендлерів бота (група 0) для кожного апдейта
+    app.add_handler(TypeHandler(Update, count_processed), group=1)
+    await app.initialize()
+    await app.start()
+    parsed = [Update.de_json(data, app.bot) for data in updates]
+    started = time.perf_counter()
+    for update in parsed:
+        app.update_queue.put_nowait(update)
+    await done.wait()
+    elapsed = time.perf_counter() - started
+    await app.stop()
+    await app.shutdown()
+    for shard in bot.shards.values():
+        shard.store.close()
+    return {
+        "scenario": name,
+        "mode": f"concurrent={concurrency}" if concurrency else "sequential",
+        "messages": len(updates),
+        "seconds": round(elapsed, 3),
+        "msgs_per_sec": round(len(updates) / elapsed, 1),
+        "api_calls": dict(sorted(request.calls.items())),
+    }
+
+
+async def run_concurrency(args):
+    updates = make_updates(args.messages, args.users)
+    latency = args.latency_ms / 1000
+    # warm — список адмінів закешовано; cold — кожен новий користувач коштує getChatMember
+    scenarios = (("warm", True), ("cold", False))
+    results = []
+    for name, admins_ok in scenarios:
+        for concurrency in (0, args.concurrency):
+            results.append(await run_once(name, updates, latency, concurrency, admins_ok))
+
+    print(f"{args.messages} повідомлень, {args.users} користувачів, затримка API {args.latency_ms:.0f} мс")
+    print(f"{'сценарій':<10}{'режим':<18}{'сек':>9}{'пов/с':>11}")
+    for result in results:
+        print(f"{result['scenario']:<10}{result['mode']:<18}{result['seconds']:>9}{result['msgs_per_sec']:>11}")
+    for name, _ in scenarios:
+        sequential, concurrent = [r for r in results if r["scenario"] == name]
+        print(f"{name}: прискорення ×{concurrent['msgs_per_sec'] / sequential['msgs_per_sec']:.1f}")
+
+
+# ─── Холодний старт ───
+STARTUP_BACKENDS = ("json", "sqlite", "journal", "binary")
+
+
+def startup_state(users: int, stamps: int, expired: float, seed: int = 1) -> dict:
+    # Історія чату: частина користувачів писала давно (вікна прострочені), частина — сьогодні;
+    # кожен десятий має мут, половина мутів уже закінчилась
+    rng = random.Random(seed)
+    now = int(time.time())
+    today = datetime.now(timezone.utc).date()
+    rates, mutes = {}, {}
+    for i in range(users):
+        user_id = 1000 + i
+        if rng.random() < expired:
+            last = now - rng.randrange(2, 30) * 86400
+            day = today - timedelta(days=(now - last) // 86400)
+        else:
+            last = now - rng.randrange(0, 3000)
+            day = today
+        rates[user_id] = {"t": sorted(last - rng.randrange(0, 3600) for _ in range(stamps)),
+                          "d": day.isoformat(), "c": rng.randrange(1, 50)}
+        if i % 10 == 0:
+            until = datetime.now(timezone.utc) + timedelta(minutes=rng.choice((-60, 60)))
+            mutes[user_id] = until.isoformat()
+    return {"rates": rates, "mutes": mutes, "meta": {0: {"locked": False}}}
+
+
+def run_startup_backend(kind: str, state: dict, returning: list[int]) -> dict:
+    reset_state(WORK_DIR / f"startup-{kind}")
+    bot.STORAGE_BACKEND = kind
+    directory = bot.CHATS_DIR / str(BENCH_CHAT_ID)
+    directory.mkdir(parents=True)
+    backend = bot.make_backend(kind, directory)
+    backend.write(state)
+    if isinstance(backend, bot.JournalBackend):
+        # Як після довгої роботи: усе вже в знімку, журнал порожній
+        backend.compact()
+    backend.close()
+    size = sum(path.stat().st_size for path in directory.iterdir() if path.is_file())
+
+    # Перший прохід — час, другий — пам'ять (tracemalloc сам уповільнює завантаження)
+    started = time.perf_counter()
+    shard = bot.open_shard(BENCH_CHAT_ID)
+    load_seconds = time.perf_counter() - started
+    shard.store.backend.close()
+    tracemalloc.start()
+    shard = bot.open_shard(BENCH_CHAT_ID)
+    _, load_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {
+        "backend": kind,
+        "data_bytes": size,
+        "load_ms": round(load_seconds * 1000, 1),
+        "load_peak_mb": round(load_peak / 2 ** 20, 1),
+        "resident_users": len(shard.rate_limiter.users),
+        "cold_users": len(shard.rate_limiter.cold or ()),
+        "active_mutes": len(shard.mutes),
+    }
+
+    now = int(time.time())
+    day = datetime.now(timezone.utc).date().toordinal()
+    started = time.perf_counter()
+    for user_id in returning:
+        shard.rate_limiter.hit(user_id, now, day)
+    result["first_touch_us"] = round((time.perf_counter() - started) / len(returning) * 1e6, 2)
+    shard.store.backend.close()
+    bot.shards.clear()
+    return result
+
+
+def run_startup(args):
+    state = startup_state(args.users, args.stamps, args.expired)
+    returning = random.Random(2).sample(sorted(state["rates"]), min(1000, args.users))
+    results = [run_startup_backend(kind, state, returning) for kind in STARTUP_BACKENDS]
+    print(f"{args.users} користувачів по {args.stamps} позначок часу, прострочено ~{args.expired:.0%}, "
+          f"мутів {len(state['mutes'])}")
+    print(f"{'бекенд':<9}{'дані, КБ':>10}{'старт, мс':>11}{'пам., МБ':>10}{'в пам.':>9}{'у знімку':>10}"
+          f"{'мутів':>7}{'1-ше пов., мкс':>16}")
+    for r in results:
+        print(f"{r['backend']:<9}{r['data_bytes'] // 1024:>10}{r['load_ms']:>11}{r['load_peak_mb']:>10}"
+              f"{r['resident_users']:>9}{r['cold_users']:>10}{r['active_mutes']:>7}{r['first_touch_us']:>16}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"звіт: {args.json}")
+
+
+# ─── Ціна логування ───
+LOGGING_MODES = (
+    ("вимкнено", logging.CRITICAL, False, "text"),
+    ("INFO, файл", logging.INFO, False, "text"),
+    ("INFO, черга", logging.INFO, True, "text"),
+    ("DEBUG, файл", logging.DEBUG, False, "text"),
+    ("DEBUG, черга", logging.DEBUG, True, "text"),
+    ("DEBUG, черга, json", logging.DEBUG, True, "json"),
+)
+
+
+async def run_logging(args):
+    scenarios = ("steady", "flood")
+    level = bot.logger.level
+    results = []
+    for mode, mode_level, use_queue, log_format in LOGGING_MODES:
+        per_message = {}
+        for name in scenarios:
+            best = None
+            for attempt in range(args.repeat):
+                bot.configure_logging(use_queue, log_format)
+                bot.logger.setLevel(mode_level)
+                result = await run_scenario(name, args.scale, 0, attempt, trace_memory=False)
+                # Запис черги в файл теж входить у замір
+                bot.configure_logging(False, "text")
+                if best is None or result["seconds"] < best["seconds"]:
+                    best = result
+            per_message[name] = (best["seconds"] / best["messages"] * 1e6, best["p99_ms"] * 1000)
+        results.append((mode, per_message))
+    bot.logger.setLevel(level)
+    for shard in bot.shards.values():
+        shard.store.close()
+
+    base = results[0][1]
+    print(f"мкс на повідомлення (найкраще з {args.repeat}), у дужках — ціна логування; p99 хендлера, мкс")
+    print(f"{'режим':<22}" + "".join(f"{name:>20}{'p99':>8}" for name in scenarios))
+    for mode, per_message in results:
+        print(f"{mode:<22}" + "".join(f"{per_message[n][0]:>10.1f} ({per_message[n][0] - base[n][0]:>+6.1f})"
+                                      f"{per_message[n][1]:>8.0f}" for n in scenarios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки ABCWarrior_bot")
+    commands = parser.add_subparsers(dest="command")
+    suite = commands.add_parser("suite", help="сценарії на справжніх хендлерах (за замовчуванням)")
+    suite.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                       help="запустити лише цей сценарій (можна кілька разів)")
+    suite.add_argument("--scale", type=float, default=1.0, help="множник розміру сценаріїв")
+    suite.add_argument("--latency-ms", type=float, default=10)
+    suite.add_argument("--seed", type=int, default=1)
+    suite.add_argument("--json", help="зберегти звіт у файл ('-' — в stdout)")
+    suite.add_argument("--baseline", help="попередній JSON-звіт для порівняння")
+    concurrency = commands.add_parser("concurrency", help="послідовно vs CONCURRENT_UPDATES")
+    concurrency.add_argument("--messages", type=int, default=2000)
+    concurrency.add_argument("--users", type=int, default=400)
+    concurrency.add_argument("--latency-ms", type=float, default=50)
+    concurrency.add_argument("--concurrency", type=int, default=64)
+    startup = commands.add_parser("startup", help="холодний старт шарда для кожного бекенду сховища")
+    startup.add_argument("--users", type=int, default=100000)
+    startup.add_argument("--stamps", type=int, default=10, help="позначок часу на користувача")
+    startup.add_argument("--expired", type=float, default=0.5, help="частка користувачів з простроченими вікнами")
+    startup.add_argument("--json", help="зберегти результати у файл")
+    logging_cost = commands.add_parser("logging", help="ціна логування на повідомлення в різних режимах")
+    logging_cost.add_argument("--scale", type=float, default=1.0)
+    logging_cost.add_argument("--repeat", type=int, default=3)
+    argv = sys.argv[1:]
+    if not argv or argv[0] not in ("suite", "concurrency", "startup", "logging", "-h", "--help"):
+        argv = ["suite"] + argv
+    args = parser.parse_args(argv)
+    if args.command == "startup":
+        run_startup(args)
+        return
+    if args.command == "logging":
+        asyncio.run(run_logging(args))
+        return
+    asyncio.run(run_concurrency(args) if args.command == "concurrency" else run_suite(args))
+
+
+if __name__ == "__main__":
+    main()
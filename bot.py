@@ -1,17 +1,43 @@
+from __future__ import annotations
+import asyncio
+import atexit
+import cProfile
+import io
 import logging
+import multiprocessing
 import os
-from dotenv import load_dotenv
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from telegram.error import TelegramError
-from datetime import datetime, timedelta, date, time, timezone
+import pstats
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+import time
+from time import monotonic, perf_counter
+from dotenv import dotenv_values, find_dotenv, load_dotenv
+from telegram import ChatPermissions, Update
+from telegram.ext import Application, ChatMemberHandler, CommandHandler, MessageHandler, TypeHandler, filters, ContextTypes
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from telegram.request import BaseRequest, HTTPXRequest
+from datetime import datetime, timedelta, date, timezone
 import re
+import signal
+import html
 import json
+import sqlite3
+import struct
+import sys
+import threading
+import heapq
+from itertools import islice
+from bisect import bisect_left, bisect_right, insort
+from array import array
 from pathlib import Path
 from filelock import FileLock, Timeout  # pip install filelock
 from logging.handlers import TimedRotatingFileHandler
+import zlib
 
 # Завантажуємо .env
+# Змінні оточення самого процесу: мають пріоритет над .env, зокрема й при /reloadconfig
+PROCESS_ENV = dict(os.environ)
 load_dotenv()
 
 # Основні критичні змінні
@@ -20,170 +46,2652 @@ if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN не знайдено в .env файлі!")
 OWNER_ID = int(os.getenv("OWNER_ID", "0"))
 OWNER_PRIVATE_ID = int(os.getenv("OWNER_PRIVATE_ID", str(OWNER_ID)))  # fallback на OWNER_ID
+
+def parse_chat_ids(text: str) -> set[int]:
+    return {int(x.strip()) for x in text.split(",") if x.strip()}
+
 ALLOWED_CHAT_IDS_STR = os.getenv("ALLOWED_CHAT_IDS", "")
 ALLOWED_CHAT_IDS = set()
 if ALLOWED_CHAT_IDS_STR:
     try:
-        ALLOWED_CHAT_IDS = {int(x.strip()) for x in ALLOWED_CHAT_IDS_STR.split(",") if x.strip()}
-    except ValueError as e:
-        print(f"Помилка парсингу ALLOWED_CHAT_IDS: {e}")
+        ALLOWED_CHAT_IDS = parse_chat_ids(ALLOWED_CHAT_IDS_STR)
+    except ValueError as e:
+        print(f"Помилка парсингу ALLOWED_CHAT_IDS: {e}")
+
+# Антифлуд-ліміти (спільні для всіх чатів; окремі чати — CHAT_LIMITS нижче)
+def read_limits(env) -> dict[str, int]:
+    return {
+        "DAILY_MESSAGE_LIMIT": int(env.get("DAILY_MESSAGE_LIMIT", 200)),
+        "HOURLY_MESSAGE_LIMIT": int(env.get("HOURLY_MESSAGE_LIMIT", 100)),
+        "HOURLY_MUTE_MINUTES": int(env.get("HOURLY_MUTE_MINUTES", 15)),
+        "SHORT_TERM_MESSAGE_LIMIT": int(env.get("SHORT_TERM_MESSAGE_LIMIT", 10)),
+        "SHORT_TERM_WINDOW_MINUTES": int(env.get("SHORT_TERM_WINDOW_MINUTES", 5)),
+        "SHORT_TERM_MUTE_MINUTES": int(env.get("SHORT_TERM_MUTE_MINUTES", 3)),
+        "VOICE_MUTE_MINUTES": int(env.get("VOICE_MUTE_MINUTES", 30)),
+        "DAILY_MUTE_DAYS": int(env.get("DAILY_MUTE_DAYS", 7)),
+        # Детектор рейдів: пороги на весь чат (0 — перевірку вимкнено, за замовчуванням вимкнені всі:
+        # автоблокування чату вмикається явно) і гістерезис зняття
+        "RAID_MESSAGES_PER_SECOND": int(env.get("RAID_MESSAGES_PER_SECOND", 0)),
+        "RAID_NEW_SENDERS_PER_MINUTE": int(env.get("RAID_NEW_SENDERS_PER_MINUTE", 0)),
+        "RAID_JOINS_PER_MINUTE": int(env.get("RAID_JOINS_PER_MINUTE", 0)),
+        "RAID_RELEASE_PERCENT": int(env.get("RAID_RELEASE_PERCENT", 50)),
+        "RAID_CALM_MINUTES": int(env.get("RAID_CALM_MINUTES", 10)),
+    }
+
+DEFAULT_LIMITS = read_limits(os.environ)
+
+# Додаткові ковзні вікна: "вікно:ліміт:мут_хв" через кому, вікно з суфіксом s/m/h/d (напр. 30s:5:2,10m:30:10)
+def parse_duration(text: str) -> int:
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    text = text.strip().lower()
+    if text and text[-1] in units:
+        return int(text[:-1]) * units[text[-1]]
+    return int(text) * 60
+
+def parse_extra_rate_tiers(text: str) -> list[tuple[int, int, int]]:
+    tiers = []
+    for item in text.split(","):
+        if item.strip():
+            window, limit, mute_minutes = item.split(":")
+            tiers.append((parse_duration(window), int(limit), int(mute_minutes)))
+    return tiers
+
+EXTRA_RATE_TIERS_STR = os.getenv("EXTRA_RATE_TIERS", "")
+EXTRA_RATE_TIERS = []
+if EXTRA_RATE_TIERS_STR:
+    try:
+        EXTRA_RATE_TIERS = parse_extra_rate_tiers(EXTRA_RATE_TIERS_STR)
+    except ValueError as e:
+        print(f"Помилка парсингу EXTRA_RATE_TIERS: {e}")
+
+# Exempt опції
+EXEMPT_OWNER_ANTIFLOOD = os.getenv("EXEMPT_OWNER_ANTIFLOOD", "true").lower() == "true"
+EXEMPT_CREATOR_ANTIFLOOD = os.getenv("EXEMPT_CREATOR_ANTIFLOOD", "true").lower() == "true"
+EXEMPT_ADMIN_ANTIFLOOD = os.getenv("EXEMPT_ADMIN_ANTIFLOOD", "true").lower() == "true"
+
+# Write-behind: як часто (сек) скидати змінені дані на диск
+SAVE_INTERVAL_SECONDS = float(os.getenv("SAVE_INTERVAL_SECONDS", 5))
+
+# Окремі ліміти для чатів: "chat_id:КЛЮЧ=значення,КЛЮЧ=значення;chat_id:..."
+# (напр. -1001234567890:DAILY_MESSAGE_LIMIT=300,HOURLY_MESSAGE_LIMIT=50)
+CHAT_LIMIT_KEYS = ("DAILY_MESSAGE_LIMIT", "HOURLY_MESSAGE_LIMIT", "HOURLY_MUTE_MINUTES", "SHORT_TERM_MESSAGE_LIMIT",
+                   "SHORT_TERM_WINDOW_MINUTES", "SHORT_TERM_MUTE_MINUTES", "VOICE_MUTE_MINUTES", "DAILY_MUTE_DAYS",
+                   "RAID_MESSAGES_PER_SECOND", "RAID_NEW_SENDERS_PER_MINUTE", "RAID_JOINS_PER_MINUTE",
+                   "RAID_RELEASE_PERCENT", "RAID_CALM_MINUTES")
+def parse_chat_limits(text: str) -> dict[int, dict[str, int]]:
+    chat_limits = {}
+    for part in text.split(";"):
+        if not part.strip():
+            continue
+        chat, overrides = part.split(":", 1)
+        entry = chat_limits.setdefault(int(chat), {})
+        for item in overrides.split(","):
+            key, value = item.split("=")
+            key = key.strip().upper()
+            if key not in CHAT_LIMIT_KEYS:
+                raise ValueError(f"невідомий ключ {key}")
+            entry[key] = int(value)
+    return chat_limits
+
+CHAT_LIMITS_STR = os.getenv("CHAT_LIMITS", "")
+CHAT_LIMITS: dict[int, dict[str, int]] = {}
+if CHAT_LIMITS_STR:
+    try:
+        CHAT_LIMITS = parse_chat_limits(CHAT_LIMITS_STR)
+    except ValueError as e:
+        print(f"Помилка парсингу CHAT_LIMITS: {e}")
+
+# Скільки мутів показувати на одній сторінці /listmute
+LISTMUTE_PAGE_SIZE = int(os.getenv("LISTMUTE_PAGE_SIZE", 50))
+
+# /top: скільки відправників пам'ятає кожен кошик статистики (пам'ять на чат фіксована, не залежить
+# від кількості користувачів; більше — точніше для хвоста списку)
+TOP_SKETCH_SIZE = int(os.getenv("TOP_SKETCH_SIZE", 50))
+
+# Фонове прибирання неактивних користувачів
+SWEEP_INTERVAL_SECONDS = int(os.getenv("SWEEP_INTERVAL_SECONDS", 300))
+# Жорсткий ліміт користувачів з лічильниками (0 — без ліміту); найдавніше активні витісняються (LRU)
+MAX_TRACKED_USERS = int(os.getenv("MAX_TRACKED_USERS", 0))
+
+# Кеш статусів учасників (щоб не смикати get_chat_member на кожне повідомлення)
+MEMBER_CACHE_TTL_SECONDS = int(os.getenv("MEMBER_CACHE_TTL_SECONDS", 600))
+MEMBER_CACHE_MAX_ENTRIES = int(os.getenv("MEMBER_CACHE_MAX_ENTRIES", 10000))
+
+# Пакетне видалення: скільки мс максимум чекати, щоб зібрати видалення чату в один delete_messages
+DELETE_BATCH_DELAY_MS = int(os.getenv("DELETE_BATCH_DELAY_MS", 300))
+
+# Альбоми: частини одного media_group_id збираються, поки між ними не буде паузи ALBUM_BUFFER_MS,
+# і перевіряються як один пост (0 — кожне фото окремо, як раніше)
+ALBUM_BUFFER_MS = int(os.getenv("ALBUM_BUFFER_MS", 500))
+
+# Черга вихідних повідомлень (ліміти Telegram: ~30/с на бота, ~20/хв у групу, ~1/с в приват)
+OUTBOX_GLOBAL_PER_SECOND = float(os.getenv("OUTBOX_GLOBAL_PER_SECOND", 30))
+OUTBOX_GROUP_PER_MINUTE = float(os.getenv("OUTBOX_GROUP_PER_MINUTE", 20))
+OUTBOX_PRIVATE_PER_SECOND = float(os.getenv("OUTBOX_PRIVATE_PER_SECOND", 1))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", 4))
+OUTBOX_MAX_RETRIES = int(os.getenv("OUTBOX_MAX_RETRIES", 5))
+# Скільки повідомлень може чекати в черзі; нові понад це відкидаються (OUTBOX_STATS["dropped"])
+OUTBOX_MAX_QUEUE = int(os.getenv("OUTBOX_MAX_QUEUE", 10000))
+# Скільки мс збирати сповіщення про мути в чаті, щоб надіслати їх одним повідомленням
+MUTE_NOTICE_COALESCE_MS = int(os.getenv("MUTE_NOTICE_COALESCE_MS", 1000))
+
+# Скільки апдейтів обробляти одночасно (0 — послідовно, як раніше)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", 0))
+
+# Кілька процесів: один приймає апдейти і розподіляє їх за chat_id між WORKERS обробниками
+# (0 або 1 — усе в одному процесі, як раніше)
+WORKERS = int(os.getenv("WORKERS", 0))
+
+# Доставка апдейтів: polling (за замовчуванням) або webhook (Telegram сам надсилає апдейти POST-ом)
+DELIVERY_MODE = os.getenv("DELIVERY_MODE", "polling").lower()
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8443))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # повна публічна https-адреса разом зі шляхом
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+
+# Адреса Bot API (порожньо — https://api.telegram.org): власний telegram-bot-api сервер
+# або фейковий з fake_bot_api.py для навантажувальних тестів, напр. http://127.0.0.1:8081
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL", "").rstrip("/")
+
+# Метрики у форматі Prometheus на http://METRICS_LISTEN:METRICS_PORT/metrics (0 — вимкнено)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+
+# Як тримати мут: soft — бот видаляє кожне повідомлення замученого;
+# restrict — ще й restrict_chat_member з until_date, і Telegram сам не пропускає повідомлення
+MUTE_ENFORCEMENT = os.getenv("MUTE_ENFORCEMENT", "soft").lower()
+# Після відмови через права бота в чаті restrict не пробуємо стільки секунд (діє soft-мут)
+RESTRICT_RETRY_SECONDS = int(os.getenv("RESTRICT_RETRY_SECONDS", 600))
+
+# ─── Налаштування логування ───
+logger = logging.getLogger(__name__)
+LOG_FILENAME = "bot_moderation.log"
+# true — файл і ротацію опівночі обслуговує окремий потік, event loop лише форматує рядок у буфер.
+# Вимкнено за замовчуванням: на INFO записів мало, і прямий запис у файл не дорожчий (benchmark.py logging);
+# виграш є лише на DEBUG
+LOG_QUEUE = os.getenv("LOG_QUEUE", "false").lower() == "true"
+# Як часто фоновий потік дописує буфер у файл (пачкою, одним write)
+LOG_WRITE_INTERVAL = 0.2
+# Скільки рядків може чекати в буфері; понад це (диск завис, потік не встигає) записи відкидаються
+# з підрахунком — у лозі з'являється попередження, у метриках abcwarrior_log_dropped_total
+LOG_QUEUE_MAX_LINES = int(os.getenv("LOG_QUEUE_MAX_LINES", 100000))
+# text — як і раніше; json — один JSON-об'єкт на рядок
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+                 "level": record.levelname, "msg": record.getMessage()}
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class DeferredFileHandler(logging.Handler):
+    # У потоці event loop запис лише форматується і додається в буфер: без write/flush і без
+    # пробудження іншого потоку на кожен запис (саме це пробудження раніше сперечалося з loop за GIL).
+    # Фоновий потік раз на interval забирає весь буфер, дописує його одним write і сам робить ротацію
+    def __init__(self, file_handler: TimedRotatingFileHandler, interval: float, max_lines: int):
+        super().__init__()
+        self.file_handler = file_handler
+        self.interval = interval
+        self.max_lines = max_lines
+        self.lines: list[str] = []
+        self.dropped = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        # Handler.handle уже тримає self.lock
+        if len(self.lines) >= self.max_lines:
+            self.dropped += 1
+            return
+        try:
+            self.lines.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.write_pending()
+
+    def write_pending(self):
+        with self.lock:
+            batch, self.lines = self.lines, []
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            LOG_DROPPED.inc(amount=dropped)
+            note = logger.makeRecord(logger.name, logging.WARNING, __file__, 0,
+                                     "Буфер логу переповнений: відкинуто %s записів", (dropped,), None)
+            batch.append(self.format(note))
+        if not batch:
+            return
+        target = self.file_handler
+        try:
+            # Пачка відформатована до цього моменту, тож спершу дописується в поточний файл,
+            # а ротація опівночі — вже після неї
+            target.stream.write("\n".join(batch) + "\n")
+            target.stream.flush()
+            if target.shouldRollover(None):
+                target.doRollover()
+        except Exception as e:
+            print(f"Не вдалося записати {len(batch)} рядків логу: {e}", file=sys.stderr)
+
+    def close(self):
+        # Дописує все, що лишилося в буфері, і закриває файл
+        if not self._stopped.is_set():
+            self._stopped.set()
+            self._thread.join()
+            self.write_pending()
+            self.file_handler.close()
+        super().close()
+
+log_writer: DeferredFileHandler | None = None
+
+def configure_logging(use_queue: bool, log_format: str, filename: str = LOG_FILENAME):
+    global log_writer
+    log_writer = None
+    for old in list(logger.handlers):
+        logger.removeHandler(old)
+        old.close()
+    file_handler = TimedRotatingFileHandler(filename=filename, when='midnight', interval=1, backupCount=30,
+                                            encoding='utf-8')
+    if log_format == "json":
+        formatter = JsonLinesFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    if use_queue:
+        log_writer = DeferredFileHandler(file_handler, LOG_WRITE_INTERVAL, LOG_QUEUE_MAX_LINES)
+        log_writer.setFormatter(formatter)
+        logger.addHandler(log_writer)
+    else:
+        file_handler.setFormatter(formatter)
+        logger.addHandler(file_handler)
+
+def stop_logging():
+    # Дописує все, що лишилося в буфері; реєструється в atexit першим, тож виконується останнім
+    if log_writer is not None:
+        log_writer.close()
+
+configure_logging(LOG_QUEUE, LOG_FORMAT)
+atexit.register(stop_logging)
+
+# Динамічний рівень логування з .env
+LOGGER_LEVEL_STR = os.getenv("LOGGER_LEVEL", "INFO").upper()
+valid_levels = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL
+}
+logger.setLevel(valid_levels.get(LOGGER_LEVEL_STR, logging.INFO))
+logger.info(f"Встановлено рівень логування: {LOGGER_LEVEL_STR}")
+
+# Фільтр для дозволених груп. ALLOWED_CHATS — один змінний фільтр на всі хендлери:
+# /reloadconfig міняє в ньому список чатів, хендлери перебудовувати не треба
+ALLOWED_CHATS = filters.Chat(chat_id=ALLOWED_CHAT_IDS)
+ALLOWED_GROUP_FILTER = ALLOWED_CHATS & filters.ChatType.GROUPS
+# Команди власника: у дозволених чатах або в приваті, але не в чужих групах, куди додали бота
+OWNER_COMMAND_FILTER = filters.User(user_id=OWNER_ID) & (ALLOWED_CHATS | filters.ChatType.PRIVATE)
+
+# ─── Метрики ───
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+METRICS: list["Metric"] = []
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Metric:
+    # Метрика у текстовому форматі Prometheus; значення зберігаються за кортежем значень міток.
+    # Lock — бо частина значень пишеться з потоку write-behind.
+    def __init__(self, name: str, help_text: str, kind: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.labels = labels
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def _label_str(self, values: tuple, extra: str = "") -> str:
+        pairs = [f'{k}="{escape_label(v)}"' for k, v in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+class Counter(Metric):
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help_text, "counter", labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{self._label_str(k)} {v}" for k, v in sorted(self._values.items())]
+
+class Histogram(Metric):
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, "histogram", labels)
+        self.buckets = buckets
+        # На кожен набір міток: лічильники по кошиках (+Inf останній), сума, кількість
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            entry[bisect_left(self.buckets, value)] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def _samples(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, entry in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), entry):
+                    cumulative += count
+                    le = 'le="' + str(bound) + '"'
+                    lines.append(f"{self.name}_bucket{self._label_str(key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{self._label_str(key)} {entry[-2]}")
+                lines.append(f"{self.name}_count{self._label_str(key)} {entry[-1]}")
+        return lines
+
+class Gauge(Metric):
+    # Значення рахується в момент запиту /metrics: collect() → {кортеж міток: значення}
+    def __init__(self, name: str, help_text: str, collect, labels: tuple[str, ...] = ()):
+        super().__init__(name, help_text, "gauge", labels)
+        self.collect = collect
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{self._label_str(k)} {v}" for k, v in sorted(self.collect().items())]
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            logger.warning(f"Метрика {metric.name} не відрендерилась: {e}")
+    return "\n".join(lines) + "\n"
+
+HANDLER_SECONDS = Histogram("abcwarrior_handler_seconds", "Тривалість обробки апдейта хендлером", ("handler",))
+BOT_API_SECONDS = Histogram("abcwarrior_bot_api_seconds", "Тривалість виклику Bot API", ("method",))
+BOT_API_ERRORS = Counter("abcwarrior_bot_api_errors_total", "Виклики Bot API з помилкою (не 200 або виняток)", ("method",))
+SAVE_JSON_SECONDS = Histogram("abcwarrior_save_json_seconds", "Тривалість save_json")
+SAVE_JSON_BYTES = Histogram("abcwarrior_save_json_bytes", "Розмір файлу, записаного save_json", buckets=BYTES_BUCKETS)
+STATE_FLUSH_SECONDS = Histogram("abcwarrior_state_flush_seconds", "Тривалість запису пакета змін у сховище", ("backend",))
+SHARD_LOAD_SECONDS = Histogram("abcwarrior_shard_load_seconds", "Тривалість завантаження стану чату при старті", ("backend",))
+DELETES = Counter("abcwarrior_deletes_total", "Повідомлення, поставлені на видалення", ("reason",))
+MUTES = Counter("abcwarrior_mutes_total", "Накладені мути", ("reason",))
+RESTRICTIONS = Counter("abcwarrior_restrictions_total", "Серверні мути: applied, lifted, fallback (лишився soft)", ("result",))
+RAID_LOCKDOWNS = Counter("abcwarrior_raid_lockdowns_total", "Автоблокування чату детектором рейдів: lock, release", ("event",))
+LOG_DROPPED = Counter("abcwarrior_log_dropped_total", "Записи логу, відкинуті через переповнений буфер LOG_QUEUE")
+SWALLOWED_ERRORS = Counter("abcwarrior_swallowed_errors_total", "Помилки, які бот проковтнув і продовжив роботу", ("where",))
+
+# ─── Антифлуд-рушій ───
+class RateTier:
+    # Один рівень ліміту: більше limit повідомлень за window секунд → мут на mute_minutes
+    __slots__ = ("name", "window", "limit", "mute_minutes", "reason")
+
+    def __init__(self, name: str, window: int, limit: int, mute_minutes: int, reason: str):
+        self.name = name
+        self.window = window
+        self.limit = limit
+        self.mute_minutes = mute_minutes
+        self.reason = reason
+
+class UserRate:
+    # Компактний стан користувача: кільцевий буфер epoch-секунд (array 'I')
+    # на max(limit)+1 елементів + денний лічильник. У кільці — повідомлення, що пройшли всі
+    # ковзні вікна; ті, на яких спрацював рівень, лежать у partial як (ts, depth) і рахуються
+    # лише першими depth рівнями (зазвичай None: таке буває раз на мут)
+    __slots__ = ("stamps", "head", "day", "day_count", "partial")
+
+    def __init__(self):
+        self.stamps = array("I")
+        self.head = 0
+        self.day = 0
+        self.day_count = 0
+        self.partial = None
+
+    def record(self, ts: int, capacity: int):
+        if len(self.stamps) < capacity:
+            self.stamps.append(ts)
+        else:
+            self.stamps[self.head] = ts
+            self.head = (self.head + 1) % capacity
+
+    def nth_latest(self, k: int) -> int:
+        # k-та з кінця позначка часу (1 — остання) або -1, якщо стільки немає
+        n = len(self.stamps)
+        if k > n:
+            return -1
+        return self.stamps[(self.head - k) % n]
+
+    def count_since(self, cutoff: int) -> int:
+        count = 0
+        n = len(self.stamps)
+        for k in range(1, n + 1):
+            if self.stamps[(self.head - k) % n] < cutoff:
+                break
+            count += 1
+        return count
+
+    def latest(self, cutoff: int) -> list[int]:
+        # Позначки часу не старші за cutoff, від старих до нових
+        n = len(self.stamps)
+        return [self.stamps[(self.head + i) % n] for i in range(n) if self.stamps[(self.head + i) % n] >= cutoff]
+
+    def partial_count(self, level: int, cutoff: int) -> int:
+        if not self.partial:
+            return 0
+        return sum(1 for ts, depth in self.partial if depth > level and ts >= cutoff)
+
+    def clear_window(self):
+        self.stamps = array("I")
+        self.head = 0
+        self.partial = None
+
+class RateSnapshot:
+    # Стан rates з бінарного знімка, ще не розкладений по UserRate: user_id відсортовані,
+    # позначки часу всіх користувачів — один масив, stamps[offsets[i]:offsets[i + 1]] належать uids[i].
+    # Користувач декодується лише тоді, коли знову з'являється в чаті (take), і тільки один раз.
+    __slots__ = ("uids", "days", "day_counts", "offsets", "stamps", "taken")
+
+    def __init__(self, uids: array, days: array, day_counts: array, offsets: array, stamps: array):
+        self.uids = uids
+        self.days = days
+        self.day_counts = day_counts
+        self.offsets = offsets
+        self.stamps = stamps
+        self.taken = bytearray(len(uids))
+
+    def __len__(self):
+        return len(self.uids)
+
+    def find(self, user_id: int) -> int:
+        i = bisect_left(self.uids, user_id)
+        if i < len(self.uids) and self.uids[i] == user_id:
+            return i
+        return -1
+
+    def entry(self, i: int) -> tuple[int, array, int, int]:
+        return self.uids[i], self.stamps[self.offsets[i]:self.offsets[i + 1]], self.days[i], self.day_counts[i]
+
+    def take(self, user_id: int) -> tuple[array, int, int] | None:
+        # Повертає (stamps, day, day_count) і позначає запис використаним: далі джерело правди — RateLimiter
+        i = self.find(user_id)
+        if i < 0 or self.taken[i]:
+            return None
+        self.taken[i] = 1
+        _, stamps, day, day_count = self.entry(i)
+        return stamps, day, day_count
+
+class RateLimiter:
+    # Усі рівні (short, hourly, додаткові з EXTRA_RATE_TIERS і денний) перевіряються
+    # за один прохід по одній структурі на користувача: для ковзного вікна достатньо
+    # подивитися на (limit+1)-шу з кінця позначку часу в кільцевому буфері.
+    def __init__(self, tiers: list[RateTier], daily: RateTier, max_users: int = 0):
+        self.tiers = sorted(tiers, key=lambda t: t.window)
+        self.daily = daily
+        self.capacity = max(t.limit for t in self.tiers) + 1
+        self.max_window = max(t.window for t in self.tiers)
+        # Порядок — від найдавніше активного до останнього (LRU)
+        self.users: OrderedDict[int, UserRate] = OrderedDict()
+        self.max_users = max_users
+        self.on_evict = None
+        # Ще не декодовані користувачі з бінарного знімка (див. RateSnapshot)
+        self.cold: RateSnapshot | None = None
+        self.hydrated = 0
+
+    def _hydrate(self, user_id: int, now_ts: int, day: int) -> UserRate | None:
+        # Прострочені позначки та вчорашній денний лічильник відкидаються ще до декодування
+        entry = self.cold.take(user_id)
+        if entry is None:
+            return None
+        stamps, stored_day, day_count = entry
+        cutoff = now_ts - self.max_window
+        if stamps and stamps[-1] >= cutoff:
+            stamps = [t for t in stamps if t >= cutoff]
+        else:
+            stamps = []
+        if stored_day != day:
+            stored_day = day_count = 0
+        if not stamps and not day_count:
+            return None
+        self.hydrated += 1
+        self.restore(user_id, stamps, stored_day, day_count)
+        return self.users[user_id]
+
+    def _get(self, user_id: int, now_ts: int, day: int) -> UserRate | None:
+        rate = self.users.get(user_id)
+        if rate is None and self.cold is not None:
+            rate = self._hydrate(user_id, now_ts, day)
+        return rate
+
+    def hit(self, user_id: int, ts: int, day: int) -> RateTier | None:
+        rate = self._get(user_id, ts, day)
+        if rate is None:
+            rate = self.users[user_id] = UserRate()
+        else:
+            self.users.move_to_end(user_id)
+        if self.max_users and len(self.users) > self.max_users:
+            self.evict_lru(self.max_users)
+        if rate.partial:
+            cutoff = ts - self.max_window
+            rate.partial = [entry for entry in rate.partial if entry[0] >= cutoff] or None
+        for level, tier in enumerate(self.tiers):
+            cutoff = ts - tier.window
+            # Поточне повідомлення — (limit+1)-ше, якщо ще limit попередніх у межах вікна
+            need = tier.limit - rate.partial_count(level, cutoff)
+            if need <= 0 or rate.nth_latest(need) >= cutoff:
+                # Як і до єдиного кільця: повідомлення, на якому спрацював рівень, рахується в ньому
+                # і в коротших вікнах, але не в довших
+                if rate.partial is None:
+                    rate.partial = []
+                rate.partial.append((ts, level + 1))
+                return tier
+        rate.record(ts, self.capacity)
+        # Денний ліміт рахує тільки повідомлення, що пройшли ковзні вікна
+        if rate.day != day:
+            rate.day = day
+            rate.day_count = 0
+        rate.day_count += 1
+        if rate.day_count > self.daily.limit:
+            return self.daily
+        return None
+
+    def counts(self, user_id: int, now_ts: int, day: int) -> dict[str, int]:
+        rate = self._get(user_id, now_ts, day)
+        result = {tier.name: 0 for tier in self.tiers}
+        result[self.daily.name] = 0
+        if rate is None:
+            return result
+        for level, tier in enumerate(self.tiers):
+            cutoff = now_ts - tier.window
+            result[tier.name] = rate.count_since(cutoff) + rate.partial_count(level, cutoff)
+        result[self.daily.name] = rate.day_count if rate.day == day else 0
+        return result
+
+    def reconfigure(self, tiers: list[RateTier], daily: RateTier):
+        # Нові ліміти без втрати стану: позначки часу переносяться в буфери нової місткості
+        old_windows = [t.window for t in self.tiers]
+        self.tiers = sorted(tiers, key=lambda t: t.window)
+        self.daily = daily
+        self.max_window = max(t.window for t in self.tiers)
+        capacity = max(t.limit for t in self.tiers) + 1
+        # Повідомлення з partial рахувалось у вікнах, не довших за вікно рівня, на якому спрацювало;
+        # depth перераховується на новий набір рівнів за тим самим правилом
+        new_windows = [t.window for t in self.tiers]
+        for rate in self.users.values():
+            if rate.partial:
+                remapped = [(ts, bisect_right(new_windows, old_windows[depth - 1])) for ts, depth in rate.partial]
+                rate.partial = [entry for entry in remapped if entry[1]] or None
+        if capacity == self.capacity:
+            return
+        self.capacity = capacity
+        for rate in self.users.values():
+            stamps = rate.latest(0)[-capacity:]
+            partial = rate.partial
+            rate.clear_window()
+            rate.partial = partial
+            for ts in stamps:
+                rate.record(ts, capacity)
+
+    def reset_windows(self, user_id: int) -> bool:
+        rate = self.users.get(user_id)
+        if rate is None and self.cold is not None:
+            entry = self.cold.take(user_id)
+            if entry is not None:
+                self.restore(user_id, [], entry[1], entry[2])
+                return True
+        if rate is None:
+            return False
+        rate.clear_window()
+        return True
+
+    def forget(self, user_id: int) -> bool:
+        if self.cold is not None and self.cold.take(user_id) is not None:
+            self.users.pop(user_id, None)
+            return True
+        return self.users.pop(user_id, None) is not None
+
+    def evict_lru(self, max_users: int) -> int:
+        evicted = 0
+        while len(self.users) > max_users:
+            user_id, _ = self.users.popitem(last=False)
+            evicted += 1
+            if self.on_evict:
+                self.on_evict(user_id)
+        return evicted
+
+    def sweep(self, now_ts: int, day: int) -> tuple[int, int]:
+        # Прибирає прострочені вікна; користувач без свіжих повідомлень і без
+        # сьогоднішнього денного лічильника видаляється повністю
+        cutoff = now_ts - self.max_window
+        cleared = forgotten = 0
+        for user_id in list(self.users):
+            rate = self.users[user_id]
+            if rate.nth_latest(1) >= cutoff or (rate.partial and rate.partial[-1][0] >= cutoff):
+                continue
+            if rate.day == day and rate.day_count:
+                if len(rate.stamps):
+                    rate.clear_window()
+                    cleared += 1
+                continue
+            del self.users[user_id]
+            forgotten += 1
+            if self.on_evict:
+                self.on_evict(user_id)
+        return cleared, forgotten
+
+    def restore(self, user_id: int, stamps: list[int], day: int, day_count: int):
+        rate = UserRate()
+        for ts in sorted(stamps)[-self.capacity:]:
+            rate.record(ts, self.capacity)
+        rate.day = day
+        rate.day_count = day_count
+        self.users[user_id] = rate
+
+    def export(self, user_id: int, now_ts: int):
+        # partial не зберігається: після перезапуску користувач і так у муті, а самі записи
+        # живуть не довше за найдовше вікно
+        rate = self.users.get(user_id)
+        if rate is None:
+            return None
+        return {"t": rate.latest(now_ts - self.max_window),
+                "d": date.fromordinal(rate.day).isoformat() if rate.day else None,
+                "c": rate.day_count}
+
+def format_window(seconds: int) -> str:
+    if seconds % 86400 == 0:
+        return f"{seconds // 86400} дн"
+    if seconds % 3600 == 0:
+        return f"{seconds // 3600} год"
+    if seconds % 60 == 0:
+        return f"{seconds // 60} хв"
+    return f"{seconds} с"
+
+def build_rate_tiers(limits: dict[str, int]) -> tuple[list[RateTier], RateTier]:
+    tiers = [
+        RateTier("short", limits["SHORT_TERM_WINDOW_MINUTES"] * 60, limits["SHORT_TERM_MESSAGE_LIMIT"],
+                 limits["SHORT_TERM_MUTE_MINUTES"],
+                 f"флуд >{limits['SHORT_TERM_MESSAGE_LIMIT']} за {limits['SHORT_TERM_WINDOW_MINUTES']} хв"),
+        RateTier("hourly", 3600, limits["HOURLY_MESSAGE_LIMIT"], limits["HOURLY_MUTE_MINUTES"],
+                 f"флуд >{limits['HOURLY_MESSAGE_LIMIT']} за годину"),
+    ]
+    for window, limit, mute_minutes in EXTRA_RATE_TIERS:
+        tiers.append(RateTier(f"extra_{window}", window, limit, mute_minutes,
+                              f"флуд >{limit} за {format_window(window)}"))
+    daily = RateTier("daily", 86400, limits["DAILY_MESSAGE_LIMIT"], limits["DAILY_MUTE_DAYS"] * 1440,
+                     f"флуд >{limits['DAILY_MESSAGE_LIMIT']} за день")
+    return tiers, daily
+
+def build_rate_limiter(limits: dict[str, int]) -> RateLimiter:
+    tiers, daily = build_rate_tiers(limits)
+    return RateLimiter(tiers, daily, MAX_TRACKED_USERS)
+
+# ─── Сховище даних ───
+DATA_DIR = Path("data")
+DATA_DIR.mkdir(exist_ok=True)
+SQLITE_FILENAME = "state.sqlite3"
+SNAPSHOT_FILENAME = "snapshot.json"
+JOURNAL_FILENAME = "journal.jsonl"
+JOURNAL_COMPACT_BYTES = int(os.getenv("JOURNAL_COMPACT_BYTES", 4 * 1024 * 1024))
+JOURNAL_FSYNC = os.getenv("JOURNAL_FSYNC", "true").lower() == "true"
+BINARY_SNAPSHOT_FILENAME = "state.bin"
+BINARY_JOURNAL_FILENAME = "state.journal.jsonl"
+# Скільки зберігати позначки часу в знімку: найдовше вікно, але не менше доби
+RATE_RETENTION_SECONDS = max([86400] + [window for window, _, _ in EXTRA_RATE_TIERS])
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower()
+
+def save_json(path: Path, data):
+    # data — dict або вже серіалізований JSON-текст (з write-behind)
+    logger.debug("Збереження JSON у файл %s", path)
+    lock_path = path.with_suffix(path.suffix + ".lock")
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    started = perf_counter()
+    try:
+        with FileLock(lock_path, timeout=3):
+            with open(path, 'w', encoding='utf-8') as f:
+                written = f.write(payload)
+        SAVE_JSON_SECONDS.observe(perf_counter() - started)
+        SAVE_JSON_BYTES.observe(written)
+    except Timeout:
+        logger.warning(f"Timeout lock для {path}")
+    except Exception as e:
+        logger.error(f"Помилка збереження {path}: {e}")
+
+def load_json(path: Path, default={}):
+    logger.debug("Читання JSON з файлу %s", path)
+    if not path.exists():
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Помилка читання {path}: {e}")
+        return default
+
+# Набори даних: daily, hourly, short, mutes. Значення — у тому ж JSON-форматі, що й у файлах
+# (ISO-рядки дат), тож код завантаження спільний для всіх бекендів.
+class StorageBackend(ABC):
+    @abstractmethod
+    def load(self, name: str) -> dict:
+        # {str(user_id): значення}
+        ...
+
+    @abstractmethod
+    def write(self, changes: dict[str, dict[int, object]]):
+        # {набір: {user_id: значення або None (видалити)}}; викликається з фонового потоку
+        ...
+
+    def cold_rates(self) -> RateSnapshot | None:
+        # Недекодований знімок rates для лінивого відновлення (лише бінарний бекенд)
+        return None
+
+    def close(self):
+        pass
+
+class JsonBackend(StorageBackend):
+    # Формат data/*.json без змін. Кожен запис кешується як готовий JSON-фрагмент,
+    # тож при збереженні серіалізуються тільки змінені користувачі.
+    def __init__(self, paths: dict[str, Path]):
+        self.paths = paths
+        self._fragments: dict[str, dict[str, str]] = {name: {} for name in paths}
+
+    def load(self, name: str) -> dict:
+        raw = load_json(self.paths[name], default={})
+        if not isinstance(raw, dict):
+            raw = {}
+        self._fragments[name] = {str(k): json.dumps(v, ensure_ascii=False) for k, v in raw.items()}
+        return raw
+
+    def write(self, changes):
+        for name, entries in changes.items():
+            fragments = self._fragments[name]
+            for user_id, value in entries.items():
+                if value is None:
+                    fragments.pop(str(user_id), None)
+                else:
+                    fragments[str(user_id)] = json.dumps(value, ensure_ascii=False)
+            text = "{" + ",".join(f'"{k}":{v}' for k, v in fragments.items()) + "}"
+            save_json(self.paths[name], text)
+
+class SqliteBackend(StorageBackend):
+    # SQLite у режимі WAL: per-user upsert, усі зміни одного flush — в одній транзакції,
+    # мути мають індекс за часом завершення.
+    def __init__(self, path: Path, names):
+        self.path = path
+        self.names = tuple(names)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for name in self.names:
+            if name == "mutes":
+                self._conn.execute("CREATE TABLE IF NOT EXISTS mutes (user_id INTEGER PRIMARY KEY, until REAL NOT NULL)")
+                self._conn.execute("CREATE INDEX IF NOT EXISTS mutes_until ON mutes (until)")
+            else:
+                self._conn.execute(f"CREATE TABLE IF NOT EXISTS {name} (user_id INTEGER PRIMARY KEY, value TEXT NOT NULL)")
+
+    def load(self, name: str) -> dict:
+        if name == "mutes":
+            now = datetime.now(timezone.utc).timestamp()
+            self._conn.execute("DELETE FROM mutes WHERE until <= ?", (now,))
+            rows = self._conn.execute("SELECT user_id, until FROM mutes")
+            return {str(uid): datetime.fromtimestamp(until, timezone.utc).isoformat() for uid, until in rows}
+        rows = self._conn.execute(f"SELECT user_id, value FROM {name}")
+        return {str(uid): json.loads(value) for uid, value in rows}
+
+    def is_empty(self) -> bool:
+        return all(self._conn.execute(f"SELECT 1 FROM {name} LIMIT 1").fetchone() is None for name in self.names)
+
+    def write(self, changes):
+        cur = self._conn.cursor()
+        cur.execute("BEGIN")
+        try:
+            for name, entries in changes.items():
+                deleted = [(uid,) for uid, value in entries.items() if value is None]
+                if name == "mutes":
+                    upserts = [(uid, datetime.fromisoformat(v).timestamp()) for uid, v in entries.items() if v is not None]
+                    cur.executemany("INSERT INTO mutes (user_id, until) VALUES (?, ?) "
+                                    "ON CONFLICT(user_id) DO UPDATE SET until = excluded.until", upserts)
+                else:
+                    upserts = [(uid, json.dumps(v, ensure_ascii=False)) for uid, v in entries.items() if v is not None]
+                    cur.executemany(f"INSERT INTO {name} (user_id, value) VALUES (?, ?) "
+                                    f"ON CONFLICT(user_id) DO UPDATE SET value = excluded.value", upserts)
+                if deleted:
+                    cur.executemany(f"DELETE FROM {name} WHERE user_id = ?", deleted)
+            cur.execute("COMMIT")
+        except Exception as e:
+            cur.execute("ROLLBACK")
+            logger.error(f"Помилка запису в SQLite {self.path}: {e}")
+
+    def close(self):
+        self._conn.close()
+
+class JournalBackend(StorageBackend):
+    # Журнал змін (append-only JSONL) + періодичний знімок стану.
+    # Один flush = один запис журналу з усіма змінами і один fsync (group commit),
+    # тож стан daily/hourly/short/mutes завжди узгоджений між собою.
+    # При старті: знімок, потім хвіст журналу (записи з seq більшим, ніж у знімку).
+    def __init__(self, snapshot_path: Path, journal_path: Path, names, compact_bytes: int, fsync: bool = True):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.names = tuple(names)
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync
+        self._state: dict[str, dict[str, object]] = {name: {} for name in self.names}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._compacting = False
+        self._recover()
+        self._fh = open(self.journal_path, "ab")
+
+    def _recover(self):
+        if not self._read_snapshot() and not self.journal_path.exists():
+            # Перший запуск з журналом: початковий стан беремо з попереднього сховища
+            legacy = self._initial_source()
+            for name in self.names:
+                self._state[name] = legacy.load(name)
+            legacy.close()
+            self._write_snapshot(self._state, self._seq)
+            logger.info(f"Журнал: початковий стан імпортовано з {type(legacy).__name__}")
+        if not self.journal_path.exists():
+            return
+        replayed = 0
+        good_offset = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Обірваний хвіст після аварії — відкидаємо
+                    logger.warning(f"Журнал: пошкоджений запис після {good_offset} байт, хвіст відкинуто")
+                    break
+                good_offset += len(line)
+                if record["seq"] <= self._seq:
+                    continue
+                self._apply(record["ops"])
+                self._seq = record["seq"]
+                replayed += 1
+        if good_offset != self.journal_path.stat().st_size:
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good_offset)
+        logger.info(f"Журнал: відтворено {replayed} записів, seq={self._seq}")
+
+    def _read_snapshot(self) -> bool:
+        snapshot = load_json(self.snapshot_path, default=None)
+        if not isinstance(snapshot, dict):
+            return False
+        self._seq = int(snapshot.get("seq", 0))
+        for name, entries in snapshot.get("data", {}).items():
+            if name in self._state:
+                self._state[name] = entries
+        return True
+
+    def _initial_source(self) -> StorageBackend:
+        return JsonBackend(json_paths(self.snapshot_path.parent))
+
+    def _apply(self, ops):
+        for name, entries in ops.items():
+            target = self._state.setdefault(name, {})
+            for user_id, value in entries.items():
+                if value is None:
+                    target.pop(user_id, None)
+                else:
+                    target[user_id] = value
+
+    def load(self, name: str) -> dict:
+        return dict(self._state.get(name, {}))
+
+    def write(self, changes):
+        ops = {name: {str(uid): value for uid, value in entries.items()} for name, entries in changes.items()}
+        with self._lock:
+            self._seq += 1
+            record = json.dumps({"seq": self._seq, "ops": ops}, ensure_ascii=False, separators=(",", ":"))
+            self._fh.write(record.encode("utf-8") + b"\n")
+            self._fh.flush()
+            if self.fsync:
+                os.fsync(self._fh.fileno())
+            self._apply(ops)
+            size = self._fh.tell()
+            start_compaction = size >= self.compact_bytes and not self._compacting
+            if start_compaction:
+                self._compacting = True
+        if start_compaction:
+            threading.Thread(target=self.compact, name="journal-compaction", daemon=True).start()
+
+    def compact(self):
+        # Знімок пишеться поза блокуванням; журнал у цей час продовжує приймати записи
+        try:
+            with self._lock:
+                data = {name: dict(entries) for name, entries in self._state.items()}
+                seq = self._seq
+                offset = self._fh.tell()
+            self._write_snapshot(data, seq)
+            with self._lock:
+                # Переносимо в новий журнал тільки записи, що з'явилися після знімка
+                self._fh.flush()
+                with open(self.journal_path, "rb") as f:
+                    f.seek(offset)
+                    tail = f.read()
+                tmp_journal = self.journal_path.with_suffix(".tmp")
+                with open(tmp_journal, "wb") as f:
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._fh.close()
+                os.replace(tmp_journal, self.journal_path)
+                self._fh = open(self.journal_path, "ab")
+            logger.info(f"Журнал: компакція до seq={seq}, залишено {len(tail)} байт хвоста")
+        except Exception as e:
+            logger.error(f"Журнал: помилка компакції: {e}")
+        finally:
+            self._compacting = False
+
+    def _write_snapshot(self, data, seq: int):
+        tmp = self.snapshot_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"seq": seq, "data": data}, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
+
+# Бінарний знімок (версія 1), little-endian:
+#   заголовок: magic, версія, резерв, seq, час створення, довжина payload, CRC32 payload
+#   payload: кількості (користувачі, позначки часу, мути), потім масиви
+#     uids q[n] (відсортовані), days I[n], day_counts I[n], offsets I[n+1], stamps I[m],
+#     mute_uids q[k], mute_until q[k], і в кінці JSON з рештою наборів (meta, старі daily/hourly/short)
+BINARY_MAGIC = b"ABCW"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sHHQqII")
+BINARY_COUNTS = struct.Struct("<III")
+
+def pack_array(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def unpack_array(typecode: str, blob: memoryview, offset: int, count: int) -> tuple[array, int]:
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    if end > len(blob):
+        raise ValueError("обрізаний масив")
+    values.frombytes(blob[offset:end])
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values, end
+
+def encode_binary_snapshot(seq: int, rates: list[tuple[int, list[int], int, int]],
+                           mutes: dict[int, int], extra: dict) -> bytes:
+    # rates — відсортовані за user_id (user_id, stamps, day, day_count); mutes — {user_id: until epoch}
+    uids, days, day_counts = array("q"), array("I"), array("I")
+    offsets, stamps = array("I", [0]), array("I")
+    for user_id, user_stamps, day, day_count in rates:
+        uids.append(user_id)
+        days.append(day)
+        day_counts.append(day_count)
+        stamps.extend(user_stamps)
+        offsets.append(len(stamps))
+    mute_uids = array("q", sorted(mutes))
+    mute_until = array("q", (mutes[user_id] for user_id in mute_uids))
+    payload = b"".join((BINARY_COUNTS.pack(len(uids), len(stamps), len(mute_uids)),
+                        pack_array(uids), pack_array(days), pack_array(day_counts), pack_array(offsets),
+                        pack_array(stamps), pack_array(mute_uids), pack_array(mute_until),
+                        json.dumps(extra, ensure_ascii=False, separators=(",", ":")).encode("utf-8")))
+    header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, seq, int(datetime.now(timezone.utc).timestamp()),
+                                len(payload), zlib.crc32(payload))
+    return header + payload
+
+def decode_binary_snapshot(blob: bytes, now_ts: int) -> tuple[int, RateSnapshot, dict[int, int], dict]:
+    # Декодуються лише масиви цілком (без циклу по користувачах); прострочені мути відкидаються
+    if len(blob) < BINARY_HEADER.size:
+        raise ValueError("файл коротший за заголовок")
+    magic, version, _, seq, _, length, crc = BINARY_HEADER.unpack_from(blob)
+    if magic != BINARY_MAGIC:
+        raise ValueError("невідомий формат")
+    if version != BINARY_VERSION:
+        raise ValueError(f"непідтримувана версія {version}")
+    payload = memoryview(blob)[BINARY_HEADER.size:]
+    if len(payload) != length or zlib.crc32(payload) != crc:
+        raise ValueError("контрольна сума не збігається")
+    n, m, k = BINARY_COUNTS.unpack_from(payload)
+    offset = BINARY_COUNTS.size
+    uids, offset = unpack_array("q", payload, offset, n)
+    days, offset = unpack_array("I", payload, offset, n)
+    day_counts, offset = unpack_array("I", payload, offset, n)
+    offsets, offset = unpack_array("I", payload, offset, n + 1)
+    stamps, offset = unpack_array("I", payload, offset, m)
+    mute_uids, offset = unpack_array("q", payload, offset, k)
+    mute_until, offset = unpack_array("q", payload, offset, k)
+    extra = json.loads(bytes(payload[offset:]).decode("utf-8")) if offset < len(payload) else {}
+    mutes = {user_id: until for user_id, until in zip(mute_uids, mute_until) if until > now_ts}
+    return seq, RateSnapshot(uids, days, day_counts, offsets, stamps), mutes, extra
+
+class BinaryBackend(JournalBackend):
+    # Журнал змін той самий, що в JournalBackend, але знімок — бінарний (state.bin).
+    # rates зі знімка при старті не декодуються: шард отримує RateSnapshot (cold_rates),
+    # а в пам'яті бекенду лежать тільки користувачі, змінені після останнього знімка
+    # (None — видалений). Прострочене відкидається при читанні і при компакції.
+    def __init__(self, snapshot_path: Path, journal_path: Path, names, compact_bytes: int, fsync: bool = True):
+        self._rates = RateSnapshot(array("q"), array("I"), array("I"), array("I", [0]), array("I"))
+        super().__init__(snapshot_path, journal_path, names, compact_bytes, fsync)
+
+    def _read_snapshot(self) -> bool:
+        if not self.snapshot_path.exists():
+            return False
+        now_ts = int(datetime.now(timezone.utc).timestamp())
+        try:
+            seq, rates, mutes, extra = decode_binary_snapshot(self.snapshot_path.read_bytes(), now_ts)
+        except (OSError, ValueError) as e:
+            logger.error(f"Бінарний знімок {self.snapshot_path} не прочитано: {e}")
+            return False
+        self._seq = seq
+        self._rates = rates
+        self._state["mutes"] = {str(user_id): datetime.fromtimestamp(until, timezone.utc).isoformat()
+                                for user_id, until in mutes.items()}
+        for name, entries in extra.items():
+            if name in self._state:
+                self._state[name] = entries
+        return True
+
+    def _initial_source(self) -> StorageBackend:
+        # Перехід з STORAGE_BACKEND=journal: беремо його знімок і журнал, інакше — JSON-файли
+        directory = self.snapshot_path.parent
+        if (directory / SNAPSHOT_FILENAME).exists():
+            return JournalBackend(directory / SNAPSHOT_FILENAME, directory / JOURNAL_FILENAME, self.names,
+                                  self.compact_bytes, self.fsync)
+        return super()._initial_source()
+
+    def _apply(self, ops):
+        rates = ops.get("rates")
+        if rates:
+            # Для rates зберігаємо і видалення: вони мають перекрити запис у знімку
+            self._state["rates"].update(rates)
+            ops = {name: entries for name, entries in ops.items() if name != "rates"}
+        super()._apply(ops)
+
+    def load(self, name: str) -> dict:
+        if name == "rates":
+            return {k: v for k, v in self._state["rates"].items() if v is not None}
+        return super().load(name)
+
+    def cold_rates(self) -> RateSnapshot:
+        # Змінені після знімка користувачі вже є в load("rates") — у знімку вони застаріли
+        for k in self._state["rates"]:
+            i = self._rates.find(int(k))
+            if i >= 0:
+                self._rates.taken[i] = 1
+        return self._rates
+
+    def _merge_rates(self, base: RateSnapshot, changed: dict[str, object], now_ts: int):
+        cutoff = now_ts - RATE_RETENTION_SECONDS
+        today = datetime.fromtimestamp(now_ts, timezone.utc).date().toordinal()
+        entries = []
+
+        def keep(user_id: int, stamps, day: int, day_count: int):
+            stamps = [t for t in stamps if t >= cutoff]
+            if day < today:
+                day = day_count = 0
+            if stamps or day_count:
+                entries.append((user_id, stamps, day, day_count))
+
+        for i in range(len(base)):
+            user_id, stamps, day, day_count = base.entry(i)
+            if str(user_id) not in changed:
+                keep(user_id, stamps, day, day_count)
+        for k, v in changed.items():
+            if v is None:
+                continue
+            try:
+                day = date.fromisoformat(v["d"]).toordinal() if v.get("d") else 0
+                keep(int(k), sorted(int(t) for t in v["t"]), day, int(v["c"]))
+            except Exception as e:
+                logger.warning(f"Бінарний знімок: пропущено rates для {k}: {e}")
+        entries.sort(key=lambda entry: entry[0])
+        return entries
+
+    def _write_snapshot(self, data, seq: int):
+        now_ts = int(datetime.now(timezone.utc).timestamp())
+        changed = data.get("rates", {})
+        rates = self._merge_rates(self._rates, changed, now_ts)
+        mutes = {}
+        for k, v in data.get("mutes", {}).items():
+            try:
+                until = int(-(-datetime.fromisoformat(v).timestamp() // 1))
+            except Exception as e:
+                logger.warning(f"Бінарний знімок: пропущено mute для {k}: {e}")
+                continue
+            if until > now_ts:
+                mutes[int(k)] = until
+        extra = {name: entries for name, entries in data.items() if name not in ("rates", "mutes") and entries}
+        blob = encode_binary_snapshot(seq, rates, mutes, extra)
+        tmp = self.snapshot_path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        _, snapshot, _, _ = decode_binary_snapshot(blob, now_ts)
+        with self._lock:
+            # Записане в знімок більше не тримаємо в пам'яті, якщо воно не змінилося після копіювання
+            overlay = self._state["rates"]
+            for k, v in list(changed.items()):
+                if k in overlay and overlay[k] is v:
+                    del overlay[k]
+            self._rates = snapshot
+        logger.debug("Бінарний знімок: %s користувачів, %s мутів, %s байт", len(rates), len(mutes), len(blob))
+
+DATASET_FILES = {"rates": "rate_limits.json", "mutes": "mutes.json", "meta": "chat_meta.json",
+                 "senders": "top_senders.json", "daily": "daily_limits.json", "hourly": "hourly_data.json", "short": "short_term_data.json"}
+
+def json_paths(directory: Path) -> dict[str, Path]:
+    return {name: directory / filename for name, filename in DATASET_FILES.items()}
+
+def make_backend(kind: str, directory: Path) -> StorageBackend:
+    if kind == "sqlite":
+        return SqliteBackend(directory / SQLITE_FILENAME, DATASET_FILES)
+    if kind == "journal":
+        return JournalBackend(directory / SNAPSHOT_FILENAME, directory / JOURNAL_FILENAME, DATASET_FILES,
+                              JOURNAL_COMPACT_BYTES, JOURNAL_FSYNC)
+    if kind == "binary":
+        return BinaryBackend(directory / BINARY_SNAPSHOT_FILENAME, directory / BINARY_JOURNAL_FILENAME,
+                             DATASET_FILES, JOURNAL_COMPACT_BYTES, JOURNAL_FSYNC)
+    if kind != "json":
+        logger.warning(f"Невідомий STORAGE_BACKEND={kind}, використовується json")
+    return JsonBackend(json_paths(directory))
+
+def migrate_json_to_sqlite():
+    # Одноразове перенесення JSON у SQLite (python bot.py --migrate-json-to-sqlite):
+    # старі загальні файли в data/ і кожен чат у data/chats/<chat_id>/
+    directories = [DATA_DIR] + (sorted(p for p in CHATS_DIR.iterdir() if p.is_dir()) if CHATS_DIR.exists() else [])
+    migrated = False
+    for directory in directories:
+        paths = json_paths(directory)
+        if not any(path.exists() for path in paths.values()):
+            continue
+        source = JsonBackend(paths)
+        target = SqliteBackend(directory / SQLITE_FILENAME, DATASET_FILES)
+        if not target.is_empty():
+            print(f"{directory / SQLITE_FILENAME} вже містить дані — пропущено.")
+            target.close()
+            continue
+        changes = {}
+        for name in DATASET_FILES:
+            raw = source.load(name)
+            changes[name] = {int(k): v for k, v in raw.items()}
+        target.write(changes)
+        target.close()
+        migrated = True
+        print(f"Перенесено в {directory / SQLITE_FILENAME}: " + ", ".join(f"{name}={len(v)}" for name, v in changes.items() if v))
+    if migrated:
+        print("Тепер встановіть STORAGE_BACKEND=sqlite у .env")
+    else:
+        print("Немає JSON-даних для перенесення.")
+    return migrated
+
+def load_legacy_rates(source: StorageBackend, rate_limiter: RateLimiter) -> set[int]:
+    # Перехід зі старого формату (daily/hourly/short окремо) на єдиний rates
+    legacy: dict[int, dict] = {}
+    for k, v in source.load("daily").items():
+        try:
+            entry = legacy.setdefault(int(k), {"hourly": [], "short": [], "day": 0, "count": 0})
+            entry["day"] = datetime.fromisoformat(v["date"]).date().toordinal()
+            entry["count"] = int(v["count"])
+        except Exception as e:
+            logger.warning(f"Помилка завантаження daily для {k}: {e}")
+    for name in ("hourly", "short"):
+        for k, v in source.load(name).items():
+            try:
+                entry = legacy.setdefault(int(k), {"hourly": [], "short": [], "day": 0, "count": 0})
+                entry[name] = [int(datetime.fromisoformat(t).timestamp()) for t in v]
+            except Exception as e:
+                logger.warning(f"Помилка завантаження {name} для {k}: {e}")
+    for user_id, entry in legacy.items():
+        # short ⊆ hourly, окрім повідомлень, на яких спрацював короткий ліміт
+        last = max(entry["hourly"], default=-1)
+        stamps = entry["hourly"] + [t for t in entry["short"] if t > last]
+        rate_limiter.restore(user_id, stamps, entry["day"], entry["count"])
+    return set(legacy)
+
+_legacy_backend = None
+
+def open_legacy_backend() -> StorageBackend | None:
+    # Дані до розбиття по чатах лежали прямо в data/ і були спільні для всіх чатів
+    global _legacy_backend
+    if _legacy_backend is None:
+        if STORAGE_BACKEND == "sqlite" and (DATA_DIR / SQLITE_FILENAME).exists():
+            _legacy_backend = SqliteBackend(DATA_DIR / SQLITE_FILENAME, DATASET_FILES)
+        elif STORAGE_BACKEND == "journal" and (DATA_DIR / SNAPSHOT_FILENAME).exists():
+            _legacy_backend = make_backend("journal", DATA_DIR)
+        elif any(path.exists() and path.stat().st_size for path in json_paths(DATA_DIR).values()):
+            _legacy_backend = JsonBackend(json_paths(DATA_DIR))
+        else:
+            _legacy_backend = False
+    return _legacy_backend or None
+
+# ─── Write-behind збереження ───
+class WriteBehindStore:
+    # Обробники лише позначають змінених користувачів (mark_dirty), диск вони не чіпають.
+    # flush() раз на SAVE_INTERVAL_SECONDS збирає значення тільки "брудних" користувачів
+    # і передає їх бекенду сховища у фоновому потоці.
+    def __init__(self, backend: StorageBackend):
+        self.backend = backend
+        self._serializers: dict[str, callable] = {}
+        self._dirty: dict[str, set[int]] = {}
+        self._write_lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+
+    def register(self, name: str, serializer):
+        self._serializers[name] = serializer
+        self._dirty[name] = set()
+
+    def mark_dirty(self, name: str, user_id: int):
+        self._dirty[name].add(user_id)
+
+    def pending(self) -> int:
+        return sum(len(d) for d in self._dirty.values())
+
+    def _collect(self):
+        # Виконується в потоці event loop: дешево, пропорційно кількості змін
+        changes = {}
+        for name, dirty in self._dirty.items():
+            if not dirty:
+                continue
+            serializer = self._serializers[name]
+            changes[name] = {user_id: serializer(user_id) for user_id in dirty}
+            logger.debug("Write-behind: %s — змінено %s", name, len(dirty))
+            dirty.clear()
+        return changes
+
+    def _write_batch(self, changes):
+        with self._write_lock:
+            started = perf_counter()
+            self.backend.write(changes)
+            STATE_FLUSH_SECONDS.observe(perf_counter() - started, type(self.backend).__name__)
+
+    async def flush(self):
+        async with self._flush_lock:
+            changes = self._collect()
+            if changes:
+                await asyncio.to_thread(self._write_batch, changes)
+
+    def flush_sync(self):
+        # Останній шанс при завершенні процесу (atexit), коли event loop вже зупинено
+        changes = self._collect()
+        if changes:
+            self._write_batch(changes)
+
+    def close(self):
+        self.flush_sync()
+        with self._write_lock:
+            self.backend.close()
+
+# ─── Планувальник завершення мутів ───
+class MuteScheduler:
+    # Мін-купа (час завершення, user_id) з лінивим видаленням: set — O(log n), clear лише
+    # прибирає запис із mutes, а застарілий елемент купи відкидається, коли дійде до вершини
+    # (або при ущільненні, коли застарілих стає більше за живі). Вершина — найближче завершення,
+    # на неї ставиться одна run_once-задача JobQueue; після спрацювання знімаються всі прострочені
+    # мути і задача переноситься на наступний. Для /listmute поруч тримається відсортований список
+    # живих (час завершення, user_id): bisect у set/clear, page() — лише зріз.
+    def __init__(self, mutes: dict[int, datetime]):
+        self.mutes = mutes
+        self._heap: list[tuple[float, int]] = []
+        self._index: list[tuple[float, int]] = []
+        self.job_queue = None
+        self.on_expire = None
+        self._job = None
+        self._job_at = None
+        self.rebuild()
+
+    def rebuild(self):
+        self._heap = [(until.timestamp(), uid) for uid, until in self.mutes.items()]
+        self._index = sorted(self._heap)
+        heapq.heapify(self._heap)
+        self._reschedule()
+
+    def __len__(self):
+        return len(self.mutes)
+
+    def set(self, user_id: int, until: datetime):
+        previous = self.mutes.get(user_id)
+        if previous is not None:
+            self._unindex(previous.timestamp(), user_id)
+        self.mutes[user_id] = until
+        entry = (until.timestamp(), user_id)
+        heapq.heappush(self._heap, entry)
+        insort(self._index, entry)
+        self._compact()
+        self._reschedule()
+
+    def clear(self, user_id: int) -> bool:
+        until = self.mutes.pop(user_id, None)
+        if until is None:
+            return False
+        self._unindex(until.timestamp(), user_id)
+        self._compact()
+        self._reschedule()
+        return True
+
+    def page(self, offset: int, limit: int) -> list[tuple[float, int]]:
+        return self._index[offset:offset + limit]
+
+    def pop_expired(self, now_ts: float) -> list[int]:
+        expired = []
+        while self._heap and self._heap[0][0] <= now_ts:
+            ts, uid = heapq.heappop(self._heap)
+            if self._live(ts, uid):
+                del self.mutes[uid]
+                expired.append(uid)
+        if expired:
+            # Живі записи до now_ts включно — саме ті, що щойно зняті, і вони на початку індексу
+            del self._index[:len(expired)]
+            self._reschedule()
+        return expired
+
+    def attach(self, job_queue):
+        self.job_queue = job_queue
+        self._reschedule()
+
+    def _unindex(self, ts: float, user_id: int):
+        i = bisect_left(self._index, (ts, user_id))
+        if i < len(self._index) and self._index[i] == (ts, user_id):
+            del self._index[i]
+
+    def _live(self, ts: float, user_id: int) -> bool:
+        until = self.mutes.get(user_id)
+        return until is not None and until.timestamp() == ts
+
+    def _compact(self):
+        # Застарілі елементи (зняті чи перевстановлені мути) не дають купі рости без меж
+        if len(self._heap) > 2 * len(self.mutes) + 64:
+            self._heap = [(until.timestamp(), uid) for uid, until in self.mutes.items()]
+            heapq.heapify(self._heap)
+
+    def _reschedule(self):
+        while self._heap and not self._live(*self._heap[0]):
+            heapq.heappop(self._heap)
+        if self.job_queue is None:
+            return
+        next_at = self._heap[0][0] if self._heap else None
+        if next_at == self._job_at:
+            return
+        if self._job is not None:
+            self._job.schedule_removal()
+            self._job = None
+        self._job_at = next_at
+        if next_at is not None:
+            self._job = self.job_queue.run_once(self._fire, when=datetime.fromtimestamp(next_at, timezone.utc),
+                                                name="mute_expiry")
+
+    async def _fire(self, context: ContextTypes.DEFAULT_TYPE):
+        self._job = None
+        self._job_at = None
+        for user_id in self.pop_expired(datetime.now(timezone.utc).timestamp()):
+            if self.on_expire:
+                self.on_expire(user_id)
+        self._reschedule()
+
+# ─── Найактивніші відправники (/top) ───
+class SpaceSaving:
+    # Space-Saving: не більше capacity лічильників. Новий відправник при повному наборі витісняє
+    # того, в кого найменше, і успадковує його лічильник (він же — верхня межа похибки).
+    # Лічильники згруповані за значенням, тож і +1, і витіснення — O(1).
+    __slots__ = ("capacity", "counts", "errors", "buckets", "min_count")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: dict[int, int] = {}
+        self.errors: dict[int, int] = {}
+        self.buckets: dict[int, dict[int, None]] = {}
+        self.min_count = 0
+
+    def _place(self, item: int, count: int):
+        self.counts[item] = count
+        self.buckets.setdefault(count, {})[item] = None
+
+    def _take(self, item: int, count: int):
+        bucket = self.buckets[count]
+        del bucket[item]
+        if not bucket:
+            del self.buckets[count]
+
+    def add(self, item: int):
+        count = self.counts.get(item)
+        if count is not None:
+            self._take(item, count)
+            self._place(item, count + 1)
+            if count == self.min_count and count not in self.buckets:
+                self.min_count = count + 1
+            return
+        if len(self.counts) < self.capacity:
+            self.errors[item] = 0
+            self._place(item, 1)
+            self.min_count = 1
+            return
+        victim = next(iter(self.buckets[self.min_count]))
+        self._take(victim, self.min_count)
+        del self.counts[victim]
+        del self.errors[victim]
+        self.errors[item] = self.min_count
+        self._place(item, self.min_count + 1)
+        if self.min_count not in self.buckets:
+            self.min_count += 1
+
+    def export(self) -> list[list[int]]:
+        return [[item, count, self.errors[item]] for item, count in self.counts.items()]
+
+    @classmethod
+    def restore(cls, capacity: int, entries) -> "SpaceSaving":
+        sketch = cls(capacity)
+        # Якщо TOP_SKETCH_SIZE зменшили — лишаються найбільші лічильники
+        for item, count, error in sorted(entries, key=lambda entry: -entry[1])[:capacity]:
+            sketch.errors[int(item)] = int(error)
+            sketch._place(int(item), int(count))
+        sketch.min_count = min(sketch.buckets, default=0)
+        return sketch
+
+class TopSenders:
+    # Ковзні вікна з кошиків: година — 6 по 10 хв, доба — 24 по годині, тиждень — 7 по добі.
+    # Кожне повідомлення — три O(1)-оновлення; запит зливає не більше 24 кошиків по capacity записів.
+    WINDOWS = (("hour", 600, 6), ("day", 3600, 24), ("week", 86400, 7))
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.windows: dict[str, deque] = {name: deque() for name, _, _ in self.WINDOWS}
+        # Є лічильники, яких ще немає на диску (поточний кошик після останнього збереження)
+        self.unsaved = False
+
+    def add(self, user_id: int, ts: int) -> bool:
+        # True, коли відкрито новий 10-хвилинний кошик: лише тоді скетч варто зберігати.
+        # Години й доби кратні 10 хв, тож їхні нові кошики збігаються з цим моментом
+        rolled = False
+        for name, width, count in self.WINDOWS:
+            buckets = self.windows[name]
+            index = ts // width
+            if not buckets or buckets[-1][0] < index:
+                rolled = True
+                buckets.append((index, SpaceSaving(self.capacity)))
+                while buckets[0][0] <= index - count:
+                    buckets.popleft()
+            buckets[-1][1].add(user_id)
+        self.unsaved = not rolled
+        return rolled
+
+    def top(self, name: str, n: int, now_ts: int) -> list[tuple[int, int, int]]:
+        # [(user_id, лічильник, похибка)] за спаданням; справжня кількість — між count - error і count
+        width, count = next((width, count) for window, width, count in self.WINDOWS if window == name)
+        oldest = now_ts // width - count + 1
+        counts: dict[int, int] = {}
+        errors: dict[int, int] = {}
+        for index, sketch in self.windows[name]:
+            if index < oldest:
+                continue
+            for user_id, value in sketch.counts.items():
+                counts[user_id] = counts.get(user_id, 0) + value
+                errors[user_id] = errors.get(user_id, 0) + sketch.errors[user_id]
+        best = heapq.nlargest(n, counts.items(), key=lambda entry: entry[1])
+        return [(user_id, value, errors[user_id]) for user_id, value in best]
+
+    def export(self) -> dict:
+        return {name: [[index, sketch.export()] for index, sketch in buckets]
+                for name, buckets in self.windows.items()}
+
+    def restore(self, data: dict):
+        for name, _, _ in self.WINDOWS:
+            self.windows[name] = deque((int(index), SpaceSaving.restore(self.capacity, entries))
+                                       for index, entries in data.get(name, []))
+
+# ─── Пакетне видалення повідомлень ───
+DELETE_BATCH_MAX = 100  # ліміт Bot API для deleteMessages
+
+# Досягнуті розміри пакетів і затримки (delay — від постановки в чергу до запиту)
+DELETE_STATS = {"batches": 0, "messages": 0, "max_batch": 0, "total_delay_ms": 0.0, "max_delay_ms": 0.0,
+                "fallback_batches": 0, "single_deletes": 0, "retry_after": 0}
+
+class DeletionQueue:
+    # Видалення одного чату накопичуються не довше delay секунд (від найстаршого в черзі)
+    # і йдуть одним delete_messages до 100 id. Якщо пакет не пройшов — видаляємо по одному.
+    def __init__(self, chat_id: int, delay: float):
+        self.chat_id = chat_id
+        self.delay = delay
+        self._pending: list[tuple[int, float, str]] = []
+        self._full = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._bot = None
+
+    def add(self, bot, message_id: int, note: str = ""):
+        self._bot = bot
+        self._pending.append((message_id, monotonic(), note))
+        if len(self._pending) >= DELETE_BATCH_MAX or self.delay <= 0:
+            self._full.set()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def flush(self):
+        # Надіслати все негайно (зупинка бота)
+        self._full.set()
+        while self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def _run(self):
+        try:
+            while self._pending:
+                timeout = self._pending[0][1] + self.delay - monotonic()
+                if timeout > 0 and not self._full.is_set():
+                    try:
+                        await asyncio.wait_for(self._full.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                batch = self._pending[:DELETE_BATCH_MAX]
+                del self._pending[:DELETE_BATCH_MAX]
+                if len(self._pending) < DELETE_BATCH_MAX:
+                    self._full.clear()
+                await self._send(batch)
+        finally:
+            self._task = None
+
+    async def _request(self, ids: list[int]):
+        # RetryAfter — чекаємо вказаний час і повторюємо той самий запит (до OUTBOX_MAX_RETRIES разів)
+        for attempt in range(OUTBOX_MAX_RETRIES + 1):
+            try:
+                if len(ids) == 1:
+                    return await self._bot.delete_message(self.chat_id, ids[0])
+                return await self._bot.delete_messages(self.chat_id, ids)
+            except RetryAfter as e:
+                if attempt == OUTBOX_MAX_RETRIES:
+                    raise
+                retry_after = e.retry_after
+                seconds = retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+                DELETE_STATS["retry_after"] += 1
+                logger.info("RetryAfter %.0f с на видалення в чаті %s — повтор", seconds, self.chat_id)
+                await asyncio.sleep(seconds)
+
+    async def _send(self, batch: list[tuple[int, float, str]]):
+        now = monotonic()
+        delay_ms = (now - batch[0][1]) * 1000
+        DELETE_STATS["batches"] += 1
+        DELETE_STATS["messages"] += len(batch)
+        DELETE_STATS["max_batch"] = max(DELETE_STATS["max_batch"], len(batch))
+        DELETE_STATS["total_delay_ms"] += sum((now - queued) * 1000 for _, queued, _ in batch)
+        DELETE_STATS["max_delay_ms"] = max(DELETE_STATS["max_delay_ms"], delay_ms)
+        ids = [message_id for message_id, _, _ in batch]
+        try:
+            await self._request(ids)
+            logger.info("Видалено %s повідомлень у чаті %s одним запитом (найстаріше чекало %.0f мс)",
+                        len(ids), self.chat_id, delay_ms)
+            for message_id, _, note in batch:
+                logger.debug("Видалено %s в чаті %s %s", message_id, self.chat_id, note)
+            return
+        except TelegramError as e:
+            if len(ids) == 1:
+                if "message to delete not found" not in str(e):
+                    SWALLOWED_ERRORS.inc("delete")
+                    logger.debug("Не вдалося видалити %s в чаті %s: %s", ids[0], self.chat_id, e)
+                return
+            logger.warning("Пакетне видалення %s повідомлень у чаті %s не вдалося: %s — видаляємо по одному", len(ids), self.chat_id, e)
+        DELETE_STATS["fallback_batches"] += 1
+        for message_id, _, note in batch:
+            DELETE_STATS["single_deletes"] += 1
+            try:
+                await self._request([message_id])
+                logger.info("Видалено %s в чаті %s %s", message_id, self.chat_id, note)
+            except TelegramError as e:
+                if "message to delete not found" not in str(e):
+                    SWALLOWED_ERRORS.inc("delete")
+                    logger.debug("Не вдалося видалити %s в чаті %s: %s", message_id, self.chat_id, e)
+
+# ─── Альбоми (media_group) ───
+ALBUM_MAX_PARTS = 10  # більше фото в один альбом Telegram не пускає
+
+class AlbumBuffer:
+    # Альбом приходить окремим апдейтом на кожне фото. Частини збираються, доки delay секунд
+    # не прийде нової (або не набереться ALBUM_MAX_PARTS), і віддаються в on_ready разом.
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._albums: dict[str, list] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def add(self, message, on_ready) -> bool:
+        # True — перша частина альбому (почато збір)
+        parts = self._albums.get(message.media_group_id)
+        if parts is not None:
+            parts.append(message)
+            return False
+        self._albums[message.media_group_id] = [message]
+        task = asyncio.ensure_future(self._collect(message.media_group_id, on_ready))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    def __len__(self):
+        return len(self._albums)
+
+    async def _collect(self, key: str, on_ready):
+        parts = self._albums[key]
+        seen = 0
+        while len(parts) != seen and len(parts) < ALBUM_MAX_PARTS:
+            seen = len(parts)
+            await asyncio.sleep(self.delay)
+        del self._albums[key]
+        parts.sort(key=lambda part: part.message_id)
+        try:
+            await on_ready(parts)
+        except Exception as e:
+            logger.error("Обробка альбому %s: %s", key, e, exc_info=True)
+
+    async def drain(self):
+        # Дочекатися альбомів, що ще збираються (зупинка бота)
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks))
+
+def delete_stats_summary() -> str:
+    batches = DELETE_STATS["batches"]
+    messages = DELETE_STATS["messages"]
+    if not batches:
+        return "пакетів 0"
+    return (f"пакетів {batches}, повідомлень {messages}, середній пакет {messages / batches:.1f}, "
+            f"макс. пакет {DELETE_STATS['max_batch']}, середня затримка {DELETE_STATS['total_delay_ms'] / messages:.0f} мс, "
+            f"макс. затримка {DELETE_STATS['max_delay_ms']:.0f} мс, fallback {DELETE_STATS['fallback_batches']} "
+            f"({DELETE_STATS['single_deletes']} поодинці), RetryAfter {DELETE_STATS['retry_after']}")
+
+# ─── Черга вихідних повідомлень ───
+MUTE_NOTICE_MAX_LINES = 20  # щоб зведення гарантовано влазило в 4096 символів
+
+class TokenBucket:
+    # rate токенів за секунду, не більше capacity; один токен — одне повідомлення
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    def wait_time(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+class OutboundMessage:
+    # lines задано тільки для зведення мутів: поки воно в черзі, до нього дописуються нові мути чату
+    __slots__ = ("chat_id", "text", "parse_mode", "disable_notification", "lines", "not_before", "attempts")
+
+    def __init__(self, chat_id: int, text: str | None, parse_mode=None, disable_notification: bool = False):
+        self.chat_id = chat_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.disable_notification = disable_notification
+        self.lines: list[str] | None = None
+        self.not_before = 0.0
+        self.attempts = 0
+
+    def render(self) -> str:
+        if self.lines is None:
+            return self.text
+        return "\n".join(self.lines) + "\nПовідомлення видалятимуться."
+
+OUTBOX_STATS = {"queued": 0, "sent": 0, "coalesced": 0, "retry_after": 0, "failed": 0, "dropped": 0}
+
+class Outbox:
+    # Усі повідомлення бота ставляться в чергу і надсилаються фоновою задачею:
+    # токен-бакети (глобальний і на кожен чат), не більше concurrency запитів одночасно,
+    # RetryAfter — чат пауза на вказаний час і повтор. Хендлери на надсилання не чекають.
+    # У кожного чату своя FIFO; чати з непорожньою чергою лежать у мін-купі за часом, коли їхнє
+    # перше готове повідомлення можна слати (ліниве видалення, як у MuteScheduler), тож надсилання —
+    # O(log чатів), а заблоковані RetryAfter чи бакетом чати не переглядаються на кожне повідомлення.
+    # Для одного чату в польоті не більше одного запиту (_busy): інакше повтор після RetryAfter
+    # обганяли б наступні повідомлення чату, і порядок FIFO губився б.
+    def __init__(self, global_rate: float, group_per_minute: float, private_rate: float,
+                 concurrency: int, coalesce_delay: float, max_queue: int = 0):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.group_rate = group_per_minute / 60
+        self.private_rate = private_rate
+        self.coalesce_delay = coalesce_delay
+        self.max_queue = max_queue
+        self._buckets: dict[int, TokenBucket] = {}
+        self._blocked_until: dict[int, float] = {}
+        self._chats: dict[int, deque[OutboundMessage]] = {}
+        self._size = 0
+        self._ready: list[tuple[float, int]] = []
+        self._ready_at: dict[int, float] = {}
+        self._notices: dict[int, OutboundMessage] = {}
+        self._busy: set[int] = set()
+        # Event і Semaphore створюються на тому loop, де черга вперше знадобилась: на Python 3.9 вони
+        # прив'язуються до loop у конструкторі, а Outbox створюється ще при імпорті (і в run_worker
+        # до asyncio.run)
+        self.concurrency = concurrency
+        self._semaphore: asyncio.Semaphore | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._inflight: set[asyncio.Task] = set()
+        self._task: asyncio.Task | None = None
+        self._bot = None
+        self._draining = False
+
+    def send(self, bot, chat_id: int, text: str, parse_mode=None, disable_notification: bool = False):
+        self._push(bot, OutboundMessage(chat_id, text, parse_mode, disable_notification))
+
+    def notify_mute(self, bot, chat_id: int, line: str):
+        item = self._notices.get(chat_id)
+        if item is not None and len(item.lines) < MUTE_NOTICE_MAX_LINES:
+            item.lines.append(line)
+            OUTBOX_STATS["coalesced"] += 1
+            return
+        item = OutboundMessage(chat_id, None, "HTML", True)
+        item.lines = [line]
+        item.not_before = monotonic() + self.coalesce_delay
+        if self._push(bot, item):
+            self._notices[chat_id] = item
+
+    def __len__(self):
+        return self._size
+
+    def prune(self) -> int:
+        # Бакети, що встигли наповнитись, нічим не відрізняються від нових — видаляємо
+        now = monotonic()
+        idle = [chat_id for chat_id, bucket in self._buckets.items()
+                if bucket.wait_time(now) == 0 and bucket.tokens >= bucket.capacity
+                and self._blocked_until.get(chat_id, 0) <= now]
+        for chat_id in idle:
+            del self._buckets[chat_id]
+            self._blocked_until.pop(chat_id, None)
+        return len(idle)
+
+    async def flush(self, timeout: float):
+        # Зупинка бота: не чекаємо вікна зведення мутів, але ліміти поважаємо
+        if self._wakeup is None:
+            return
+        self._draining = True
+        # Без вікна зведення чати можуть стати готовими раніше, ніж записано в купі
+        now = monotonic()
+        for chat_id in self._chats:
+            self._schedule(chat_id, now)
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Черга вихідних: при зупинці не надіслано %s повідомлень", self._size)
+
+    async def _drain(self):
+        while self._task is not None or self._inflight:
+            if self._task is not None:
+                await asyncio.shield(self._task)
+            if self._inflight:
+                await asyncio.wait(list(self._inflight))
+
+    def _push(self, bot, item: OutboundMessage) -> bool:
+        if self.max_queue and self._size >= self.max_queue:
+            OUTBOX_STATS["dropped"] += 1
+            logger.debug("Черга вихідних переповнена: відкинуто повідомлення в чат %s", item.chat_id)
+            return False
+        if self._wakeup is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._wakeup = asyncio.Event()
+        self._bot = bot
+        self._enqueue(item, left=False)
+        OUTBOX_STATS["queued"] += 1
+        self._wakeup.set()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return True
+
+    def _enqueue(self, item: OutboundMessage, left: bool):
+        queue = self._chats.get(item.chat_id)
+        if queue is None:
+            queue = self._chats[item.chat_id] = deque()
+        if left:
+            queue.appendleft(item)
+        else:
+            queue.append(item)
+        self._size += 1
+        if item.chat_id in self._busy:
+            # Чат повернеться в купу, коли завершиться його запит
+            return
+        # Запис у купі, раніший за справжній, нешкідливий — _pop_ready його перевірить і перенесе,
+        # тож тут чат лише посувається ближче
+        ready_at = self._next_in_chat(item.chat_id, monotonic())[0]
+        current = self._ready_at.get(item.chat_id)
+        if current is None or ready_at < current:
+            self._set_ready(item.chat_id, ready_at)
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            rate = self.group_rate if chat_id < 0 else self.private_rate
+            bucket = self._buckets[chat_id] = TokenBucket(rate, max(1.0, rate))
+        return bucket
+
+    def _next_in_chat(self, chat_id: int, now: float) -> tuple[float, OutboundMessage]:
+        # Перше повідомлення чату, яке можна слати найраніше, і коли саме. Зведення мутів у вікні
+        # злиття можуть пропустити наперед наступні повідомлення; решта йде строго по черзі,
+        # тож перегляд зупиняється на першому ж звичайному повідомленні
+        ready_at = now + max(self._bucket(chat_id).wait_time(now), self._blocked_until.get(chat_id, 0) - now)
+        best = None
+        for item in self._chats[chat_id]:
+            at = ready_at if self._draining else max(ready_at, item.not_before)
+            if best is None or at < best[0]:
+                best = (at, item)
+            if at <= ready_at:
+                break
+        return best
+
+    def _schedule(self, chat_id: int, now: float):
+        if chat_id not in self._chats or chat_id in self._busy:
+            self._ready_at.pop(chat_id, None)
+            return
+        ready_at = self._next_in_chat(chat_id, now)[0]
+        if self._ready_at.get(chat_id) != ready_at:
+            self._set_ready(chat_id, ready_at)
+
+    def _set_ready(self, chat_id: int, ready_at: float):
+        self._ready_at[chat_id] = ready_at
+        heapq.heappush(self._ready, (ready_at, chat_id))
+        if len(self._ready) > 2 * len(self._ready_at) + 64:
+            self._ready = [(at, chat) for chat, at in self._ready_at.items()]
+            heapq.heapify(self._ready)
+
+    def _pop_ready(self, now: float) -> tuple[OutboundMessage | None, float | None]:
+        # Готове повідомлення або скільки чекати до найближчого
+        while self._ready:
+            ready_at, chat_id = self._ready[0]
+            if self._ready_at.get(chat_id) != ready_at:
+                heapq.heappop(self._ready)
+                continue
+            if ready_at > now:
+                return None, ready_at - now
+            at, item = self._next_in_chat(chat_id, now)
+            if at > now:
+                # Поки чат лежав у купі, межа зсунулась (скидання вікна злиття в тестах тощо)
+                self._schedule(chat_id, now)
+                continue
+            heapq.heappop(self._ready)
+            del self._ready_at[chat_id]
+            queue = self._chats[chat_id]
+            queue.remove(item)
+            self._size -= 1
+            if not queue:
+                del self._chats[chat_id]
+            return item, None
+        return None, None
+
+    async def _run(self):
+        try:
+            while self._size:
+                now = monotonic()
+                wait = self.global_bucket.wait_time(now)
+                item = None
+                if not wait:
+                    item, wait = self._pop_ready(now)
+                if item is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self._notices.get(item.chat_id) is item:
+                    del self._notices[item.chat_id]
+                self.global_bucket.take()
+                self._bucket(item.chat_id).take()
+                self._busy.add(item.chat_id)
+                await self._semaphore.acquire()
+                task = asyncio.ensure_future(self._deliver(item))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+        finally:
+            self._task = None
+
+    async def _deliver(self, item: OutboundMessage):
+        try:
+            await self._bot.send_message(chat_id=item.chat_id, text=item.render(), parse_mode=item.parse_mode,
+                                         disable_notification=item.disable_notification)
+            OUTBOX_STATS["sent"] += 1
+            logger.debug("Успішно надіслано в чат %s", item.chat_id)
+        except RetryAfter as e:
+            OUTBOX_STATS["retry_after"] += 1
+            retry_after = e.retry_after
+            seconds = retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+            self._blocked_until[item.chat_id] = monotonic() + seconds
+            item.attempts += 1
+            if item.attempts > OUTBOX_MAX_RETRIES:
+                OUTBOX_STATS["failed"] += 1
+                logger.warning("Не вдалося надіслати в чат %s: RetryAfter %s разів поспіль", item.chat_id, item.attempts)
+                return
+            logger.info("RetryAfter %.0f с для чату %s — повтор", seconds, item.chat_id)
+            if item.lines is not None and item.chat_id not in self._notices:
+                self._notices[item.chat_id] = item
+            self._enqueue(item, left=True)
+        except Forbidden as e:
+            OUTBOX_STATS["failed"] += 1
+            SWALLOWED_ERRORS.inc("send")
+            logger.debug("Чат %s недоступний для бота: %s", item.chat_id, e)
+        except TelegramError as e:
+            OUTBOX_STATS["failed"] += 1
+            SWALLOWED_ERRORS.inc("send")
+            logger.warning("Не вдалося надіслати в чат %s: %s", item.chat_id, e)
+        finally:
+            self._semaphore.release()
+            self._busy.discard(item.chat_id)
+            if item.chat_id in self._chats:
+                self._schedule(item.chat_id, monotonic())
+                self._wakeup.set()
+                if self._task is None:
+                    self._task = asyncio.ensure_future(self._run())
+
+outbox = Outbox(OUTBOX_GLOBAL_PER_SECOND, OUTBOX_GROUP_PER_MINUTE, OUTBOX_PRIVATE_PER_SECOND,
+                OUTBOX_CONCURRENCY, MUTE_NOTICE_COALESCE_MS / 1000, OUTBOX_MAX_QUEUE)
+
+# ─── Конкурентна обробка ───
+class KeyedLocks:
+    # asyncio.Lock на ключ (FIFO, тож порядок надходження зберігається).
+    # Запис живе лише поки lock комусь потрібен — словник не росте з кількістю користувачів.
+    def __init__(self):
+        self._locks: dict[object, list] = {}
+
+    @asynccontextmanager
+    async def hold(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
+
+# ─── Стан чатів (шарди) ───
+CHATS_DIR = DATA_DIR / "chats"
+# Які чати отримують спільний стан із data/: ті, що були в ALLOWED_CHAT_IDS під час першого запуску
+# після розбиття по чатах. Список фіксується один раз, тож чати, додані пізніше (/reloadconfig),
+# починають з чистого стану, а не з чужих мутів і лічильників
+LEGACY_IMPORT_FILE = CHATS_DIR / "legacy_import.json"
+_legacy_import_chats: set[int] | None = None
+
+def legacy_import_chats() -> set[int]:
+    global _legacy_import_chats
+    if _legacy_import_chats is None:
+        recorded = load_json(LEGACY_IMPORT_FILE, default=None)
+        if isinstance(recorded, dict):
+            _legacy_import_chats = {int(chat_id) for chat_id in recorded.get("chats", [])}
+        else:
+            _legacy_import_chats = set(ALLOWED_CHAT_IDS) if open_legacy_backend() else set()
+            CHATS_DIR.mkdir(parents=True, exist_ok=True)
+            save_json(LEGACY_IMPORT_FILE, {"chats": sorted(_legacy_import_chats)})
+            if _legacy_import_chats:
+                logger.info("Спільний стан data/ буде перенесено лише в чати %s", sorted(_legacy_import_chats))
+    return _legacy_import_chats
+
+def chat_limits(chat_id: int) -> dict[str, int]:
+    limits = dict(DEFAULT_LIMITS)
+    limits.update(CHAT_LIMITS.get(chat_id, {}))
+    return limits
+
+class ChatShard:
+    # Увесь стан модерації одного чату: лічильники, мути, блокування, власні ліміти,
+    # власне сховище (data/chats/<chat_id>/) і власний lock. Шарди між собою нічого не ділять.
+    def __init__(self, chat_id: int, limits: dict[str, int], backend: StorageBackend):
+        self.chat_id = chat_id
+        self.limits = limits
+        self.lock = asyncio.Lock()
+        self.user_locks = KeyedLocks()
+        self.rate_limiter = build_rate_limiter(limits)
+        self.mutes: dict[int, datetime] = {}
+        self.mute_scheduler = MuteScheduler(self.mutes)
+        self.mute_scheduler.on_expire = self._on_mute_expired
+        self.locked = False
+        # Кому бот наклав restrict_chat_member (щоб зняти при /unmute і звірити при старті)
+        self.restricted: set[int] = set()
+        self.restrict_blocked_until = 0.0
+        # Дозволи чату до /lock через set_chat_permissions (None — блокування лише видаленням)
+        self.saved_permissions: dict | None = None
+        self.deletions = DeletionQueue(chat_id, DELETE_BATCH_DELAY_MS / 1000)
+        self.albums = AlbumBuffer(ALBUM_BUFFER_MS / 1000)
+        self.top = TopSenders(TOP_SKETCH_SIZE)
+        self.raid = RaidDetector()
+        self.store = WriteBehindStore(backend)
+        self.store.register("rates", self._serialize_rate)
+        self.store.register("mutes", self._serialize_mute)
+        self.store.register("meta", self._serialize_meta)
+        self.store.register("senders", lambda key: self.top.export())
+        self.rate_limiter.on_evict = lambda user_id: self.store.mark_dirty("rates", user_id)
+
+    def load(self, source: StorageBackend, migrate: bool = False):
+        started = perf_counter()
+        raw = source.load("rates")
+        for k, v in raw.items():
+            try:
+                day = date.fromisoformat(v["d"]).toordinal() if v.get("d") else 0
+                self.rate_limiter.restore(int(k), [int(t) for t in v["t"]], day, int(v["c"]))
+            except Exception as e:
+                logger.warning(f"Чат {self.chat_id}: помилка завантаження rates для {k}: {e}")
+        cold = source.cold_rates()
+        if cold is not None and len(cold):
+            self.rate_limiter.cold = cold
+        elif not raw:
+            load_legacy_rates(source, self.rate_limiter)
+        now = datetime.now(timezone.utc)
+        for k, v in source.load("mutes").items():
+            try:
+                until = datetime.fromisoformat(v)
+                if until > now:
+                    self.mutes[int(k)] = until
+            except Exception as e:
+                logger.warning(f"Чат {self.chat_id}: помилка завантаження mute для {k}: {e}")
+        self.mute_scheduler.rebuild()
+        senders = source.load("senders").get("0")
+        if senders:
+            try:
+                self.top.restore(senders)
+            except Exception as e:
+                logger.warning(f"Чат {self.chat_id}: помилка завантаження статистики /top: {e}")
+        meta = source.load("meta").get("0")
+        if meta:
+            self.locked = bool(meta.get("locked"))
+            self.restricted = {int(uid) for uid in meta.get("restricted", [])}
+            self.saved_permissions = meta.get("saved_permissions")
+            # Автоблокування пережило перезапуск — знімемо після затишшя, як і без перезапуску
+            self.raid.auto_locked = self.locked and bool(meta.get("raid_locked"))
+        if migrate:
+            # Дані взято з іншого сховища — записуємо їх у власне
+            for user_id in self.rate_limiter.users:
+                self.store.mark_dirty("rates", user_id)
+            for user_id in self.mutes:
+                self.store.mark_dirty("mutes", user_id)
+            self.store.mark_dirty("meta", 0)
+            self.store.mark_dirty("senders", 0)
+        elapsed = perf_counter() - started
+        SHARD_LOAD_SECONDS.observe(elapsed, type(source).__name__)
+        cold_note = f" (+{len(cold)} у знімку, декодуються при появі)" if self.rate_limiter.cold else ""
+        logger.info(f"Чат {self.chat_id}: завантажено rates={len(self.rate_limiter.users)}{cold_note}, "
+                    f"active mutes={len(self.mutes)}, locked={self.locked} за {elapsed * 1000:.1f} мс")
+
+    def _serialize_rate(self, user_id: int):
+        return self.rate_limiter.export(user_id, int(datetime.now(timezone.utc).timestamp()))
+
+    def _serialize_mute(self, user_id: int):
+        v = self.mutes.get(user_id)
+        return None if v is None else v.isoformat()
+
+    def _serialize_meta(self, key: int):
+        return {"locked": self.locked, "restricted": sorted(self.restricted),
+                "saved_permissions": self.saved_permissions, "raid_locked": self.raid.auto_locked}
+
+    def attach(self, job_queue):
+        self.mute_scheduler.attach(job_queue)
+
+    def mark_unsaved(self):
+        # Перед фінальним збереженням дописуємо те, що write-behind відкладав
+        if self.top.unsaved:
+            self.top.unsaved = False
+            self.store.mark_dirty("senders", 0)
+
+    def close(self):
+        self.mark_unsaved()
+        self.store.close()
+
+    def apply_limits(self, limits: dict[str, int]):
+        self.limits = limits
+        self.rate_limiter.reconfigure(*build_rate_tiers(limits))
+
+    def set_locked(self, locked: bool):
+        self.locked = locked
+        self.store.mark_dirty("meta", 0)
+
+    def set_restricted(self, user_id: int, restricted: bool):
+        if restricted != (user_id in self.restricted):
+            if restricted:
+                self.restricted.add(user_id)
+            else:
+                self.restricted.discard(user_id)
+            self.store.mark_dirty("meta", 0)
+
+    def mute(self, user_id: int, until: datetime):
+        self.mute_scheduler.set(user_id, until)
+        self.store.mark_dirty("mutes", user_id)
+
+    def _on_mute_expired(self, user_id: int):
+        # Те саме, що й раніше при наступному повідомленні після мута:
+        # ковзні вікна (short, hourly, додаткові) скидаються, денний лічильник — ні
+        logger.info("Мут для %s в чаті %s експірувався", user_id, self.chat_id)
+        self.store.mark_dirty("mutes", user_id)
+        # Обмеження з тим самим until_date Telegram знімає сам
+        self.set_restricted(user_id, False)
+        if self.rate_limiter.reset_windows(user_id):
+            self.store.mark_dirty("rates", user_id)
+
+    def expire_due_mutes(self):
+        for user_id in self.mute_scheduler.pop_expired(datetime.now(timezone.utc).timestamp()):
+            self._on_mute_expired(user_id)
+
+    def sweep(self, now: datetime) -> tuple[int, int, int]:
+        cleared, idle = self.rate_limiter.sweep(int(now.timestamp()), now.date().toordinal())
+        lru = self.rate_limiter.evict_lru(MAX_TRACKED_USERS) if MAX_TRACKED_USERS else 0
+        return cleared, idle, lru
+
+shards: dict[int, ChatShard] = {}
+shards_job_queue = None
+
+def open_shard(chat_id: int) -> ChatShard:
+    directory = CHATS_DIR / str(chat_id)
+    is_new = not directory.exists()
+    directory.mkdir(parents=True, exist_ok=True)
+    backend = make_backend(STORAGE_BACKEND, directory)
+    shard = ChatShard(chat_id, chat_limits(chat_id), backend)
+    legacy = open_legacy_backend() if is_new and chat_id in legacy_import_chats() else None
+    if legacy:
+        logger.info(f"Чат {chat_id}: початковий стан перенесено зі спільних файлів data/")
+        shard.load(legacy, migrate=True)
+    else:
+        shard.load(backend)
+    if shards_job_queue is not None:
+        shard.attach(shards_job_queue)
+    atexit.register(shard.close)
+    return shard
+
+def get_shard(chat_id: int) -> ChatShard:
+    shard = shards.get(chat_id)
+    if shard is None:
+        shard = shards[chat_id] = open_shard(chat_id)
+    return shard
+
+def queue_delete(message, reason: str, note: str = ""):
+    # Не чекає на запит: видалення піде пакетом разом з іншими з цього чату
+    DELETES.inc(reason)
+    get_shard(message.chat.id).deletions.add(message.get_bot(), message.message_id, note)
+
+# Rate limit для приватних повідомлень
+last_private_msg: dict[int, datetime] = {}
+
+# ─── Кеш статусів учасників ───
+ADMIN_STATUSES = ("administrator", "creator")
+
+class MemberStatusCache:
+    # Список адмінів чату береться одним get_chat_administrators і живе TTL секунд.
+    # Поки він свіжий, будь-хто поза списком — звичайний учасник ("member") без API-викликів.
+    # Точкові get_chat_member лишаються тільки як fallback (з LRU-витісненням).
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._admins: dict[int, dict[int, str] | None] = {}
+        self._admins_expires: dict[int, float] = {}
+        self._refreshing: dict[int, asyncio.Task] = {}
+        self._entries: OrderedDict[tuple[int, int], tuple[str, float]] = OrderedDict()
+
+    async def get_status(self, bot, chat_id: int, user_id: int) -> str:
+        admins = await self._admins_for(bot, chat_id)
+        if admins is not None:
+            return admins.get(user_id, "member")
+        key = (chat_id, user_id)
+        now = monotonic()
+        entry = self._entries.get(key)
+        if entry and entry[1] > now:
+            self._entries.move_to_end(key)
+            return entry[0]
+        member = await bot.get_chat_member(chat_id, user_id)
+        logger.debug("Кеш статусів: точковий get_chat_member %s в чаті %s → %s", user_id, chat_id, member.status)
+        self._remember(key, member.status, now)
+        return member.status
+
+    async def refresh_admins(self, bot, chat_id: int):
+        try:
+            admins = await bot.get_chat_administrators(chat_id)
+        except TelegramError as e:
+            logger.warning("Кеш статусів: не вдалося отримати адмінів чату %s: %s", chat_id, e)
+            # Негативний кеш, щоб не повторювати запит на кожне повідомлення
+            self._admins[chat_id] = None
+            self._admins_expires[chat_id] = monotonic() + min(self.ttl, 60)
+            return None
+        snapshot = {m.user.id: m.status for m in admins}
+        self._admins[chat_id] = snapshot
+        self._admins_expires[chat_id] = monotonic() + self.ttl
+        logger.debug("Кеш статусів: чат %s — %s адмінів", chat_id, len(snapshot))
+        return snapshot
+
+    async def _admins_for(self, bot, chat_id: int):
+        if self._admins_expires.get(chat_id, 0) > monotonic():
+            return self._admins.get(chat_id)
+        # Одне оновлення на чат, навіть якщо одночасно прийшло багато повідомлень
+        task = self._refreshing.get(chat_id)
+        if task is None:
+            task = asyncio.ensure_future(self.refresh_admins(bot, chat_id))
+            self._refreshing[chat_id] = task
+            task.add_done_callback(lambda _t: self._refreshing.pop(chat_id, None))
+        return await asyncio.shield(task)
+
+    def apply_update(self, chat_id: int, user_id: int, status: str):
+        # Оновлення з ChatMemberHandler (підвищення/пониження/вихід)
+        admins = self._admins.get(chat_id)
+        if admins is not None:
+            if status in ADMIN_STATUSES:
+                admins[user_id] = status
+            else:
+                admins.pop(user_id, None)
+        key = (chat_id, user_id)
+        if key in self._entries:
+            self._remember(key, status, monotonic())
+
+    def prune(self) -> int:
+        now = monotonic()
+        expired = [key for key, (_, expires) in self._entries.items() if expires <= now]
+        for key in expired:
+            del self._entries[key]
+        return len(expired)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remember(self, key: tuple[int, int], status: str, now: float):
+        self._entries[key] = (status, now + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+member_cache = MemberStatusCache(MEMBER_CACHE_TTL_SECONDS, MEMBER_CACHE_MAX_ENTRIES)
+
+# ─── Серверні мути і блокування (restrict_chat_member, set_chat_permissions) ───
+async def restrict_member(bot, shard: ChatShard, user_id: int, until: datetime) -> bool:
+    # Доповнює soft-мут (він уже записаний): True — Telegram сам блокує повідомлення.
+    # Якщо бот не має прав, чат на RESTRICT_RETRY_SECONDS лишається на soft-мутах.
+    if MUTE_ENFORCEMENT != "restrict" or monotonic() < shard.restrict_blocked_until:
+        return False
+    try:
+        await bot.restrict_chat_member(shard.chat_id, user_id, ChatPermissions.no_permissions(), until_date=until)
+    except BadRequest as e:
+        RESTRICTIONS.inc("fallback")
+        text = str(e).lower()
+        if "administrator" in text or "owner" in text:
+            logger.info("Restrict %s у чаті %s неможливий (%s) — soft-мут", user_id, shard.chat_id, e)
+        else:
+            shard.restrict_blocked_until = monotonic() + RESTRICT_RETRY_SECONDS
+            logger.warning("Restrict у чаті %s не вдався: %s — soft-мути на %s с",
+                           shard.chat_id, e, RESTRICT_RETRY_SECONDS)
+        return False
+    except Forbidden as e:
+        RESTRICTIONS.inc("fallback")
+        shard.restrict_blocked_until = monotonic() + RESTRICT_RETRY_SECONDS
+        logger.warning("Restrict у чаті %s заборонено: %s — soft-мути на %s с", shard.chat_id, e, RESTRICT_RETRY_SECONDS)
+        return False
+    except TelegramError as e:
+        RESTRICTIONS.inc("fallback")
+        SWALLOWED_ERRORS.inc("restrict")
+        logger.warning("Restrict %s у чаті %s не вдався: %s — soft-мут", user_id, shard.chat_id, e)
+        return False
+    RESTRICTIONS.inc("applied")
+    shard.set_restricted(user_id, True)
+    return True
+
+async def lift_restriction(bot, shard: ChatShard, user_id: int, permissions: ChatPermissions | None = None) -> bool:
+    # Знімає лише обмеження, накладені ботом; діє і в soft-режимі (після перемикання з restrict).
+    # Користувач отримує поточні дозволи чату за замовчуванням, а не всі: інакше він міг би писати
+    # під час /lock. Поки чат заблоковано через set_chat_permissions, обмеження лишається
+    # (писати й так нікому не можна) — його знімає unlock_chat_permissions з відновленими дозволами
+    if user_id not in shard.restricted:
+        return False
+    try:
+        if permissions is None:
+            if shard.saved_permissions is not None:
+                return False
+            permissions = (await bot.get_chat(shard.chat_id)).permissions
+            if permissions is None:
+                logger.warning("Не вдалося зняти restrict з %s у чаті %s: невідомі дозволи чату",
+                               user_id, shard.chat_id)
+                return False
+        await bot.restrict_chat_member(shard.chat_id, user_id, permissions, use_independent_chat_permissions=True)
+    except TelegramError as e:
+        SWALLOWED_ERRORS.inc("restrict")
+        logger.warning("Не вдалося зняти restrict з %s у чаті %s: %s", user_id, shard.chat_id, e)
+        return False
+    RESTRICTIONS.inc("lifted")
+    shard.set_restricted(user_id, False)
+    return True
+
+async def reconcile_restrictions(bot, shard: ChatShard) -> dict[str, int]:
+    # Звіряє збережені мути з реальними обмеженнями в Telegram: накладає відсутні
+    # (режим restrict) і знімає ті, мут яких уже скасовано
+    result = {"ok": 0, "applied": 0, "lifted": 0, "skipped": 0}
+    shard.expire_due_mutes()
+    for user_id in sorted(set(shard.mutes) | shard.restricted):
+        async with shard.user_locks.hold(user_id):
+            until = shard.mutes.get(user_id)
+            if until is None:
+                if await lift_restriction(bot, shard, user_id):
+                    result["lifted"] += 1
+                continue
+            if MUTE_ENFORCEMENT != "restrict":
+                continue
+            try:
+                member = await bot.get_chat_member(shard.chat_id, user_id)
+            except TelegramError as e:
+                logger.debug("Звірка мутів: get_chat_member %s у чаті %s: %s", user_id, shard.chat_id, e)
+                result["skipped"] += 1
+                continue
+            if member.status in ADMIN_STATUSES:
+                result["skipped"] += 1
+            elif member.status == "restricted" and not member.can_send_messages:
+                shard.set_restricted(user_id, True)
+                result["ok"] += 1
+            elif await restrict_member(bot, shard, user_id, until):
+                result["applied"] += 1
+            else:
+                result["skipped"] += 1
+    return result
+
+async def lock_chat_permissions(bot, shard: ChatShard) -> bool:
+    # Забирає в учасників право писати на рівні Telegram; попередні дозволи чату
+    # зберігаються в meta шарда. False — прав немає, блокування тримається видаленням.
+    if shard.saved_permissions is not None:
+        return True
+    try:
+        chat = await bot.get_chat(shard.chat_id)
+        if chat.permissions is None:
+            return False
+        await bot.set_chat_permissions(shard.chat_id, ChatPermissions.no_permissions(),
+                                       use_independent_chat_permissions=True)
+    except TelegramError as e:
+        logger.warning("Чат %s: set_chat_permissions не вдався (%s) — блокування видаленням", shard.chat_id, e)
+        return False
+    shard.saved_permissions = chat.permissions.to_dict()
+    shard.store.mark_dirty("meta", 0)
+    return True
 
-# Антифлуд-ліміти
-DAILY_MESSAGE_LIMIT = int(os.getenv("DAILY_MESSAGE_LIMIT", 200))
-HOURLY_MESSAGE_LIMIT = int(os.getenv("HOURLY_MESSAGE_LIMIT", 100))
-HOURLY_MUTE_MINUTES = int(os.getenv("HOURLY_MUTE_MINUTES", 15))
-SHORT_TERM_MESSAGE_LIMIT = int(os.getenv("SHORT_TERM_MESSAGE_LIMIT", 10))
-SHORT_TERM_WINDOW_MINUTES = int(os.getenv("SHORT_TERM_WINDOW_MINUTES", 5))
-SHORT_TERM_MUTE_MINUTES = int(os.getenv("SHORT_TERM_MUTE_MINUTES", 3))
-VOICE_MUTE_MINUTES = int(os.getenv("VOICE_MUTE_MINUTES", 30))
-DAILY_MUTE_DAYS = int(os.getenv("DAILY_MUTE_DAYS", 7))
+async def unlock_chat_permissions(bot, shard: ChatShard) -> bool:
+    # Повертає дозволи, збережені при /lock; якщо не вдалося — вони лишаються для наступного /unlock
+    if shard.saved_permissions is None:
+        return True
+    permissions = ChatPermissions.de_json(shard.saved_permissions, bot)
+    try:
+        await bot.set_chat_permissions(shard.chat_id, permissions, use_independent_chat_permissions=True)
+    except TelegramError as e:
+        logger.warning("Чат %s: не вдалося відновити дозволи чату: %s", shard.chat_id, e)
+        return False
+    shard.saved_permissions = None
+    shard.store.mark_dirty("meta", 0)
+    # Мути, зняті під час блокування: обмеження лишалося до цього моменту (див. lift_restriction)
+    for user_id in sorted(shard.restricted - set(shard.mutes)):
+        await lift_restriction(bot, shard, user_id, permissions)
+    return True
 
-# Exempt опції
-EXEMPT_OWNER_ANTIFLOOD = os.getenv("EXEMPT_OWNER_ANTIFLOOD", "true").lower() == "true"
-EXEMPT_CREATOR_ANTIFLOOD = os.getenv("EXEMPT_CREATOR_ANTIFLOOD", "true").lower() == "true"
-EXEMPT_ADMIN_ANTIFLOOD = os.getenv("EXEMPT_ADMIN_ANTIFLOOD", "true").lower() == "true"
+async def reconcile_restrictions_job(context: ContextTypes.DEFAULT_TYPE):
+    for shard in list(shards.values()):
+        if not shard.mutes and not shard.restricted:
+            continue
+        result = await reconcile_restrictions(context.bot, shard)
+        logger.info(f"Чат {shard.chat_id}: звірка мутів з Telegram — збігаються {result['ok']}, "
+                    f"накладено {result['applied']}, знято {result['lifted']}, пропущено {result['skipped']}")
 
-# ─── Налаштування логування ───
-logger = logging.getLogger(__name__)
-handler = TimedRotatingFileHandler(
-    filename="bot_moderation.log",
-    when='midnight',
-    interval=1,
-    backupCount=30,
-    encoding='utf-8'
-)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+# ─── Детектор рейдів (автоблокування чату) ───
+RAID_RATE_WINDOW_SECONDS = 10  # повідомлень/с — середнє за вікно, щоб одна секунда-сплеск не блокувала чат
+RAID_CHECK_SECONDS = 30        # як часто перевіряти, чи рейд скінчився
+RAID_NEWCOMER_SECONDS = 3600   # «новий відправник» — учасник, що вступив не раніше ніж годину тому
+RAID_NEWCOMERS_MAX = 100_000
 
-# Динамічний рівень логування з .env
-LOGGER_LEVEL_STR = os.getenv("LOGGER_LEVEL", "INFO").upper()
-valid_levels = {
-    "DEBUG": logging.DEBUG,
-    "INFO": logging.INFO,
-    "WARNING": logging.WARNING,
-    "ERROR": logging.ERROR,
-    "CRITICAL": logging.CRITICAL
-}
-logger.setLevel(valid_levels.get(LOGGER_LEVEL_STR, logging.INFO))
-logger.info(f"Встановлено рівень логування: {LOGGER_LEVEL_STR}")
+class RaidDetector:
+    # Сукупна активність чату, а не окремих користувачів: 200 свіжих акаунтів по 2 повідомлення
+    # не зачіпають жодного персонального ліміту, але разом — рейд. O(1) на подію, пам'ять обмежена
+    # вікнами: секундні кошики за RAID_RATE_WINDOW_SECONDS, хвилина нових відправників і входів, година вступів.
+    # Новизна — за вступом, а не за лічильниками антифлуду: інакше після встановлення чи чистки даних
+    # «новими» були б усі, і великий чат блокувався б у перші ж хвилини.
+    def __init__(self):
+        self.seconds: deque[list[int]] = deque()  # [секунда, повідомлень]
+        self.messages = 0
+        self.new_senders: OrderedDict[int, int] = OrderedDict()  # user_id → коли вперше за хвилину
+        self.joins: OrderedDict[int, int] = OrderedDict()
+        self.newcomers: OrderedDict[int, int] = OrderedDict()  # user_id → коли вступив (за годину)
+        self.auto_locked = False
+        self.locked_at = 0
+        self.calm_since: int | None = None
+        self.suppressed_until = 0
+        self.busy = False  # блокування або зняття вже виконується
 
-# Фільтр для дозволених груп
-ALLOWED_GROUP_FILTER = filters.Chat(chat_id=ALLOWED_CHAT_IDS) & filters.ChatType.GROUPS
+    def _prune(self, now_ts: int):
+        cutoff = now_ts - RAID_RATE_WINDOW_SECONDS
+        while self.seconds and self.seconds[0][0] <= cutoff:
+            self.messages -= self.seconds.popleft()[1]
+        cutoff = now_ts - 60
+        for seen in (self.new_senders, self.joins):
+            while seen and next(iter(seen.values())) <= cutoff:
+                seen.popitem(last=False)
+        cutoff = now_ts - RAID_NEWCOMER_SECONDS
+        while self.newcomers and (next(iter(self.newcomers.values())) <= cutoff
+                                  or len(self.newcomers) > RAID_NEWCOMERS_MAX):
+            self.newcomers.popitem(last=False)
 
-# ─── JSON збереження ───
-DATA_DIR = Path("data")
-DATA_DIR.mkdir(exist_ok=True)
-DAILY_FILE = DATA_DIR / "daily_limits.json"
-HOURLY_FILE = DATA_DIR / "hourly_data.json"
-SHORT_FILE = DATA_DIR / "short_term_data.json"
-MUTES_FILE = DATA_DIR / "mutes.json"
+    def message(self, ts: int, user_id: int | None):
+        if self.seconds and self.seconds[-1][0] >= ts:
+            self.seconds[-1][1] += 1
+        else:
+            self.seconds.append([ts, 1])
+        self.messages += 1
+        if user_id in self.newcomers and user_id not in self.new_senders:
+            self.new_senders[user_id] = ts
 
-def save_json(path: Path, data):
-    logger.debug(f"Збереження JSON у файл {path}")
-    lock_path = path.with_suffix(path.suffix + ".lock")
-    try:
-        with FileLock(lock_path, timeout=3):
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False)
-    except Timeout:
-        logger.warning(f"Timeout lock для {path}")
-    except Exception as e:
-        logger.error(f"Помилка збереження {path}: {e}")
+    def join(self, user_id: int, ts: int):
+        if user_id not in self.joins:
+            self.joins[user_id] = ts
+        self.newcomers[user_id] = ts
+        self.newcomers.move_to_end(user_id)
 
-def load_json(path: Path, default={}):
-    logger.debug(f"Читання JSON з файлу {path}")
-    if not path.exists():
-        return default
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"Помилка читання {path}: {e}")
-        return default
+    def exceeded(self, limits: dict[str, int], now_ts: int, percent: int = 100) -> str | None:
+        # Перший перевищений поріг (текстом для сповіщення) або None; 0 у порозі вимикає перевірку
+        self._prune(now_ts)
+        checks = ((self.messages / RAID_RATE_WINDOW_SECONDS, limits["RAID_MESSAGES_PER_SECOND"], "{:.0f} повідомлень/с"),
+                  (len(self.new_senders), limits["RAID_NEW_SENDERS_PER_MINUTE"], "{} нових відправників за хвилину"),
+                  (len(self.joins), limits["RAID_JOINS_PER_MINUTE"], "{} входів за хвилину"))
+        for value, threshold, text in checks:
+            if threshold and value > threshold * percent / 100:
+                return text.format(value) + f" (поріг {threshold})"
+        return None
 
-# Завантаження даних при старті
-daily_limits = {}
-raw = load_json(DAILY_FILE)
-for k, v in raw.items():
-    try:
-        user_id = int(k)
-        entry_date = datetime.fromisoformat(v["date"]).date()
-        daily_limits[user_id] = {"date": entry_date, "count": int(v["count"])}
-    except Exception as e:
-        logger.warning(f"Помилка завантаження daily для {k}: {e}")
+    def calm(self, limits: dict[str, int], now_ts: int) -> bool:
+        # Гістерезис: знімаємо лише після RAID_CALM_MINUTES поспіль нижче RAID_RELEASE_PERCENT порогів
+        if self.exceeded(limits, now_ts, limits["RAID_RELEASE_PERCENT"]):
+            self.calm_since = None
+            return False
+        if self.calm_since is None:
+            self.calm_since = now_ts
+        hold = limits["RAID_CALM_MINUTES"] * 60
+        return now_ts - self.calm_since >= hold and now_ts - self.locked_at >= hold
 
-hourly_data = {}
-raw = load_json(HOURLY_FILE)
-for k, v in raw.items():
-    try:
-        user_id = int(k)
-        hourly_data[user_id] = [datetime.fromisoformat(t) for t in v]
-    except Exception as e:
-        logger.warning(f"Помилка завантаження hourly для {k}: {e}")
+def observe_raid(bot, shard: "ChatShard", message, user_id: int | None):
+    raid = shard.raid
+    ts = int(message.date.timestamp())
+    # Службове повідомлення про вступ — це вступ (як і chat_member), а не пост
+    if message.new_chat_members:
+        for member in message.new_chat_members:
+            raid.join(member.id, ts)
+    else:
+        raid.message(ts, user_id)
+    check_raid(bot, shard, ts)
 
-short_term_data = {}
-raw = load_json(SHORT_FILE)
-for k, v in raw.items():
-    try:
-        user_id = int(k)
-        short_term_data[user_id] = [datetime.fromisoformat(t) for t in v]
-    except Exception as e:
-        logger.warning(f"Помилка завантаження short_term для {k}: {e}")
+def check_raid(bot, shard: "ChatShard", now_ts: int):
+    raid = shard.raid
+    if raid.busy:
+        return
+    if raid.auto_locked:
+        raid.calm(shard.limits, now_ts)
+        return
+    if shard.locked or now_ts < raid.suppressed_until:
+        return
+    reason = raid.exceeded(shard.limits, now_ts)
+    if reason:
+        raid.busy = True
+        asyncio.ensure_future(raid_lockdown(bot, shard, reason, now_ts))
 
-mutes = {}
-raw_mutes = load_json(MUTES_FILE, default={})
-now = datetime.now(timezone.utc)
-for k, v in raw_mutes.items():
+async def raid_lockdown(bot, shard: "ChatShard", reason: str, now_ts: int):
+    raid = shard.raid
     try:
-        until = datetime.fromisoformat(v)
-        if until > now:
-            mutes[int(k)] = until
-    except Exception as e:
-        logger.warning(f"Помилка завантаження mute для {k}: {e}")
+        async with shard.lock:
+            if shard.locked:
+                return  # встигли заблокувати вручну
+            server_side = await lock_chat_permissions(bot, shard)
+            shard.set_locked(True)
+            raid.auto_locked = True
+            raid.locked_at = now_ts
+            raid.calm_since = None
+    finally:
+        raid.busy = False
+    RAID_LOCKDOWNS.inc("lock")
+    limits = shard.limits
+    logger.warning("Чат %s: рейд — %s; чат заблоковано (%s)", shard.chat_id, reason,
+                   "set_chat_permissions" if server_side else "видаленням")
+    # Одне сповіщення на рейд: далі бот не воює з кожним повідомленням, а чекає на затишшя
+    outbox.send(bot, OWNER_PRIVATE_ID,
+                f"🚨 Рейд у чаті {shard.chat_id}: {reason}.\n"
+                f"Чат заблоковано{'' if server_side else ' (без прав на дозволи чату — повідомлення видалятимуться)'}. "
+                f"Блокування зніметься само, коли {limits['RAID_CALM_MINUTES']} хв поспіль активність буде нижче "
+                f"{limits['RAID_RELEASE_PERCENT']}% порогів; /unlock у чаті — зняти зараз.")
+
+async def raid_release(bot, shard: "ChatShard"):
+    raid = shard.raid
+    async with shard.lock:
+        if not raid.auto_locked or not shard.locked:
+            raid.auto_locked = False
+            return
+        if not await unlock_chat_permissions(bot, shard):
+            return  # дозволи не повернулися — спробуємо на наступній перевірці
+        raid.auto_locked = False
+        shard.set_locked(False)
+    RAID_LOCKDOWNS.inc("release")
+    logger.info("Чат %s: рейд скінчився, автоблокування знято", shard.chat_id)
 
-logger.info(f"Завантажено: daily={len(daily_limits)}, hourly={len(hourly_data)}, short={len(short_term_data)}, active mutes={len(mutes)}")
+async def raid_job(context: ContextTypes.DEFAULT_TYPE):
+    # Під блокуванням через дозволи чату повідомлень немає — затишшя рахує ця перевірка
+    now_ts = int(datetime.now(timezone.utc).timestamp())
+    for shard in list(shards.values()):
+        raid = shard.raid
+        if not raid.auto_locked or raid.busy or not raid.calm(shard.limits, now_ts):
+            continue
+        raid.busy = True
+        try:
+            await raid_release(context.bot, shard)
+        finally:
+            raid.busy = False
 
-def save_daily():
-    data = {str(k): {"date": datetime.combine(v["date"], time(0, 0), tzinfo=timezone.utc).isoformat(), "count": v["count"]} for k, v in daily_limits.items()}
-    save_json(DAILY_FILE, data)
+# ─── Метрики: стан, інструментування, HTTP ───
+Gauge("abcwarrior_tracked_users", "Користувачі з антифлуд-лічильниками",
+      lambda: {(chat_id,): len(shard.rate_limiter.users) for chat_id, shard in shards.items()}, ("chat",))
+Gauge("abcwarrior_active_mutes", "Активні мути",
+      lambda: {(chat_id,): len(shard.mutes) for chat_id, shard in shards.items()}, ("chat",))
+Gauge("abcwarrior_pending_deletes", "Повідомлення в черзі на видалення",
+      lambda: {(chat_id,): len(shard.deletions) for chat_id, shard in shards.items()}, ("chat",))
+Gauge("abcwarrior_outbox_queue", "Повідомлення в черзі вихідних", lambda: {(): len(outbox)})
+Gauge("abcwarrior_member_cache_entries", "Записи точкового кешу статусів", lambda: {(): len(member_cache)})
 
-def save_hourly():
-    data = {str(k): [t.isoformat() for t in v] for k, v in hourly_data.items()}
-    save_json(HOURLY_FILE, data)
+class TimedRequest(BaseRequest):
+    # Обгортка над транспортом PTB: тривалість і помилки кожного виклику Bot API за методом
+    def __init__(self, inner: BaseRequest):
+        self.inner = inner
 
-def save_short():
-    data = {str(k): [t.isoformat() for t in v] for k, v in short_term_data.items()}
-    save_json(SHORT_FILE, data)
+    @property
+    def read_timeout(self):
+        return self.inner.read_timeout
 
-def save_mutes():
-    data = {str(k): v.isoformat() for k, v in mutes.items()}
-    save_json(MUTES_FILE, data)
+    async def initialize(self):
+        await self.inner.initialize()
 
-# Rate limit для приватних повідомлень
-last_private_msg: dict[int, datetime] = {}
+    async def shutdown(self):
+        await self.inner.shutdown()
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        api_method = url.rsplit("/", 1)[-1]
+        started = perf_counter()
+        try:
+            code, payload = await self.inner.do_request(url, method, request_data, **timeouts)
+        except Exception:
+            BOT_API_ERRORS.inc(api_method)
+            raise
+        finally:
+            BOT_API_SECONDS.observe(perf_counter() - started, api_method)
+        if code != 200:
+            BOT_API_ERRORS.inc(api_method)
+        return code, payload
+
+def timed_handler(callback):
+    name = callback.__name__
+
+    async def wrapper(update, context):
+        started = perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            HANDLER_SECONDS.observe(perf_counter() - started, name)
+    wrapper.__name__ = name
+    return wrapper
+
+async def serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    # Мінімальний HTTP/1.1: GET /metrics → текстовий формат Prometheus, решта → 404
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render_metrics().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        logger.debug("Метрики: з'єднання обірвано: %s", e)
+    finally:
+        writer.close()
+
+metrics_server: asyncio.AbstractServer | None = None
 
 # Error handler
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
-    logger.error(f"Exception while handling an update: {context.error}", exc_info=context.error)
+    SWALLOWED_ERRORS.inc("handler")
+    logger.error("Exception while handling an update: %s", context.error, exc_info=context.error)
 
 # Функції бота з debug-логуванням викликів
 async def delete_command_message(message):
     if not message or message.chat.type == "private":
         return
-    logger.debug(f"Спроба видалити команду {message.message_id} в чаті {message.chat.id}")
-    try:
-        await message.delete()
-        logger.info(f"Видалено команду {message.message_id} від {message.from_user.id if message.from_user else 'анонім'} в чаті {message.chat.id}")
-    except TelegramError as e:
-        logger.debug(f"Не вдалося видалити команду {message.message_id}: {e}")
+    logger.debug("Спроба видалити команду %s в чаті %s", message.message_id, message.chat.id)
+    if message.chat.id not in ALLOWED_CHAT_IDS:
+        try:
+            await message.delete()
+        except TelegramError as e:
+            logger.debug("Не вдалося видалити команду %s: %s", message.message_id, e)
+        return
+    queue_delete(message, "command", f"(команда від {message.from_user.id if message.from_user else 'анонім'})")
 
 async def reply_in_private(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, parse_mode=None):
     message = update.message
     if not message:
         return
     
-    logger.debug(f"reply_in_private викликано для повідомлення {message.message_id} в чаті {message.chat.id}")
+    logger.debug("reply_in_private викликано для повідомлення %s в чаті %s", message.message_id, message.chat.id)
 
     if OWNER_PRIVATE_ID != 0:
         if message.from_user is None:
@@ -194,51 +2702,41 @@ async def reply_in_private(update: Update, context: ContextTypes.DEFAULT_TYPE, t
             logger.debug("Від OWNER_ID — target_id = OWNER_PRIVATE_ID")
         else:
             target_id = message.from_user.id
-            logger.debug(f"Звичайний користувач — target_id = {target_id}")
+            logger.debug("Звичайний користувач — target_id = %s", target_id)
     else:
         if message.from_user is None:
             target_id = OWNER_ID
             logger.debug("Fallback: анонімне — target_id = OWNER_ID")
         else:
             target_id = message.from_user.id
-            logger.debug(f"Звичайний користувач — target_id = {target_id}")
+            logger.debug("Звичайний користувач — target_id = %s", target_id)
     
     if target_id is None or target_id == 0:
         logger.warning("Немає валідного target_id для надсилання")
         return
     
-    logger.debug(f"Надсилання в чат {target_id} (текст: {text[:50]}...)")
+    logger.debug("Надсилання в чат %s (текст: %s...)", target_id, text[:50])
 
     now = datetime.now(timezone.utc)
     # Rate limit НЕ застосовується до OWNER_ID та OWNER_PRIVATE_ID
     if target_id != OWNER_ID and target_id != OWNER_PRIVATE_ID:
         last = last_private_msg.get(target_id)
         if last and now - last < timedelta(minutes=1):
-            logger.info(f"Rate limit для чату {target_id}")
+            logger.info("Rate limit для чату %s", target_id)
             return
     
-    try:
-        await context.bot.send_message(
-            chat_id=target_id,
-            text=text,
-            parse_mode=parse_mode,
-            disable_notification=True
-        )
-        logger.debug(f"Успішно надіслано в чат {target_id}")
-    except TelegramError as e:
-        logger.warning(f"Не вдалося надіслати в чат {target_id}: {e}")
-        return
-    
-    # Оновлюємо timestamp тільки для не-власника
+    outbox.send(context.bot, target_id, text, parse_mode=parse_mode, disable_notification=True)
+
+    # Оновлюємо timestamp тільки для не-власника (в момент постановки в чергу)
     if target_id != OWNER_ID and target_id != OWNER_PRIVATE_ID:
         last_private_msg[target_id] = now
-        logger.debug(f"Оновлено timestamp rate limit для {target_id}")
+        logger.debug("Оновлено timestamp rate limit для %s", target_id)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message
     if not message:
         return
-    logger.debug(f"Команда /start від {message.from_user.id if message.from_user else 'анонім'} в чаті {message.chat.id}")
+    logger.debug("Команда /start від %s в чаті %s", message.from_user.id if message.from_user else 'анонім', message.chat.id)
     is_group = message.chat.type in ("group", "supergroup")
     text = (
         "Бот модерації активний!\n\n"
@@ -248,7 +2746,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         " /stats — статистика (завжди в приват)\n"
         " /test — тестова (не видаляється від власника)\n\n"
         "Для власника:\n"
-        " /mute15 /mute60 /mute24h /mute666 /unmute /listmute"
+        " /mute15 /mute60 /mute24h /mute666 /unmute /listmute [сторінка]"
     )
     if is_group:
         await delete_command_message(message)
@@ -259,126 +2757,143 @@ async def lock(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message
     if not message or not message.from_user:
         return
-    logger.debug(f"Команда /lock від {message.from_user.id} в чаті {message.chat.id}")
+    logger.debug("Команда /lock від %s в чаті %s", message.from_user.id, message.chat.id)
     await delete_command_message(message)
     user_id = message.from_user.id
     chat_id = message.chat.id
-    try:
-        member = await context.bot.get_chat_member(chat_id, user_id)
-        logger.debug(f"Статус користувача для /lock: {member.status}")
-        if member.status not in ("administrator", "creator"):
-            await reply_in_private(update, context, "Тільки адміни можуть використовувати цю команду.")
+    shard = get_shard(chat_id)
+    # /lock і /unlock одного чату виконуються в порядку надходження
+    async with shard.lock:
+        try:
+            status = await member_cache.get_status(context.bot, chat_id, user_id)
+            logger.debug("Статус користувача для /lock: %s", status)
+            if status not in ADMIN_STATUSES:
+                await reply_in_private(update, context, "Тільки адміни можуть використовувати цю команду.")
+                return
+        except Exception as e:
+            logger.error("/lock помилка перевірки статусу: %s", e)
             return
-    except Exception as e:
-        logger.error(f"/lock get_chat_member error: {e}")
-        return
-    global group_locked
-    group_locked = True
-    await reply_in_private(update, context, "Група заблокована (тільки адміни можуть писати).")
-    logger.info("Група заблокована")
+        server_side = await lock_chat_permissions(context.bot, shard)
+        # Ручне блокування автоматично не знімається
+        shard.raid.auto_locked = False
+        shard.set_locked(True)
+    if server_side:
+        await reply_in_private(update, context, "Група заблокована (тільки адміни можуть писати).")
+    else:
+        await reply_in_private(update, context, "Група заблокована (тільки адміни можуть писати). "
+                                                "Бот не зміг змінити дозволи чату — повідомлення видалятимуться.")
+    logger.info("Група %s заблокована (%s)", chat_id, "set_chat_permissions" if server_side else "видаленням")
 
 async def unlock(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message
     if not message or not message.from_user:
         return
-    logger.debug(f"Команда /unlock від {message.from_user.id} в чаті {message.chat.id}")
+    logger.debug("Команда /unlock від %s в чаті %s", message.from_user.id, message.chat.id)
     await delete_command_message(message)
     user_id = message.from_user.id
     chat_id = message.chat.id
-    try:
-        member = await context.bot.get_chat_member(chat_id, user_id)
-        logger.debug(f"Статус користувача для /unlock: {member.status}")
-        if member.status not in ("administrator", "creator"):
-            await reply_in_private(update, context, "Тільки адміни можуть використовувати цю команду.")
+    shard = get_shard(chat_id)
+    # /lock і /unlock одного чату виконуються в порядку надходження
+    async with shard.lock:
+        try:
+            status = await member_cache.get_status(context.bot, chat_id, user_id)
+            logger.debug("Статус користувача для /unlock: %s", status)
+            if status not in ADMIN_STATUSES:
+                await reply_in_private(update, context, "Тільки адміни можуть використовувати цю команду.")
+                return
+        except Exception as e:
+            logger.error("/unlock помилка перевірки статусу: %s", e)
             return
-    except Exception as e:
-        logger.error(f"/unlock get_chat_member error: {e}")
-        return
-    global group_locked
-    group_locked = False
-    await reply_in_private(update, context, "Група розблокована.")
-    logger.info("Група розблокована")
+        restored = await unlock_chat_permissions(context.bot, shard)
+        # Адмін зняв блокування сам — детектор рейдів не блокує знову, поки не мине RAID_CALM_MINUTES
+        shard.raid.auto_locked = False
+        shard.raid.suppressed_until = int(datetime.now(timezone.utc).timestamp()) + shard.limits["RAID_CALM_MINUTES"] * 60
+        shard.set_locked(False)
+    if restored:
+        await reply_in_private(update, context, "Група розблокована.")
+    else:
+        await reply_in_private(update, context, "Група розблокована, але бот не зміг повернути дозволи чату — "
+                                                "повторіть /unlock або поверніть їх вручну.")
+    logger.info("Група %s розблокована", chat_id)
 
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message
     if not message or not message.from_user:
         return
-    logger.debug(f"Команда /stats від {message.from_user.id} в чаті {message.chat.id}")
+    logger.debug("Команда /stats від %s в чаті %s", message.from_user.id, message.chat.id)
     await delete_command_message(message)
     chat_id = message.chat.id
     requester_id = message.from_user.id
     if message.reply_to_message and message.reply_to_message.from_user:
         target_user = message.reply_to_message.from_user
-        logger.debug(f"/stats у reply на {target_user.id}")
+        logger.debug("/stats у reply на %s", target_user.id)
     else:
         target_user = message.from_user
         logger.debug("/stats своя статистика")
     target_id = target_user.id
     if target_id != requester_id:
         try:
-            member = await context.bot.get_chat_member(chat_id, requester_id)
-            if member.status not in ("administrator", "creator"):
+            status = await member_cache.get_status(context.bot, chat_id, requester_id)
+            if status not in ADMIN_STATUSES:
                 await reply_in_private(update, context,
                                       "Ви можете переглядати тільки свою статистику або в reply на повідомлення іншого користувача.")
                 return
         except Exception as e:
-            logger.error(f"/stats перевірка прав: {e}")
+            logger.error("/stats перевірка прав: %s", e)
             return
+    shard = get_shard(chat_id)
+    limits = shard.limits
     now = datetime.now(timezone.utc)
-    short_list = short_term_data.get(target_id, [])
-    cutoff_short = now - timedelta(minutes=SHORT_TERM_WINDOW_MINUTES)
-    filtered_short = [t for t in short_list if t >= cutoff_short]
-    short_count = len(filtered_short)
-    if len(filtered_short) != len(short_list):
-        short_term_data[target_id] = filtered_short
-        save_short()
-        logger.debug(f"Очищено short_term для {target_id}")
-    hourly_list = hourly_data.get(target_id, [])
-    cutoff_hour = now - timedelta(hours=1)
-    filtered_hourly = [t for t in hourly_list if t >= cutoff_hour]
-    hourly_count = len(filtered_hourly)
-    if len(filtered_hourly) != len(hourly_list):
-        hourly_data[target_id] = filtered_hourly
-        save_hourly()
-        logger.debug(f"Очищено hourly для {target_id}")
-    today_count = daily_limits.get(target_id, {"count": 0})["count"]
+    counts = shard.rate_limiter.counts(target_id, int(now.timestamp()), now.date().toordinal())
     user_mention = f"{target_user.full_name} (id {target_id})"
     text = (
         f"Статистика для {user_mention}:\n\n"
-        f"Сьогодні: {today_count} / {DAILY_MESSAGE_LIMIT}\n"
-        f"Остання година: {hourly_count} / {HOURLY_MESSAGE_LIMIT}\n"
-        f"Останні {SHORT_TERM_WINDOW_MINUTES} хв: {short_count} / {SHORT_TERM_MESSAGE_LIMIT}\n"
-        f"Група: {'Заблокована' if group_locked else 'Розблокована'}"
+        f"Сьогодні: {counts['daily']} / {limits['DAILY_MESSAGE_LIMIT']}\n"
+        f"Остання година: {counts['hourly']} / {limits['HOURLY_MESSAGE_LIMIT']}\n"
+        f"Останні {limits['SHORT_TERM_WINDOW_MINUTES']} хв: {counts['short']} / {limits['SHORT_TERM_MESSAGE_LIMIT']}\n"
     )
+    for tier in shard.rate_limiter.tiers:
+        if tier.name.startswith("extra_"):
+            text += f"Останні {format_window(tier.window)}: {counts[tier.name]} / {tier.limit}\n"
+    text += f"Група: {'Заблокована' if shard.locked else 'Розблокована'}"
+    if shard.raid.auto_locked:
+        text += " (автоматично, рейд)"
     if target_id != OWNER_ID:
-        if target_id in mutes:
-            mute_until = mutes[target_id]
-            if now < mute_until:
-                remaining = mute_until - now
-                total_minutes = int(remaining.total_seconds() / 60)
-                if total_minutes <= 0:
-                    del mutes[target_id]
-                    save_mutes()
-                else:
-                    hours = total_minutes // 60
-                    minutes = total_minutes % 60
-                    time_left = ""
-                    if hours > 0:
-                        time_left += f"{hours} год "
-                    time_left += f"{minutes} хв"
-                    text += f"\n\n🔒 Ви під мутом ще на {time_left.strip()}"
-            else:
-                del mutes[target_id]
-                save_mutes()
+        mute_until = shard.mutes.get(target_id)
+        if mute_until and now < mute_until:
+            total_minutes = int((mute_until - now).total_seconds() / 60)
+            if total_minutes > 0:
+                hours = total_minutes // 60
+                minutes = total_minutes % 60
+                time_left = ""
+                if hours > 0:
+                    time_left += f"{hours} год "
+                time_left += f"{minutes} хв"
+                text += f"\n\n🔒 Ви під мутом ще на {time_left.strip()}"
+        elif mute_until:
+            shard.expire_due_mutes()
         else:
             text += "\n\nСтатус мута: активний відсутній"
+    elif requester_id == OWNER_ID:
+        # Власнику — ще й підсумок по всіх чатах (у режимі WORKERS — з усіх обробників)
+        parts, complete = await collect("summary")
+        parts = [part for part in parts if part]
+        text += (
+            f"\n\nУсі чати: {sum(part['chats'] for part in parts)}, "
+            f"користувачів у пам'яті {sum(part['users'] for part in parts)}, "
+            f"мутів {sum(part['mutes'] for part in parts)}, "
+            f"заблоковано {sum(part['locked'] for part in parts)}, "
+            f"у черзі відправки {sum(part['outbox'] for part in parts)}"
+        )
+        if not complete:
+            text += " (не всі обробники відповіли)"
     await reply_in_private(update, context, text)
 
 async def test_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message
     if not message or not message.from_user:
         return
-    logger.debug(f"Команда /test від {message.from_user.id} в чаті {message.chat.id}")
+    logger.debug("Команда /test від %s в чаті %s", message.from_user.id, message.chat.id)
     user_id = message.from_user.id
     if user_id == OWNER_ID:
         await message.reply_text("Тест OK від власника")
@@ -387,17 +2902,23 @@ async def test_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await reply_in_private(update, context, "Команда /test доступна тільки для власника")
 
 async def manual_mute(context: ContextTypes.DEFAULT_TYPE, chat_id: int, target_id: int, minutes: int, reason: str):
-    logger.debug(f"Ручний мут {target_id} на {minutes} хв (причина: {reason})")
-    mute_until = datetime.now(timezone.utc) + timedelta(minutes=minutes)
-    mutes[target_id] = mute_until
-    save_mutes()
-    logger.info(f"Ручний мут {target_id} на {minutes} хв у чаті {chat_id}: {reason}")
+    logger.debug("Ручний мут %s на %s хв (причина: %s)", target_id, minutes, reason)
+    shard = get_shard(chat_id)
+    # Чекаємо, поки повідомлення цього користувача, що вже обробляється, не завершиться,
+    # інакше автоматичний мут з нього перезаписав би ручний
+    async with shard.user_locks.hold(target_id):
+        mute_until = datetime.now(timezone.utc) + timedelta(minutes=minutes)
+        shard.mute(target_id, mute_until)
+        restricted = await restrict_member(context.bot, shard, target_id, mute_until)
+    MUTES.inc("manual")
+    logger.info("Ручний мут %s на %s хв у чаті %s (%s): %s", target_id, minutes, chat_id,
+                "restrict" if restricted else "soft", reason)
 
 async def mute15(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message
     if not message:
         return
-    logger.debug(f"Команда /mute15 від {message.from_user.id}")
+    logger.debug("Команда /mute15 від %s", message.from_user.id)
     await delete_command_message(message)
     if message.from_user.id != OWNER_ID:
         return
@@ -413,7 +2934,7 @@ async def mute60(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message
     if not message:
         return
-    logger.debug(f"Команда /mute60 від {message.from_user.id}")
+    logger.debug("Команда /mute60 від %s", message.from_user.id)
     await delete_command_message(message)
     if message.from_user.id != OWNER_ID:
         return
@@ -429,7 +2950,7 @@ async def mute24h(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message
     if not message:
         return
-    logger.debug(f"Команда /mute24h від {message.from_user.id}")
+    logger.debug("Команда /mute24h від %s", message.from_user.id)
     await delete_command_message(message)
     if message.from_user.id != OWNER_ID:
         return
@@ -445,7 +2966,7 @@ async def mute666(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message
     if not message:
         return
-    logger.debug(f"Команда /mute666 від {message.from_user.id}")
+    logger.debug("Команда /mute666 від %s", message.from_user.id)
     await delete_command_message(message)
     if message.from_user.id != OWNER_ID:
         return
@@ -461,7 +2982,7 @@ async def unmute(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message
     if not message:
         return
-    logger.debug(f"Команда /unmute від {message.from_user.id}")
+    logger.debug("Команда /unmute від %s", message.from_user.id)
     await delete_command_message(message)
     if message.from_user.id != OWNER_ID:
         return
@@ -470,21 +2991,16 @@ async def unmute(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     target_id = message.reply_to_message.from_user.id
     target_name = message.reply_to_message.from_user.full_name
-    if target_id in mutes:
-        del mutes[target_id]
-        save_mutes()
-        if target_id in short_term_data:
-            del short_term_data[target_id]
-            save_short()
-            logger.info(f"Short-term data очищено для {target_id} після /unmute")
-        if target_id in hourly_data:
-            del hourly_data[target_id]
-            save_hourly()
-            logger.info(f"Hourly data очищено для {target_id} після /unmute")
-        if target_id in daily_limits:
-            del daily_limits[target_id]
-            save_daily()
-            logger.info(f"Daily limits очищено для {target_id} після /unmute")
+    shard = get_shard(message.chat.id)
+    async with shard.user_locks.hold(target_id):
+        cleared = shard.mute_scheduler.clear(target_id)
+        await lift_restriction(context.bot, shard, target_id)
+        if cleared:
+            shard.store.mark_dirty("mutes", target_id)
+            if shard.rate_limiter.forget(target_id):
+                shard.store.mark_dirty("rates", target_id)
+                logger.info("Лічильники антифлуду очищено для %s після /unmute", target_id)
+    if cleared:
         await reply_in_private(update, context,
             f"Мут знято з {target_name} (id {target_id}).\n"
             f"Очищено всі лічильники антифлуду (short_term, hourly, daily).")
@@ -496,129 +3012,171 @@ async def listmute(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message
     if not message:
         return
-    logger.debug(f"Команда /listmute від {message.from_user.id}")
+    logger.debug("Команда /listmute від %s", message.from_user.id)
     await delete_command_message(message)
     if message.from_user.id != OWNER_ID:
         return
-    if not mutes:
+    # Мути всіх чатів (у режимі WORKERS — з усіх обробників), злиті за часом завершення
+    try:
+        page = max(int(context.args[0]), 1) if context.args else 1
+    except ValueError:
+        page = 1
+    parts, complete = await collect("mutes", limit=page * LISTMUTE_PAGE_SIZE)
+    parts = [part for part in parts if part]
+    total = sum(part["total"] for part in parts)
+    if not total:
         await reply_in_private(update, context, "Наразі немає замучених користувачів.")
         return
-    lines = ["Поточні мути:"]
-    now = datetime.now(timezone.utc)
-    cleaned = False
-    for uid in list(mutes.keys()):
-        until = mutes[uid]
-        remaining = until - now
-        if remaining.total_seconds() <= 0:
-            del mutes[uid]
-            cleaned = True
-            continue
-        minutes_left = int(remaining.total_seconds() / 60)
+    pages = (total + LISTMUTE_PAGE_SIZE - 1) // LISTMUTE_PAGE_SIZE
+    page = min(page, pages)
+    offset = (page - 1) * LISTMUTE_PAGE_SIZE
+    merged = heapq.merge(*(part["entries"] for part in parts))
+    now = datetime.now(timezone.utc).timestamp()
+    show_chat = sum(part["chats"] for part in parts) > 1
+    lines = [f"Поточні мути (сторінка {page}/{pages}, всього {total}):"]
+    for until, uid, mute_chat_id in islice(merged, offset, offset + LISTMUTE_PAGE_SIZE):
+        minutes_left = int((until - now) / 60)
         hours = minutes_left // 60
         mins = minutes_left % 60
         time_str = f"{hours} год {mins} хв" if hours else f"{mins} хв"
-        lines.append(f"• id {uid} — залишилось {time_str}")
-    if cleaned:
-        save_mutes()
-    if len(lines) == 1:
-        await reply_in_private(update, context, "Наразі немає активних мутів.")
-    else:
-        await reply_in_private(update, context, "\n".join(lines))
+        where = f" (чат {mute_chat_id})" if show_chat else ""
+        lines.append(f"• id {uid}{where} — залишилось {time_str}")
+    if page < pages:
+        lines.append(f"\nДалі: /listmute {page + 1}")
+    if not complete:
+        lines.append("\n(не всі обробники відповіли — показано лише частину чатів)")
+    await reply_in_private(update, context, "\n".join(lines))
+
+TOP_WINDOW_TITLES = {"hour": "Остання година", "day": "Остання доба", "week": "Останній тиждень"}
+
+async def top(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message = update.message
+    if not message:
+        return
+    logger.debug("Команда /top від %s", message.from_user.id)
+    await delete_command_message(message)
+    if message.from_user.id != OWNER_ID:
+        return
+    try:
+        n = min(max(int(context.args[0]), 1), TOP_SKETCH_SIZE) if context.args else 10
+    except ValueError:
+        n = 10
+    shard = get_shard(message.chat.id)
+    now_ts = int(datetime.now(timezone.utc).timestamp())
+    lines = [f"Найактивніші в чаті {shard.chat_id} (топ-{n}):"]
+    approximate = False
+    for name, title in TOP_WINDOW_TITLES.items():
+        lines.append(f"\n{title}:")
+        entries = shard.top.top(name, n, now_ts)
+        if not entries:
+            lines.append("— немає повідомлень")
+        for place, (user_id, count, error) in enumerate(entries, 1):
+            approximate = approximate or error > 0
+            lines.append(f"{place}. id {user_id} — {'≈' if error else ''}{count}")
+    if approximate:
+        lines.append(f"\n≈ — оцінка зверху: у кошику пам'ятаються лише {TOP_SKETCH_SIZE} найактивніших (TOP_SKETCH_SIZE)")
+    await reply_in_private(update, context, "\n".join(lines))
 
 async def apply_soft_mute(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int,
-                         minutes: int, reason: str, mention_name: str = None):
+                         minutes: int, reason: str, mention_name: str = None, kind: str = "other"):
     if user_id is None:
         return
-    logger.debug(f"Застосування soft-mute для {user_id} на {minutes} хв (причина: {reason})")
+    MUTES.inc(kind)
+    logger.debug("Застосування soft-mute для %s на %s хв (причина: %s)", user_id, minutes, reason)
     mute_until = datetime.now(timezone.utc) + timedelta(minutes=minutes)
-    mutes[user_id] = mute_until
-    save_mutes()
-    mention = f"<a href=\"tg://user?id={user_id}\">{mention_name or 'Користувач'}</a>"
-    try:
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text=f"{mention} обмежено на {minutes} хв за: {reason}\nПовідомлення видалятимуться.",
-            parse_mode="HTML",
-            disable_notification=True
-        )
-    except:
-        pass
-    try:
-        await context.bot.send_message(
-            chat_id=user_id,
-            text=f"Тебе обмежено в групі на {minutes} хвилин за: {reason}."
-        )
-    except:
-        pass
-    logger.info(f"Soft-mute {user_id} → {minutes} хв: {reason}")
-
-group_locked = False
+    shard = get_shard(chat_id)
+    shard.mute(user_id, mute_until)
+    restricted = await restrict_member(context.bot, shard, user_id, mute_until)
+    mention = f"<a href=\"tg://user?id={user_id}\">{html.escape(mention_name or 'Користувач')}</a>"
+    # Сповіщення в групу зливаються з іншими мутами цього чату в одне повідомлення
+    outbox.notify_mute(context.bot, chat_id, f"{mention} обмежено на {minutes} хв за: {reason}")
+    outbox.send(context.bot, user_id, f"Тебе обмежено в групі на {minutes} хвилин за: {reason}.")
+    logger.info("Мут %s → %s хв (%s): %s", user_id, minutes, "restrict" if restricted else "soft", reason)
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    global group_locked, daily_limits, hourly_data, short_term_data, mutes
     message = update.message
     if not message:
         return
     chat_id = message.chat.id
     if chat_id not in ALLOWED_CHAT_IDS:
-        logger.debug(f"Ігнор повідомлення в недозволеному чаті {chat_id}")
+        logger.debug("Ігнор повідомлення в недозволеному чаті %s", chat_id)
+        return
+    shard = get_shard(chat_id)
+    if message.media_group_id and ALBUM_BUFFER_MS > 0:
+        # Решту альбому чекаємо у фоні: весь альбом — одна перевірка і один запис у лічильники
+        if shard.albums.add(message, lambda parts: moderate_album(parts, context, shard)):
+            logger.debug("Альбом %s: збираємо частини", message.media_group_id)
         return
+    user_id = message.from_user.id if message.from_user else None
+    # Повідомлення одного користувача — строго по черзі (лічильники, мут), різних — паралельно
+    async with shard.user_locks.hold(user_id):
+        await moderate_message(message, context, shard)
+
+async def moderate_album(parts: list, context: ContextTypes.DEFAULT_TYPE, shard: ChatShard):
+    message = parts[0]
+    user_id = message.from_user.id if message.from_user else None
+    logger.debug("Альбом %s: %s частин як один пост", message.media_group_id, len(parts))
+    async with shard.user_locks.hold(user_id):
+        await moderate_message(message, context, shard, parts)
+
+async def moderate_message(message, context: ContextTypes.DEFAULT_TYPE, shard: ChatShard, album: list = None):
+    chat_id = shard.chat_id
     current_time = message.date
     user_id = message.from_user.id if message.from_user else None
     is_anonymous = user_id is None
-    logger.debug(f"=== Обробка повідомлення {message.message_id} від user_id={user_id} (анонім: {is_anonymous}) в чаті {chat_id} ===")
-    logger.debug(f"Дата повідомлення: {current_time}")
+    logger.debug("=== Обробка повідомлення %s від user_id=%s (анонім: %s) в чаті %s ===", message.message_id, user_id, is_anonymous, chat_id)
 
-    if user_id and user_id in mutes:
-        if datetime.now(timezone.utc) < mutes[user_id]:
-            logger.debug(f"Користувач {user_id} під мутом — видаляємо")
-            try:
-                await message.delete()
-                logger.info(f"Видалено повідомлення {message.message_id} від {user_id} (під мутом)")
-            except:
-                pass
+    def drop(reason: str, note: str):
+        # Альбом видаляється цілком, в одному пакеті delete_messages
+        for part in album or (message,):
+            queue_delete(part, reason, note)
+
+    if user_id:
+        # Статистика /top рахує кожен пост (альбом — один), навіть видалений чи від exempt
+        # Скетч зберігається при зміні кошика і при зупинці, а не на кожне повідомлення:
+        # після збою втрачається щонайбільше поточний 10-хвилинний кошик
+        if shard.top.add(user_id, int(current_time.timestamp())):
+            shard.store.mark_dirty("senders", 0)
+    observe_raid(context.bot, shard, message, user_id)
+    logger.debug("Дата повідомлення: %s", current_time)
+
+    if user_id and user_id in shard.mutes:
+        if datetime.now(timezone.utc) < shard.mutes[user_id]:
+            logger.debug("Користувач %s під мутом — видаляємо", user_id)
+            drop("muted", f"від {user_id} (під мутом)")
             return
         else:
-            logger.info(f"Мут для {user_id} експірувався")
-            del mutes[user_id]
-            save_mutes()
-            if user_id in short_term_data:
-                del short_term_data[user_id]
-                save_short()
-            if user_id in hourly_data:
-                del hourly_data[user_id]
-                save_hourly()
-
-    if group_locked:
+            shard.expire_due_mutes()
+
+    # Заблоковано через set_chat_permissions — не-адміни писати не можуть, перевіряти нічого
+    if shard.locked and shard.saved_permissions is None:
         logger.debug("Група заблокована — перевірка статусу")
         try:
-            member = await context.bot.get_chat_member(chat_id, user_id) if user_id else None
-            is_admin = member and member.status in ("administrator", "creator")
+            status = await member_cache.get_status(context.bot, chat_id, user_id) if user_id else None
+            is_admin = status in ADMIN_STATUSES
             if not is_admin:
-                logger.debug(f"Не-адмін {user_id} в заблокованій групі — видаляємо")
-                await message.delete()
-                logger.info(f"Видалено повідомлення {message.message_id} від {user_id} (група заблокована)")
+                logger.debug("Не-адмін %s в заблокованій групі — видаляємо", user_id)
+                drop("locked", f"від {user_id} (група заблокована)")
                 return
-        except:
-            await message.delete()
-            logger.info(f"Видалено повідомлення {message.message_id} (помилка перевірки статусу в locked групі)")
+        except Exception as e:
+            SWALLOWED_ERRORS.inc("locked_status")
+            logger.debug("Помилка перевірки статусу %s в locked групі: %s", user_id, e)
+            drop("locked", "(помилка перевірки статусу в locked групі)")
             return
 
     if message.voice:
         logger.debug("Голосове повідомлення — видаляємо")
-        try:
-            await message.delete()
-            logger.info(f"Видалено голосове {message.message_id} від {user_id}")
-        except:
-            pass
+        drop("voice", f"від {user_id} (голосове)")
         if not is_anonymous and user_id:
             try:
-                member = await context.bot.get_chat_member(chat_id, user_id)
-                if member.status not in ("administrator", "creator"):
+                status = await member_cache.get_status(context.bot, chat_id, user_id)
+                if status not in ADMIN_STATUSES:
                     display_name = message.from_user.full_name
-                    await apply_soft_mute(context, chat_id, user_id, VOICE_MUTE_MINUTES, "голосове повідомлення", display_name)
-            except:
-                pass
+                    await apply_soft_mute(context, chat_id, user_id, shard.limits["VOICE_MUTE_MINUTES"], "голосове повідомлення",
+                                          display_name, kind="voice")
+            except Exception as e:
+                SWALLOWED_ERRORS.inc("voice_mute")
+                logger.debug("Не вдалося замутити %s за голосове: %s", user_id, e)
         return
 
     if is_anonymous:
@@ -627,11 +3185,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     logger.debug("Перевірка exempt")
     try:
-        member = await context.bot.get_chat_member(chat_id, user_id)
-        status = member.status
-        logger.debug(f"Статус {user_id}: {status}")
+        status = await member_cache.get_status(context.bot, chat_id, user_id)
+        logger.debug("Статус %s: %s", user_id, status)
     except Exception as e:
-        logger.debug(f"Помилка отримання статусу {user_id}: {e}")
+        SWALLOWED_ERRORS.inc("exempt_status")
+        logger.debug("Помилка отримання статусу %s: %s", user_id, e)
         status = None
 
     exempt = False
@@ -645,73 +3203,460 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         exempt = True
         logger.debug("Exempt: admin")
     if exempt:
-        logger.debug(f"{user_id} exempt — пропуск")
+        logger.debug("%s exempt — пропуск", user_id)
         return
 
-    short_term_data.setdefault(user_id, []).append(current_time)
-    cutoff = current_time - timedelta(minutes=SHORT_TERM_WINDOW_MINUTES)
-    short_term_data[user_id] = [t for t in short_term_data[user_id] if t >= cutoff]
-    logger.debug(f"Short_term для {user_id}: {len(short_term_data[user_id])}")
-    if len(short_term_data[user_id]) > SHORT_TERM_MESSAGE_LIMIT:
-        logger.debug(f"Короткостроковий флуд {user_id}")
+    tier = shard.rate_limiter.hit(user_id, int(current_time.timestamp()), current_time.date().toordinal())
+    shard.store.mark_dirty("rates", user_id)
+    if tier is not None:
+        logger.debug("Флуд %s: рівень %s", user_id, tier.name)
+        drop("flood", f"від {user_id} ({tier.name} флуд)")
         display_name = message.from_user.full_name
-        await apply_soft_mute(context, chat_id, user_id, SHORT_TERM_MUTE_MINUTES,
-                              f"флуд >{SHORT_TERM_MESSAGE_LIMIT} за {SHORT_TERM_WINDOW_MINUTES} хв", display_name)
-        try:
-            await message.delete()
-            logger.info(f"Видалено {message.message_id} від {user_id} (short флуд)")
-        except:
-            pass
-        save_short()
+        await apply_soft_mute(context, chat_id, user_id, tier.mute_minutes, tier.reason, display_name, kind=tier.name)
         return
 
-    hourly_data.setdefault(user_id, []).append(current_time)
-    cutoff_hour = current_time - timedelta(hours=1)
-    hourly_data[user_id] = [t for t in hourly_data[user_id] if t >= cutoff_hour]
-    logger.debug(f"Hourly для {user_id}: {len(hourly_data[user_id])}")
-    if len(hourly_data[user_id]) > HOURLY_MESSAGE_LIMIT:
-        logger.debug(f"Годинний флуд {user_id}")
-        display_name = message.from_user.full_name
-        await apply_soft_mute(context, chat_id, user_id, HOURLY_MUTE_MINUTES,
-                              f"флуд >{HOURLY_MESSAGE_LIMIT} за годину", display_name)
-        try:
-            await message.delete()
-            logger.info(f"Видалено {message.message_id} від {user_id} (hourly флуд)")
-        except:
-            pass
-        save_hourly()
+    logger.debug("Повідомлення %s оброблено нормально", message.message_id)
+
+async def track_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    change = update.chat_member
+    if not change:
+        return
+    chat_id = change.chat.id
+    if chat_id not in ALLOWED_CHAT_IDS:
         return
+    user_id = change.new_chat_member.user.id
+    old_status = change.old_chat_member.status
+    new_status = change.new_chat_member.status
+    if old_status != new_status:
+        logger.info("Статус %s в чаті %s: %s → %s", user_id, chat_id, old_status, new_status)
+    member_cache.apply_update(chat_id, user_id, new_status)
+    if old_status in ("left", "kicked") and new_status in ("member", "restricted"):
+        shard = get_shard(chat_id)
+        shard.raid.join(user_id, int(change.date.timestamp()))
+        check_raid(context.bot, shard, int(change.date.timestamp()))
 
-    today = current_time.date()
-    if user_id not in daily_limits:
-        daily_limits[user_id] = {"date": today, "count": 1}
-        logger.debug(f"Новий daily для {user_id}: 1")
-    else:
-        entry = daily_limits[user_id]
-        if entry["date"] != today:
-            entry["date"] = today
-            entry["count"] = 1
-            logger.debug(f"Ролловер daily для {user_id}")
-        else:
-            entry["count"] += 1
-            logger.debug(f"Daily для {user_id}: {entry['count']}")
-    if daily_limits[user_id]["count"] > DAILY_MESSAGE_LIMIT:
-        logger.debug(f"Денний флуд {user_id}")
-        display_name = message.from_user.full_name
-        await apply_soft_mute(context, chat_id, user_id, DAILY_MUTE_DAYS * 1440,
-                              f"флуд >{DAILY_MESSAGE_LIMIT} за день", display_name)
-        try:
-            await message.delete()
-            logger.info(f"Видалено {message.message_id} від {user_id} (daily флуд)")
-        except:
-            pass
-        save_daily()
+async def flush_state_job(context: ContextTypes.DEFAULT_TYPE):
+    # Кожен чат пишеться у власне сховище незалежно від інших. shard.lock не беремо: запис іде
+    # в потоці і серіалізується власними lock'ами WriteBehindStore, а /lock, /unlock і блокування
+    # рейду не мають чекати на диск
+    await asyncio.gather(*(shard.store.flush() for shard in list(shards.values())))
+
+# Лічильники прибирання: resident — скільки записів у пам'яті зараз, решта — скільки видалено всього
+SWEEP_STATS = {"resident_rates": 0, "resident_private": 0, "resident_member_cache": 0,
+               "cleared_windows": 0, "evicted_idle": 0, "evicted_lru": 0,
+               "evicted_private": 0, "evicted_member_cache": 0}
+
+async def sweep_state():
+    now = datetime.now(timezone.utc)
+    cleared = idle = lru = 0
+    for shard in list(shards.values()):
+        async with shard.lock:
+            shard_cleared, shard_idle, shard_lru = shard.sweep(now)
+        cleared += shard_cleared
+        idle += shard_idle
+        lru += shard_lru
+    private_cutoff = now - timedelta(minutes=1)
+    stale_private = [uid for uid, ts in last_private_msg.items() if ts < private_cutoff]
+    for uid in stale_private:
+        del last_private_msg[uid]
+    cache_pruned = member_cache.prune()
+    buckets_pruned = outbox.prune()
+    resident_rates = sum(len(shard.rate_limiter.users) for shard in shards.values())
+    hydrated = sum(shard.rate_limiter.hydrated for shard in shards.values())
+    SWEEP_STATS["cleared_windows"] += cleared
+    SWEEP_STATS["evicted_idle"] += idle
+    SWEEP_STATS["evicted_lru"] += lru
+    SWEEP_STATS["evicted_private"] += len(stale_private)
+    SWEEP_STATS["evicted_member_cache"] += cache_pruned
+    SWEEP_STATS["resident_rates"] = resident_rates
+    SWEEP_STATS["resident_private"] = len(last_private_msg)
+    SWEEP_STATS["resident_member_cache"] = len(member_cache)
+    logger.info(f"Прибирання: вікон очищено {cleared}, неактивних видалено {idle}, LRU {lru}, "
+                f"private {len(stale_private)}, кеш статусів {cache_pruned} | у пам'яті: rates={resident_rates} "
+                f"(зі знімка декодовано {hydrated}), "
+                f"private={len(last_private_msg)}, кеш={len(member_cache)}")
+    logger.info(f"Пакетне видалення: {delete_stats_summary()}")
+    logger.info(f"Черга вихідних: у черзі {len(outbox)}, надіслано {OUTBOX_STATS['sent']}, "
+                f"злито мутів {OUTBOX_STATS['coalesced']}, RetryAfter {OUTBOX_STATS['retry_after']}, "
+                f"помилок {OUTBOX_STATS['failed']}, відкинуто {OUTBOX_STATS['dropped']}, бакетів прибрано {buckets_pruned}")
+
+async def sweep_job(context: ContextTypes.DEFAULT_TYPE):
+    await sweep_state()
+
+# ─── Перезавантаження конфігурації (/reloadconfig, SIGHUP) ───
+EXEMPT_KEYS = ("EXEMPT_OWNER_ANTIFLOOD", "EXEMPT_CREATOR_ANTIFLOOD", "EXEMPT_ADMIN_ANTIFLOOD")
+
+def reload_config() -> dict:
+    # Перечитує .env і підміняє ліміти, EXTRA_RATE_TIERS, CHAT_LIMITS, exempt-прапорці та список чатів.
+    # Лічильники й мути лишаються в пам'яті. Спершу розбирається все: якщо хоч щось не так —
+    # ValueError, і чинна конфігурація не змінюється. Решта параметрів — лише після перезапуску.
+    global ALLOWED_CHAT_IDS, DEFAULT_LIMITS, EXTRA_RATE_TIERS, CHAT_LIMITS, RATE_RETENTION_SECONDS
+    global EXEMPT_OWNER_ANTIFLOOD, EXEMPT_CREATOR_ANTIFLOOD, EXEMPT_ADMIN_ANTIFLOOD
+    env = {key: value for key, value in dotenv_values(find_dotenv()).items() if value is not None}
+    env.update(PROCESS_ENV)
+    allowed = parse_chat_ids(env.get("ALLOWED_CHAT_IDS", ""))
+    limits = read_limits(env)
+    extra = parse_extra_rate_tiers(env.get("EXTRA_RATE_TIERS", ""))
+    per_chat = parse_chat_limits(env.get("CHAT_LIMITS", ""))
+    exempt = [env.get(key, "true").lower() == "true" for key in EXEMPT_KEYS]
+
+    added, removed = allowed - ALLOWED_CHAT_IDS, ALLOWED_CHAT_IDS - allowed
+    ALLOWED_CHAT_IDS = allowed
+    ALLOWED_CHATS.chat_ids = allowed
+    DEFAULT_LIMITS, EXTRA_RATE_TIERS, CHAT_LIMITS = limits, extra, per_chat
+    RATE_RETENTION_SECONDS = max([86400] + [window for window, _, _ in extra])
+    EXEMPT_OWNER_ANTIFLOOD, EXEMPT_CREATOR_ANTIFLOOD, EXEMPT_ADMIN_ANTIFLOOD = exempt
+    changed = 0
+    for shard in shards.values():
+        new_limits = chat_limits(shard.chat_id)
+        if new_limits != shard.limits:
+            changed += 1
+        shard.apply_limits(new_limits)
+    logger.info(f"Конфігурацію перечитано: чатів {len(allowed)} (+{sorted(added)} −{sorted(removed)}), "
+                f"ліміти змінено в {changed} з {len(shards)} чатів")
+    return {"chats": len(allowed), "added": sorted(added), "removed": sorted(removed),
+            "changed": changed, "shards": len(shards)}
+
+def reload_on_signal():
+    try:
+        reload_config()
+    except ValueError as e:
+        logger.error(f"SIGHUP: помилка в .env, діє попередня конфігурація: {e}")
+
+def install_reload_signal(callback):
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, callback)
+    except (AttributeError, NotImplementedError, RuntimeError):
+        logger.debug("SIGHUP недоступний — лише /reloadconfig")
+
+async def reloadconfig(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message = update.message
+    if not message:
+        return
+    logger.debug("Команда /reloadconfig від %s", message.from_user.id)
+    await delete_command_message(message)
+    # У режимі WORKERS перечитують усі обробники
+    parts, complete = await collect("reload")
+    parts = [part for part in parts if part]
+    errors = sorted({part["error"] for part in parts if "error" in part})
+    if errors:
+        await reply_in_private(update, context,
+                               "Помилка в .env — діє попередня конфігурація:\n" + "\n".join(errors))
+        return
+    result = parts[0]
+    text = f"Конфігурацію перечитано. Дозволених чатів: {result['chats']}"
+    if result["added"]:
+        text += f", додано {', '.join(map(str, result['added']))}"
+    if result["removed"]:
+        text += f", прибрано {', '.join(map(str, result['removed']))}"
+    text += (f".\nЛіміти змінено в {sum(part['changed'] for part in parts)} чатах. "
+             f"Лічильники й мути збережено.")
+    if not complete:
+        text += "\n(не всі обробники відповіли — перевірте логи)"
+    await reply_in_private(update, context, text)
+
+# ─── Профілювання на вимогу (/profile) ───
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 300
+PROFILE_STACK_INTERVAL = 0.005   # семпли стеків: event loop — за процесорним часом, решта потоків — за реальним
+PROFILE_TASK_INTERVAL = 0.01     # семпли asyncio-задач (і заодно затримка event loop)
+PROFILE_TOP = 40
+
+def frame_label(code) -> str:
+    # co_qualname з'явився в Python 3.11; раніше — лише ім'я функції без класу
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+def thread_cpu_time(ident: int) -> float | None:
+    # Процесорний час окремого потоку (Linux/Unix); None — платформа не вміє або потік уже завершився
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):
+        return None
+
+class ThreadProfile:
+    def __init__(self, name: str, cpu_start: float | None):
+        self.name = name
+        self.cpu_start = cpu_start
+        self.cpu_last = cpu_start
+        self.samples = 0
+        self.cpu_samples = 0
+        self.self_cpu: dict[str, int] = {}
+        self.total_cpu: dict[str, int] = {}
+        self.self_wall: dict[str, int] = {}
+
+    def add(self, frame, on_cpu: bool):
+        self.samples += 1
+        label = frame_label(frame.f_code)
+        self.self_wall[label] = self.self_wall.get(label, 0) + 1
+        if not on_cpu:
+            return
+        self.cpu_samples += 1
+        self.self_cpu[label] = self.self_cpu.get(label, 0) + 1
+        seen = set()
+        while frame is not None:
+            label = frame_label(frame.f_code)
+            if label not in seen:
+                seen.add(label)
+                self.total_cpu[label] = self.total_cpu.get(label, 0) + 1
+            frame = frame.f_back
+
+class LoopSampler:
+    # Семпли потоку event loop зсередини: SIGPROF за таймером процесорного часу (ITIMER_PROF)
+    # перериває саме той кадр, що виконувався. Окремий потік-семплер тут бачив би лише моменти,
+    # коли loop віддав GIL, тобто майже завжди select.
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.profile = ThreadProfile(threading.current_thread().name, thread_cpu_time(threading.get_ident()))
+        self._previous = None
+
+    @staticmethod
+    def available() -> bool:
+        return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+    def _sample(self, signum, frame):
+        if frame is not None:
+            self.profile.add(frame, True)
+
+    def start(self):
+        self._previous = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self._previous or signal.SIG_DFL)
+        self.profile.cpu_last = thread_cpu_time(threading.get_ident())
+
+class StackSampler:
+    # Решта потоків (фоновий запис сховища, логування) — з окремого потоку через sys._current_frames().
+    # Семпл «на CPU», лише якщо потік відтоді витратив процесорний час, — так простій у queue.get
+    # не видається за гарячу функцію. Поки /profile не запущено — нічого не встановлено і не працює.
+    def __init__(self, interval: float, skip: set[int]):
+        self.interval = interval
+        self.skip = skip
+        self.threads: dict[int, ThreadProfile] = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        skip = self.skip | {threading.get_ident()}
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident in skip:
+                    continue
+                cpu = thread_cpu_time(ident)
+                profile = self.threads.get(ident)
+                if profile is None:
+                    self.threads[ident] = ThreadProfile(names.get(ident, str(ident)), cpu)
+                    continue
+                on_cpu = cpu is None or profile.cpu_last is None or cpu > profile.cpu_last
+                profile.cpu_last = cpu
+                profile.add(frame, on_cpu)
+
+def await_point(task: asyncio.Task) -> str:
+    # Найглибша корутина в ланцюжку cr_await і те, на що вона чекає (Future, sleep, мережа)
+    point = task.get_coro()
+    while True:
+        inner = getattr(point, "cr_await", None) or getattr(point, "gi_yieldfrom", None)
+        if inner is None or getattr(inner, "cr_frame", getattr(inner, "gi_frame", None)) is None:
+            break
+        point = inner
+    frame = getattr(point, "cr_frame", None) or getattr(point, "gi_frame", None)
+    if frame is None:
+        return "(виконується)"
+    awaited = getattr(point, "cr_await", None) or getattr(point, "gi_yieldfrom", None)
+    target = f" → {type(awaited).__name__}" if awaited is not None else ""
+    return f"{frame_label(frame.f_code)} :{frame.f_lineno}{target}"
+
+class TaskSampler:
+    # Семплінг asyncio-задач на самому event loop: скільки часу кожна задача існувала і де чекала.
+    # Перевищення інтервалу сну — це затримка event loop (хтось тримав його без await).
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lags: list[float] = []
+        self.task_seconds: dict[str, float] = {}
+        self.await_seconds: dict[str, float] = {}
+
+    async def run(self, seconds: float):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + seconds
+        while loop.time() < deadline:
+            before = loop.time()
+            await asyncio.sleep(self.interval)
+            elapsed = loop.time() - before
+            self.lags.append(max(0.0, elapsed - self.interval))
+            current = asyncio.current_task()
+            for task in asyncio.all_tasks():
+                if task is current or task.done():
+                    continue
+                coro = task.get_coro()
+                name = getattr(coro, "__qualname__", type(coro).__name__)
+                self.task_seconds[name] = self.task_seconds.get(name, 0.0) + elapsed
+                point = await_point(task)
+                self.await_seconds[point] = self.await_seconds.get(point, 0.0) + elapsed
+
+def ranked(counts: dict, limit: int = PROFILE_TOP) -> list:
+    return heapq.nlargest(limit, counts.items(), key=lambda item: item[1])
+
+def build_profile_report(seconds: float, threads: list[ThreadProfile], tasks: TaskSampler, profiler) -> str:
+    lines = [f"Профіль ABCWarrior_bot, {datetime.now(timezone.utc):%Y-%m-%d %H:%M:%S} UTC",
+             f"Тривалість {seconds:.1f} с, процес {os.getpid()}"
+             + (f", обробник {cluster.index + 1}/{cluster.count}" if cluster is not None else ""),
+             f"Чатів у процесі: {len(shards)}, вихідна черга: {len(outbox)}"]
+    if tasks.lags:
+        lags = sorted(tasks.lags)
+        lines.append(f"Затримка event loop: p50 {lags[len(lags) // 2] * 1000:.1f} мс, "
+                     f"p99 {lags[min(len(lags) - 1, len(lags) * 99 // 100)] * 1000:.1f} мс, "
+                     f"макс {lags[-1] * 1000:.1f} мс ({len(lags)} вимірів)")
+
+    lines += ["", "═══ Гарячі функції (семпли стеків) ═══"]
+    for profile in threads:
+        if not profile.samples:
+            continue
+        cpu = ""
+        if profile.cpu_start is not None and profile.cpu_last is not None:
+            cpu = f", CPU {(profile.cpu_last - profile.cpu_start) * 100 / seconds:.0f}%"
+        lines += ["", f"── потік {profile.name}: {profile.samples} семплів, на CPU {profile.cpu_samples}{cpu} ──"]
+        if profile.cpu_samples:
+            lines.append("  власний  сукупний  функція (частка семплів на CPU)")
+            for label, count in ranked(profile.self_cpu, 25):
+                total = profile.total_cpu[label]
+                lines.append(f"  {count * 100 / profile.cpu_samples:6.1f}%  {total * 100 / profile.cpu_samples:7.1f}%  {label}")
+            lines.append("  сукупний час (функція десь у стеку):")
+            for label, count in ranked(profile.total_cpu, 25):
+                lines.append(f"  {count * 100 / profile.cpu_samples:6.1f}%  {label}")
+        lines.append("  де потік був за весь час (разом з очікуванням):")
+        for label, count in ranked(profile.self_wall, 5):
+            lines.append(f"  {count * 100 / profile.samples:6.1f}%  {label}")
+
+    lines += ["", "═══ asyncio: час життя задач ═══"]
+    for name, value in ranked(tasks.task_seconds):
+        lines.append(f"  {value:8.2f} с  {name}")
+    lines += ["", "═══ asyncio: де задачі чекали (await) ═══"]
+    for point, value in ranked(tasks.await_seconds):
+        lines.append(f"  {value:8.2f} с  {point}")
+
+    if profiler is not None:
+        for sort in ("tottime", "cumulative"):
+            buffer = io.StringIO()
+            pstats.Stats(profiler, stream=buffer).sort_stats(sort).print_stats(PROFILE_TOP)
+            lines += ["", f"═══ cProfile (потік event loop), сортування {sort} ═══", buffer.getvalue()]
+    return "\n".join(lines) + "\n"
+
+profile_task: asyncio.Task | None = None
+
+async def run_profile(bot, seconds: int, deterministic: bool):
+    loop_sampler = LoopSampler(PROFILE_STACK_INTERVAL) if LoopSampler.available() else None
+    stacks = StackSampler(PROFILE_STACK_INTERVAL, {threading.get_ident()} if loop_sampler else set())
+    tasks = TaskSampler(PROFILE_TASK_INTERVAL)
+    # cProfile перехоплює кожен виклик лише в потоці, де його увімкнено, — тут це потік event loop
+    profiler = cProfile.Profile() if deterministic else None
+    started = perf_counter()
+    stacks.start()
+    if loop_sampler is not None:
+        loop_sampler.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        await tasks.run(seconds)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        if loop_sampler is not None:
+            loop_sampler.stop()
+        stacks.stop()
+    elapsed = perf_counter() - started
+    threads = sorted(stacks.threads.values(), key=lambda item: -item.cpu_samples)
+    if loop_sampler is not None:
+        threads.insert(0, loop_sampler.profile)
+    report = await asyncio.to_thread(build_profile_report, elapsed, threads, tasks, profiler)
+    filename = f"profile-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}-{os.getpid()}.txt"
+    try:
+        await bot.send_document(chat_id=OWNER_PRIVATE_ID, document=report.encode("utf-8"), filename=filename,
+                                caption=f"Профіль за {elapsed:.0f} с" + (" (cProfile)" if profiler else ""))
+    except TelegramError as e:
+        logger.error(f"Не вдалося надіслати звіт профілювання: {e}")
+    logger.info(f"Профілювання завершено: {elapsed:.1f} с, звіт {len(report)} байт")
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /profile [секунд] [cprofile] — лише власник; звіт документом у OWNER_PRIVATE_ID
+    global profile_task
+    message = update.message
+    if not message:
         return
+    logger.debug("Команда /profile від %s", message.from_user.id)
+    await delete_command_message(message)
+    args = [arg.lower() for arg in context.args or []]
+    deterministic = "cprofile" in args
+    numbers = [arg for arg in args if arg.isdigit()]
+    seconds = min(max(int(numbers[0]), 1), PROFILE_MAX_SECONDS) if numbers else PROFILE_DEFAULT_SECONDS
+    if profile_task is not None and not profile_task.done():
+        await reply_in_private(update, context, "Профілювання вже триває — дочекайтеся звіту.")
+        return
+    profile_task = asyncio.create_task(run_profile(context.bot, seconds, deterministic))
+    logger.info(f"Профілювання на {seconds} с запущено" + (" (cProfile)" if deterministic else ""))
+    await reply_in_private(update, context, f"Профілювання на {seconds} с запущено"
+                           + (" (cProfile на потоці event loop)" if deterministic else "")
+                           + ". Звіт прийде документом.")
+
+async def stop_profile():
+    # Зупинка разом з ботом: потік семплера і cProfile вимикаються у finally задачі
+    if profile_task is not None and not profile_task.done():
+        profile_task.cancel()
+        await asyncio.gather(profile_task, return_exceptions=True)
+
+async def on_startup(app: Application):
+    global shards_job_queue, metrics_server
+    if app.job_queue is None:
+        raise RuntimeError("JobQueue недоступна — встановіть python-telegram-bot[job-queue]")
+    shards_job_queue = app.job_queue
+    for shard in shards.values():
+        shard.attach(app.job_queue)
+    for chat_id in ALLOWED_CHAT_IDS:
+        if owns_chat(chat_id):
+            get_shard(chat_id)
+    app.job_queue.run_repeating(flush_state_job, interval=SAVE_INTERVAL_SECONDS,
+                                first=SAVE_INTERVAL_SECONDS, name="flush_state")
+    app.job_queue.run_repeating(sweep_job, interval=SWEEP_INTERVAL_SECONDS,
+                                first=SWEEP_INTERVAL_SECONDS, name="sweep_state")
+    # Звірка мутів з обмеженнями в Telegram — у фоні, щоб не затримувати старт
+    app.job_queue.run_once(reconcile_restrictions_job, when=1, name="reconcile_restrictions")
+    app.job_queue.run_repeating(raid_job, interval=RAID_CHECK_SECONDS, first=RAID_CHECK_SECONDS, name="raid_release")
+    install_reload_signal(reload_on_signal)
+    if METRICS_PORT:
+        metrics_server = await asyncio.start_server(serve_metrics, METRICS_LISTEN, METRICS_PORT)
+        logger.info(f"Метрики: http://{METRICS_LISTEN}:{METRICS_PORT}/metrics")
+    # Прогрів кешу статусів: по одному get_chat_administrators на кожен дозволений чат
+    for chat_id in ALLOWED_CHAT_IDS:
+        if owns_chat(chat_id):
+            await member_cache.refresh_admins(app.bot, chat_id)
 
-    save_daily()
-    save_hourly()
-    save_short()
-    logger.debug(f"Повідомлення {message.message_id} оброблено нормально")
+async def on_stop(app: Application):
+    # Бот ще підключений — доробляємо альбоми, дочищаємо чергу видалень і вихідні повідомлення
+    await asyncio.gather(*(shard.albums.drain() for shard in list(shards.values())))
+    await asyncio.gather(*(shard.deletions.flush() for shard in list(shards.values())))
+    logger.info(f"Пакетне видалення: {delete_stats_summary()}")
+    await outbox.flush(timeout=10)
+    await stop_profile()
+
+async def on_shutdown(app: Application):
+    # run_polling зупиняється по SIGINT/SIGTERM — тут гарантоване фінальне збереження
+    for shard in list(shards.values()):
+        shard.mark_unsaved()
+    await asyncio.gather(*(shard.store.flush() for shard in list(shards.values())))
+    logger.info("Фінальне збереження даних виконано")
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
 
 async def auto_delete_commands(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message
@@ -728,48 +3673,335 @@ async def auto_delete_commands(update: Update, context: ContextTypes.DEFAULT_TYP
     if not command_match:
         return
     command = command_match.group(1).lower()
-    logger.debug(f"Автовидалення команди /{command} від {user_id}")
+    logger.debug("Автовидалення команди /%s від %s", command, user_id)
     if user_id == OWNER_ID and command == "test":
         return
-    try:
-        await message.delete()
-        logger.info(f"Видалено команду /{command} ({message.message_id}) від {user_id} в чаті {message.chat.id}")
-    except TelegramError as e:
-        if "message to delete not found" not in str(e):
-            logger.debug(f"Не вдалося видалити команду /{command}: {e}")
+    queue_delete(message, "command", f"(команда /{command} від {user_id})")
 
-if __name__ == "__main__":
-    logger.info("Запуск бота | мути в окремому файлі mutes.json | логи ротація щодня")
-    app = Application.builder().token(BOT_TOKEN).build()
-    app.add_handler(CommandHandler("test", test_cmd, filters=ALLOWED_GROUP_FILTER))
-    app.add_handler(CommandHandler("start", start, filters=ALLOWED_GROUP_FILTER))
-    app.add_handler(CommandHandler("lock", lock, filters=ALLOWED_GROUP_FILTER))
-    app.add_handler(CommandHandler("unlock", unlock, filters=ALLOWED_GROUP_FILTER))
-    app.add_handler(CommandHandler("stats", stats, filters=ALLOWED_GROUP_FILTER))
-    app.add_handler(CommandHandler("mute15", mute15, filters=ALLOWED_GROUP_FILTER))
-    app.add_handler(CommandHandler("mute60", mute60, filters=ALLOWED_GROUP_FILTER))
-    app.add_handler(CommandHandler("mute24h", mute24h, filters=ALLOWED_GROUP_FILTER))
-    app.add_handler(CommandHandler("mute666", mute666, filters=ALLOWED_GROUP_FILTER))
-    app.add_handler(CommandHandler("unmute", unmute, filters=ALLOWED_GROUP_FILTER))
-    app.add_handler(CommandHandler("listmute", listmute, filters=ALLOWED_GROUP_FILTER))
+# Типи апдейтів, які обробляють зареєстровані хендлери: message (команди й модерація)
+# і chat_member (кеш статусів). Решту Telegram не надсилатиме взагалі.
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CHAT_MEMBER]
+
+def application_builder():
+    builder = Application.builder().token(BOT_TOKEN)
+    if BOT_API_BASE_URL:
+        builder = builder.base_url(f"{BOT_API_BASE_URL}/bot").base_file_url(f"{BOT_API_BASE_URL}/file/bot")
+    return builder
+
+def build_application(request=None, concurrent_updates: int = CONCURRENT_UPDATES, updater: bool = True) -> Application:
+    builder = application_builder().post_init(on_startup).post_stop(on_stop).post_shutdown(on_shutdown)
+    if not updater:
+        # Обробник у режимі WORKERS: апдейти приходять від приймача, не з Telegram
+        builder = builder.updater(None)
+    if METRICS_PORT:
+        # Той самий пул з'єднань, що й у PTB за замовчуванням, але з заміром кожного виклику
+        request = TimedRequest(request or HTTPXRequest(connection_pool_size=256))
+    if request is not None:
+        builder = builder.request(request)
+    instrument = timed_handler if METRICS_PORT else (lambda callback: callback)
+    if concurrent_updates > 0:
+        # Паралельно до concurrent_updates апдейтів; узгодженість тримають KeyedLocks шардів
+        builder = builder.concurrent_updates(concurrent_updates)
+    app = builder.build()
+    app.add_handler(CommandHandler("test", instrument(test_cmd), filters=ALLOWED_GROUP_FILTER))
+    app.add_handler(CommandHandler("start", instrument(start), filters=ALLOWED_GROUP_FILTER))
+    app.add_handler(CommandHandler("lock", instrument(lock), filters=ALLOWED_GROUP_FILTER))
+    app.add_handler(CommandHandler("unlock", instrument(unlock), filters=ALLOWED_GROUP_FILTER))
+    app.add_handler(CommandHandler("stats", instrument(stats), filters=ALLOWED_GROUP_FILTER))
+    app.add_handler(CommandHandler("mute15", instrument(mute15), filters=ALLOWED_GROUP_FILTER))
+    app.add_handler(CommandHandler("mute60", instrument(mute60), filters=ALLOWED_GROUP_FILTER))
+    app.add_handler(CommandHandler("mute24h", instrument(mute24h), filters=ALLOWED_GROUP_FILTER))
+    app.add_handler(CommandHandler("mute666", instrument(mute666), filters=ALLOWED_GROUP_FILTER))
+    app.add_handler(CommandHandler("unmute", instrument(unmute), filters=ALLOWED_GROUP_FILTER))
+    app.add_handler(CommandHandler("listmute", instrument(listmute), filters=ALLOWED_GROUP_FILTER))
+    app.add_handler(CommandHandler("top", instrument(top), filters=ALLOWED_GROUP_FILTER))
+    app.add_handler(CommandHandler("reloadconfig", instrument(reloadconfig), filters=OWNER_COMMAND_FILTER))
+    app.add_handler(CommandHandler("profile", instrument(profile), filters=OWNER_COMMAND_FILTER))
+    app.add_handler(ChatMemberHandler(instrument(track_chat_member), ChatMemberHandler.CHAT_MEMBER))
     app.add_handler(MessageHandler(
-        filters.Chat(chat_id=ALLOWED_CHAT_IDS) &
+        ALLOWED_CHATS &
         filters.ChatType.GROUPS &
         filters.COMMAND,
-        auto_delete_commands
+        instrument(auto_delete_commands)
     ))
     app.add_handler(MessageHandler(
         filters.ChatType.GROUPS & ~filters.COMMAND & ALLOWED_GROUP_FILTER,
-        handle_message
+        instrument(handle_message)
     ))
     app.add_error_handler(error_handler)
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    return app
+
+def run_bot(app: Application):
+    if DELIVERY_MODE == "webhook":
+        if not WEBHOOK_URL:
+            raise ValueError("DELIVERY_MODE=webhook потребує WEBHOOK_URL у .env")
+        if not WEBHOOK_SECRET_TOKEN:
+            logger.warning("WEBHOOK_SECRET_TOKEN не задано — webhook прийматиме POST від будь-кого")
+        logger.info(f"Режим webhook: слухаємо {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH.lstrip('/')}, URL {WEBHOOK_URL}")
+        app.run_webhook(listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, url_path=WEBHOOK_PATH, webhook_url=WEBHOOK_URL,
+                        secret_token=WEBHOOK_SECRET_TOKEN or None, allowed_updates=ALLOWED_UPDATES)
+    else:
+        if DELIVERY_MODE != "polling":
+            logger.warning(f"Невідомий DELIVERY_MODE={DELIVERY_MODE} — використовується polling")
+        app.run_polling(allowed_updates=ALLOWED_UPDATES)
+
+# ─── Кілька процесів (WORKERS) ───
+# Приймач (polling або webhook) сам не модерує: кожен апдейт іде в чергу обробника
+# worker_for(chat_id, WORKERS) — chat_id множиться на 0x9E3779B97F4A7C15 за модулем 2**64, і старші
+# біти добутку, помножені на WORKERS, дають номер 0..WORKERS-1 (це не chat_id % WORKERS).
+# Цей номер — N у bot_moderation.worker<N>.log; дізнатися його для чату:
+#   python -c "import bot; print(bot.worker_for(-1001234567890, 4))"
+# Черга в кожного обробника одна і FIFO, тож апдейти одного чату
+# обробляються в порядку надходження, як і в одному процесі. Стан і сховище чату живуть
+# лише в його обробнику. Командам, яким потрібні всі чати (/listmute, підсумок /stats),
+# дані з усіх обробників збирає приймач (collect).
+COLLECT_TIMEOUT_SECONDS = 5
+WORKER_CHECK_SECONDS = 10
+
+def worker_for(chat_id: int, count: int) -> int:
+    # Мультиплікативне (фібоначчієве) хешування: сусідні chat_id розходяться по різних обробниках
+    return ((chat_id * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) * count >> 64
+
+class ClusterClient:
+    # Сторона обробника: запити collect до приймача і відповіді на них
+    def __init__(self, index: int, count: int, replies):
+        self.index = index
+        self.count = count
+        self.replies = replies
+        self._futures: dict[int, asyncio.Future] = {}
+        self._next_id = 0
+
+    def owns(self, chat_id: int) -> bool:
+        return worker_for(chat_id, self.count) == self.index
+
+    async def collect(self, kind: str, args: dict, timeout: float) -> list:
+        self._next_id += 1
+        query_id = self._next_id
+        future = self._futures[query_id] = asyncio.get_running_loop().create_future()
+        self.replies.put(("query", self.index, query_id, kind, args))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._futures.pop(query_id, None)
+
+    def answer(self, query_id: int, payloads: list):
+        future = self._futures.get(query_id)
+        if future is not None and not future.done():
+            future.set_result(payloads)
+
+cluster: ClusterClient | None = None
+
+def owns_chat(chat_id: int) -> bool:
+    return cluster is None or cluster.owns(chat_id)
+
+def collect_local(kind: str, args: dict):
+    # Відповідь цього процесу на collect; має піклитися (кортежі, числа, dict)
+    if kind == "mutes":
+        for shard in shards.values():
+            shard.expire_due_mutes()
+        limit = args["limit"]
+        entries = list(islice(heapq.merge(*(
+            [(until, uid, shard.chat_id) for until, uid in shard.mute_scheduler.page(0, limit)]
+            for shard in shards.values()
+        )), limit))
+        return {"total": sum(len(shard.mute_scheduler) for shard in shards.values()),
+                "chats": len(shards), "entries": entries}
+    if kind == "reload":
+        try:
+            return reload_config()
+        except ValueError as e:
+            return {"error": str(e)}
+    if kind == "summary":
+        return {"chats": len(shards),
+                "users": sum(len(shard.rate_limiter.users) for shard in shards.values()),
+                "mutes": sum(len(shard.mutes) for shard in shards.values()),
+                "locked": sum(1 for shard in shards.values() if shard.locked),
+                "outbox": len(outbox)}
+    raise ValueError(f"невідомий collect: {kind}")
+
+async def collect(kind: str, **args) -> tuple[list, bool]:
+    # Відповіді всіх процесів; False — не всі встигли, повертаються лише локальні дані
+    if cluster is None:
+        return [collect_local(kind, args)], True
+    try:
+        return await cluster.collect(kind, args, COLLECT_TIMEOUT_SECONDS), True
+    except asyncio.TimeoutError:
+        logger.warning(f"collect {kind}: не всі обробники відповіли за {COLLECT_TIMEOUT_SECONDS} с")
+        return [collect_local(kind, args)], False
+
+class UpdateRouter:
+    # Сторона приймача: розподіл апдейтів, пересилання collect, перезапуск обробників, що впали
+    def __init__(self, count: int, request_factory=None):
+        self.count = count
+        self.request_factory = request_factory
+        self._context = multiprocessing.get_context("spawn")
+        self.replies = self._context.Queue()
+        self.inboxes = [self._context.Queue() for _ in range(count)]
+        self.processes: list = [None] * count
+        self._pending: dict[tuple[int, int], list] = {}
+
+    def start_worker(self, index: int):
+        process = self._context.Process(target=run_worker, name=f"abcwarrior-worker-{index}",
+                                        args=(index, self.count, self.inboxes[index], self.replies,
+                                              self.request_factory))
+        process.start()
+        self.processes[index] = process
+        logger.info(f"Обробник {index} запущено (pid {process.pid})")
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        chat = update.effective_chat
+        index = worker_for(chat.id, self.count) if chat else 0
+        self.inboxes[index].put(("update", update.to_dict()))
+
+    def route(self, item):
+        if item[0] == "query":
+            _, origin, query_id, kind, args = item
+            self._pending[(origin, query_id)] = []
+            for inbox in self.inboxes:
+                inbox.put(("collect", origin, query_id, kind, args))
+        elif item[0] == "collected":
+            _, origin, query_id, payload = item
+            parts = self._pending.get((origin, query_id))
+            if parts is None:
+                return
+            parts.append(payload)
+            if len(parts) == self.count:
+                del self._pending[(origin, query_id)]
+                self.inboxes[origin].put(("answer", query_id, parts))
+
+    def forward_reload(self):
+        # SIGHUP приймачу — конфігурацію перечитують обробники, сам приймач чатів не фільтрує
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                os.kill(process.pid, signal.SIGHUP)
+
+    async def check_workers(self, context: ContextTypes.DEFAULT_TYPE):
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                logger.error(f"Обробник {index} завершився з кодом {process.exitcode} — перезапуск")
+                self._pending.clear()
+                self.start_worker(index)
+
+    async def on_startup(self, app: Application):
+        loop = asyncio.get_running_loop()
+
+        def read_replies():
+            while True:
+                item = self.replies.get()
+                if item is None:
+                    return
+                loop.call_soon_threadsafe(self.route, item)
+
+        threading.Thread(target=read_replies, name="cluster-replies", daemon=True).start()
+        install_reload_signal(self.forward_reload)
+        if app.job_queue is not None:
+            app.job_queue.run_repeating(self.check_workers, interval=WORKER_CHECK_SECONDS,
+                                        first=WORKER_CHECK_SECONDS, name="check_workers")
+
+    async def on_shutdown(self, app: Application):
+        self.replies.put(None)
+
+    def stop_workers(self, timeout: float = 30):
+        # Обробники доробляють свої черги, скидають стан і завершуються
+        for inbox in self.inboxes:
+            inbox.put(("stop",))
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                logger.error(f"Обробник {index} не завершився за {timeout} с — terminate")
+                process.terminate()
+
+def build_receiver_application(router: UpdateRouter, request=None) -> Application:
+    builder = application_builder().post_init(router.on_startup).post_shutdown(router.on_shutdown)
+    if request is not None:
+        builder = builder.request(request)
+    app = builder.build()
+    app.add_handler(TypeHandler(Update, router.dispatch))
+    return app
+
+async def serve_worker(app: Application, inbox):
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+
+    def deliver(item):
+        if item[0] == "update":
+            app.update_queue.put_nowait(Update.de_json(item[1], app.bot))
+        elif item[0] == "collect":
+            _, origin, query_id, kind, args = item
+            try:
+                payload = collect_local(kind, args)
+            except Exception as e:
+                logger.error(f"collect {kind}: {e}")
+                payload = None
+            cluster.replies.put(("collected", origin, query_id, payload))
+        elif item[0] == "answer":
+            cluster.answer(item[1], item[2])
+        elif item[0] == "stop":
+            stopped.set()
+
+    def read_inbox():
+        while True:
+            item = inbox.get()
+            loop.call_soon_threadsafe(deliver, item)
+            if item[0] == "stop":
+                return
+
+    try:
+        loop.add_signal_handler(signal.SIGTERM, stopped.set)
+    except (NotImplementedError, AttributeError):
+        pass
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+    threading.Thread(target=read_inbox, name="worker-inbox", daemon=True).start()
+    await stopped.wait()
+    # Application.stop() спершу доробляє все, що вже в update_queue
+    await app.stop()
+    await app.post_stop(app)
+    await app.shutdown()
+    await app.post_shutdown(app)
+
+def run_worker(index: int, count: int, inbox, replies, request_factory=None):
+    # Точка входу процесу-обробника. Ctrl+C ловить приймач і надсилає "stop" сам.
+    global cluster, outbox, METRICS_PORT
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configure_logging(LOG_QUEUE, LOG_FORMAT, f"bot_moderation.worker{index}.log")
+    cluster = ClusterClient(index, count, replies)
+    # Ліміт Telegram на кількість повідомлень спільний для бота — ділимо його між обробниками
+    outbox = Outbox(OUTBOX_GLOBAL_PER_SECOND / count, OUTBOX_GROUP_PER_MINUTE, OUTBOX_PRIVATE_PER_SECOND,
+                    OUTBOX_CONCURRENCY, MUTE_NOTICE_COALESCE_MS / 1000, OUTBOX_MAX_QUEUE)
+    if METRICS_PORT:
+        METRICS_PORT += index
+    logger.info(f"Обробник {index}/{count}: чати {sorted(c for c in ALLOWED_CHAT_IDS if cluster.owns(c))}")
+    app = build_application(request=request_factory() if request_factory else None, updater=False)
+    asyncio.run(serve_worker(app, inbox))
+
+def run_cluster(count: int, request_factory=None):
+    router = UpdateRouter(count, request_factory)
+    for index in range(count):
+        router.start_worker(index)
+    try:
+        run_bot(build_receiver_application(router, request_factory() if request_factory else None))
+    finally:
+        router.stop_workers()
+
+if __name__ == "__main__":
+    if "--migrate-json-to-sqlite" in sys.argv[1:]:
+        sys.exit(0 if migrate_json_to_sqlite() else 1)
+    logger.info("Запуск бота | стан окремо для кожного чату в data/chats/ | логи ротація щодня")
+    if WORKERS > 1:
+        logger.info(f"Режим кількох процесів: приймач + {WORKERS} обробників")
+        run_cluster(WORKERS)
+    else:
+        run_bot(build_application())
 
 # =============================================================================
 # ─── ВЕРСІЇ ТА ІНСТРУКЦІЇ ДЛЯ МАЙБУТНЬОГО GROK ───────────────────────────────
 # =============================================================================
 #
-# Поточна версія: 0.0.30
+# Поточна версія: 0.25.0
 #
 # Правила зміни версії (обов’язково виконуй при кожному повному виводі коду):
 #
@@ -790,6 +4022,31 @@ if __name__ == "__main__":
 # • X.Y.Z YYYY-MM-DD Короткий опис змін
 #
 # Changelog:
+# • 0.25.0 2026-10-17 Детектор рейдів: сукупні повідомлення/с, нові відправники (вступили за годину) і входи за хвилину на весь чат; при перевищенні порогу (RAID_*, також у CHAT_LIMITS; за замовчуванням 0 — вимкнено) чат блокується як /lock і власник отримує одне сповіщення, зняття з гістерезисом (RAID_CALM_MINUTES нижче RAID_RELEASE_PERCENT порогів), автоблокування переживає перезапуск; /unlock знімає і призупиняє детектор
+# • 0.24.0 2026-10-17 /profile [секунд] [cprofile] (власник): профілювання живого бота до 300 с — семпли event loop за SIGPROF, інших потоків через sys._current_frames з урахуванням їхнього CPU, час життя asyncio-задач і місця await, затримка event loop, за бажанням cProfile; звіт документом у OWNER_PRIVATE_ID. Поза викликом нічого не встановлено
+# • 0.23.0 2026-10-17 BOT_API_BASE_URL: власний або фейковий Bot API. fake_bot_api.py — HTTP-сервер зі сценаріями getUpdates (flood, voice, raid, steady), затримкою і 429, драйвер вимірює час від апдейта до видалення через повний polling. Черга видалень повторює запит після RetryAfter замість втрати видалень
+# • 0.22.0 2026-10-17 /top [N] (власник): найактивніші відправники чату за годину, добу й тиждень зі Space-Saving кошиків фіксованого розміру (TOP_SKETCH_SIZE), O(1) на повідомлення, зберігаються разом зі станом чату (набір senders)
+# • 0.21.0 2026-10-17 /reloadconfig (власник) і SIGHUP перечитують .env: ліміти, EXTRA_RATE_TIERS, CHAT_LIMITS, EXEMPT_* і ALLOWED_CHAT_IDS підміняються без перезапуску, лічильники й мути зберігаються; при помилці лишається попередня конфігурація
+# • 0.20.0 2026-10-17 Альбоми (media_group_id) збираються протягом ALBUM_BUFFER_MS і перевіряються як один пост: одна перевірка статусу, один запис у лічильники, видалення всього альбому одним пакетом
+# • 0.19.0 2026-10-17 Режим кількох процесів (WORKERS): приймач розподіляє чати між обробниками, /listmute і /stats збирають дані з усіх
+# • 0.18.0 2026-10-17 /lock через set_chat_permissions: учасники не можуть писати на рівні Telegram, попередні дозволи чату зберігаються в meta шарда і повертаються /unlock; без прав — як раніше, видалення з перевіркою статусу.
+# • 0.17.0 2026-10-17 MUTE_ENFORCEMENT=restrict: мут додатково накладається restrict_chat_member з until_date (Telegram сам блокує повідомлення), /unmute знімає обмеження, повертаючи поточні дозволи чату (під час /lock — після розблокування); без прав — soft-мут і пауза RESTRICT_RETRY_SECONDS; при старті мути звіряються з реальними обмеженнями.
+# • 0.16.0 2026-10-17 Логування без блокування event loop: DeferredFileHandler (LOG_QUEUE, вимкнено за замовчуванням) лише форматує запис у буфер, фоновий потік раз на 0.2 с дописує його одним write і робить ротацію; буфер обмежено LOG_QUEUE_MAX_LINES з підрахунком відкинутих, debug і гарячі info/warning — з відкладеним форматуванням (%s), не збираються потік/процес/місце виклику; LOG_FORMAT=json — JSON-рядки; benchmark.py logging.
+# • 0.15.0 2026-10-17 STORAGE_BACKEND=binary: бінарний знімок state.bin (упаковані epoch-масиви, версія, CRC32) + журнал; прострочені вікна й мути відкидаються при читанні, rates користувача декодуються лише при його появі (RateSnapshot). Час завантаження шарда в лозі та метриці, benchmark.py startup.
+# • 0.14.0 2026-10-17 Метрики Prometheus (METRICS_PORT): гістограми часу хендлерів, викликів Bot API за методом, save_json (час і байти) та запису сховища; лічильники видалень, мутів за причиною і проковтнутих помилок (bare except замінено); gauges користувачів, мутів і черг.
+# • 0.13.0 2026-10-17 benchmark.py: набір сценаріїв (steady, flood, voice, locked, commands, users_100k) на справжніх хендлерах з фейковим Bot API — пов/с, p50/p99 затримки, виклики API на повідомлення, байти записані в data/, пікова пам'ять; JSON-звіт і порівняння з попереднім (--baseline).
+# • 0.12.0 2026-10-17 Режим доставки webhook (DELIVERY_MODE, WEBHOOK_LISTEN/PORT/PATH/URL/SECRET_TOKEN); allowed_updates звужено до message і chat_member; replay_updates.py надсилає записані апдейти на webhook і вимірює час до видалення; фейковий Bot API винесено в fake_bot_api.py.
+# • 0.11.0 2026-10-17 Режим паралельної обробки апдейтів CONCURRENT_UPDATES з keyed asyncio-lock на користувача (повідомлення, ручні мути, /unmute) і на чат (/lock, /unlock); build_application(); benchmark.py порівнює пропускну здатність з послідовним режимом.
+# • 0.10.0 2026-10-17 Вихідні повідомлення йдуть через фонову чергу (Outbox): токен-бакети на бота і на чат, обмежена кількість одночасних запитів, повтор після RetryAfter; сповіщення про мути в чаті зливаються в одне; хендлери не чекають на надсилання. Черга — FIFO на чат і мін-купа чатів за часом готовності (O(log чатів) на надсилання), не більше OUTBOX_MAX_QUEUE повідомлень, відкинуті рахуються.
+# • 0.9.0 2026-10-17 Видалення повідомлень (мут, блокування, голосові, флуд, команди) збираються в чергу чату і йдуть пакетами delete_messages до 100 id із затримкою до DELETE_BATCH_DELAY_MS; при помилці — по одному; статистика пакетів і затримок у лозі.
+# • 0.8.0 2026-10-17 Стан розбито по чатах (ChatShard): у кожного чату власні лічильники, мути, блокування, ліміти (CHAT_LIMITS), lock і сховище в data/chats/<chat_id>/. Спільні дані з data/ переносяться лише в чати, що були в ALLOWED_CHAT_IDS при першому запуску (список — data/chats/legacy_import.json); чати, додані пізніше, починають з чистого стану. /listmute зливає мути всіх чатів.
+# • 0.7.0 2026-10-17 Планувальник завершення мутів (MuteScheduler): мін-купа з лінивим видаленням + run_once у JobQueue знімає мути вчасно й скидає ковзні вікна, як раніше при наступному повідомленні. /listmute читає посторінково (/listmute N) зріз відсортованого за часом завершення індексу, який оновлюється bisect при кожному муті й знятті.
+# • 0.6.0 2026-10-17 Фонове прибирання (JobQueue): прострочені вікна, денні лічильники минулих днів, старі позначки rate limit приватних повідомлень, кеш статусів; опційний ліміт MAX_TRACKED_USERS з LRU-витісненням; лічильники в SWEEP_STATS.
+# • 0.5.0 2026-10-17 Єдиний антифлуд-рушій RateLimiter: кільцевий буфер epoch-секунд (array, __slots__) на користувача, усі рівні (short, hourly, EXTRA_RATE_TIERS, daily) за один прохід. daily/hourly/short замінено набором rates (rate_limits.json) з автоматичним перенесенням старих даних.
+# • 0.4.0 2026-10-17 Бекенд journal: append-only журнал змін (JSONL) з group-commit fsync, фонова компакція в знімок, відновлення знімок + хвіст журналу з відкиданням обірваного запису.
+# • 0.3.0 2026-10-17 Підключуваний бекенд сховища (StorageBackend): JSON за замовчуванням, SQLite WAL з per-user upsert, індексом за часом завершення мутів і атомарними транзакціями. Одноразова міграція: python bot.py --migrate-json-to-sqlite.
+# • 0.2.0 2026-10-17 Write-behind збереження: обробники лише позначають змінених користувачів, JobQueue раз на SAVE_INTERVAL_SECONDS серіалізує тільки їх і пише файли у фоновому потоці. Фінальне збереження при зупинці (post_shutdown + atexit).
+# • 0.1.0 2026-10-17 Кеш статусів учасників (MemberStatusCache): адміни чату підтягуються get_chat_administrators з TTL, оновлюються через ChatMemberHandler; handle_message, /lock, /unlock, /stats більше не викликають get_chat_member для звичайних учасників.
 # • 0.0.30 2026-02-04 Відключено rate limit для OWNER_PRIVATE_ID (тепер можна слати часті повідомлення в групу нотифікацій власника без блокування). Додано динамічний LOGGER_LEVEL з детальним DEBUG.
 # • 0.0.29 2026-02-04 Додано INFO-логування всіх видалених повідомлень.
 # • 0.0.28 2026-02-04 Додано OWNER_PRIVATE_ID для надійних приватних повідомлень власнику при постах від каналу (анонімно). Виправлено reply_in_private для анонімних постів.
@@ -808,9 +4065,6 @@ if __name__ == "__main__":
 # і пропонуй зберегти поточну як окрему гілку
 #
 # 6. Найважливіші майбутні покращення (пріоритетність):
-# • Перейти на per-chat locked status та мути
-# • Додати періодичне збереження JSON через JobQueue
-# • Додати graceful shutdown (збереження даних при SIGTERM)
-# • Додати команду /reloadconfig
+# • (наразі немає запланованих)
 #
 # =============================================================================
@@ -0,0 +1,420 @@
+# Фейковий Bot API для benchmark.py і replay_updates.py: підставляється в Application як request,
+# відповідає з пам'яті після штучної затримки і рахує виклики. Мережі та справжнього токена не потрібно.
+#
+# Той самий Bot API є і як HTTP-сервер (FakeBotApiServer): bot.py підключається до нього через
+# BOT_API_BASE_URL і працює цілком — polling, хендлери, черги видалень і відправки — на одній машині.
+# Сервер віддає через getUpdates заскриптований потік (флуд, голосові, рейд), записує кожен виклик,
+# додає затримку і, за бажанням, відповідає 429 (RetryAfter).
+#
+#   python fake_bot_api.py --scenario flood --updates 2000        — запустити bot.py проти сервера і виміряти
+#                                                                   час від появи апдейта до його видалення
+#   python fake_bot_api.py --scenario raid --workers 2 --chats 4 --retry-after 0.02 --latency-ms 30
+#   python fake_bot_api.py --serve --port 8081 --scenario voice   — лише сервер; бот запускаєте самі
+#                                                                   з BOT_API_BASE_URL=http://127.0.0.1:8081
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+from telegram.request import BaseRequest
+
+REPO_DIR = Path(__file__).resolve().parent
+FAKE_TOKEN = "123456:fake"
+FAKE_OWNER_ID = 1
+SCENARIO_CHAT_ID = -1000000000001
+# Методи, на які --retry-after може відповісти 429
+RETRY_AFTER_METHODS = {"sendMessage", "deleteMessage", "deleteMessages", "restrictChatMember"}
+
+
+def fake_result(api_method: str, params: dict, admins_ok: bool = True) -> tuple[int, dict]:
+    # (HTTP-статус, тіло відповіді) для виклику Bot API
+    user = lambda user_id: {"id": int(user_id), "is_bot": False, "first_name": f"u{user_id}"}
+    if api_method == "getMe":
+        result = {"id": 999, "is_bot": True, "first_name": "fake", "username": "fake_bot"}
+    elif api_method == "getChatAdministrators":
+        if not admins_ok:
+            return 400, {"ok": False, "error_code": 400, "description": "Bad Request: not enough rights"}
+        result = [{"status": "creator", "is_anonymous": False, "user": user(FAKE_OWNER_ID)}]
+    elif api_method == "getChatMember":
+        result = {"status": "member", "user": user(params["user_id"])}
+    elif api_method == "getChat":
+        result = {"id": int(params["chat_id"]), "type": "supergroup", "title": "fake", "accent_color_id": 0,
+                  "max_reaction_count": 11, "permissions": {"can_send_messages": True},
+                  "accepted_gift_types": {"unlimited_gifts": True, "limited_gifts": True, "unique_gifts": True,
+                                          "premium_subscription": True, "gifts_from_channels": True}}
+    elif api_method == "sendMessage":
+        result = {"message_id": 1, "date": int(time.time()), "text": "ok",
+                  "chat": {"id": int(params["chat_id"]), "type": "private"}}
+    else:
+        result = True
+    return 200, {"ok": True, "result": result}
+
+
+def deleted_at(log: list[tuple[float, str, dict]]) -> dict[tuple[int, int], float]:
+    # (chat_id, message_id) → коли бот видалив повідомлення
+    deleted = {}
+    for at, api_method, params in log:
+        if api_method == "deleteMessage":
+            deleted.setdefault((int(params["chat_id"]), int(params["message_id"])), at)
+        elif api_method == "deleteMessages":
+            for message_id in params["message_ids"]:
+                deleted.setdefault((int(params["chat_id"]), int(message_id)), at)
+    return deleted
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class FakeBotRequest(BaseRequest):
+    # admins_ok=False імітує бота без прав адміна: getChatAdministrators падає,
+    # і статус кожного нового користувача береться окремим getChatMember.
+    # record=True — зберігати (monotonic-час, метод, параметри) кожного виклику в log.
+    def __init__(self, latency: float, admins_ok: bool = True, record: bool = False):
+        self.latency = latency
+        self.admins_ok = admins_ok
+        self.record = record
+        self.calls: dict[str, int] = {}
+        self.log: list[tuple[float, str, dict]] = []
+
+    @property
+    def read_timeout(self):
+        return 5.0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        params = request_data.parameters if request_data else {}
+        if api_method != "getMe":
+            await asyncio.sleep(self.latency)
+        if self.record:
+            self.log.append((time.monotonic(), api_method, params))
+        status, body = fake_result(api_method, params, self.admins_ok)
+        return status, json.dumps(body).encode()
+
+    def deleted_at(self) -> dict[tuple[int, int], float]:
+        # Потрібно record=True
+        return deleted_at(self.log)
+
+
+# ─── Сценарії для getUpdates ───
+def scenario_updates(name: str, count: int, rate: float, chats: int = 1, seed: int = 1) -> list[tuple[float, dict]]:
+    # [(секунди від першого getUpdates, апдейт)]; дата повідомлення ставиться в момент появи
+    rng = random.Random(seed)
+    chat_ids = [SCENARIO_CHAT_ID - i for i in range(chats)]
+    script = []
+
+    def message(at: float, user_id: int, voice: bool = False):
+        chat_id = chat_ids[user_id % len(chat_ids)]
+        body = {"message_id": len(script) + 1, "date": 0,
+                "chat": {"id": chat_id, "type": "supergroup", "title": "fake"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}}
+        if voice:
+            body["voice"] = {"file_id": "v", "file_unique_id": "v", "duration": 1}
+        else:
+            body["text"] = f"повідомлення {len(script) + 1}"
+        script.append((at, {"update_id": len(script) + 1, "message": body}))
+
+    def join(at: float, user_id: int):
+        chat_id = chat_ids[user_id % len(chat_ids)]
+        member = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+        script.append((at, {"update_id": len(script) + 1, "chat_member": {
+            "chat": {"id": chat_id, "type": "supergroup", "title": "fake"}, "from": member, "date": 0,
+            "old_chat_member": {"status": "left", "user": member},
+            "new_chat_member": {"status": "member", "user": member}}}))
+
+    if name == "flood":
+        # Кілька користувачів строчать без пауз — більшість повідомлень упирається в ліміти
+        for i in range(count):
+            message(i / rate, 1000 + i % 5)
+    elif name == "voice":
+        # Спам голосовими від багатьох користувачів: кожне видаляється, автор отримує мут
+        for i in range(count):
+            message(i / rate, 2000 + rng.randrange(max(count // 4, 1)), voice=True)
+    elif name == "raid":
+        # Рейд: нові акаунти заходять і майже одночасно пишуть по кілька повідомлень
+        raiders = max(count // 4, 1)
+        burst = count / rate
+        events = []
+        for k in range(raiders):
+            joined = rng.uniform(0, burst / 2)
+            events.append((joined, "join", 3000 + k))
+            events.extend((joined + rng.uniform(0, burst / 2), "message", 3000 + k) for _ in range(3))
+        for at, kind, user_id in sorted(events):
+            if kind == "join":
+                join(at, user_id)
+            else:
+                message(at, user_id)
+    elif name == "steady":
+        # Звичайний чат: багато користувачів, рідкі повідомлення, зрідка голосові
+        for i in range(count):
+            message(i / rate, 4000 + rng.randrange(max(count // 2, 1)), voice=rng.random() < 0.02)
+    else:
+        raise ValueError(f"невідомий сценарій {name}")
+    return script
+
+
+# ─── HTTP-сервер ───
+class FakeBotApiServer:
+    # HTTP/1.1 з keep-alive на asyncio, без сторонніх залежностей. Розуміє POST /bot<token>/<метод>
+    # з form-urlencoded або JSON тілом (як шле PTB). Відлік сценарію починається з першого getUpdates.
+    def __init__(self, script: list[tuple[float, dict]] = (), latency: float = 0.0, retry_after_rate: float = 0.0,
+                 retry_after: int = 1, admins_ok: bool = True, seed: int = 1):
+        self.script = list(script)
+        self.latency = latency
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.admins_ok = admins_ok
+        self.calls: dict[str, int] = {}
+        self.log: list[tuple[float, str, dict]] = []
+        self.retry_afters = 0
+        # (chat_id, message_id) → коли апдейт з'явився за сценарієм (monotonic)
+        self.appeared_at: dict[tuple[int, int], float] = {}
+        self.started: float | None = None
+        self.confirmed = 0
+        self._delivered = 0
+        self._rng = random.Random(seed)
+        self._server = None
+        self._connections: set[asyncio.Task] = set()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._server = await asyncio.start_server(self._serve, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Незавершені long polling запити клієнта обриваємо
+            for task in self._connections:
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+
+    @property
+    def done(self) -> bool:
+        # Усі апдейти сценарію бот отримав і підтвердив наступним getUpdates
+        return self.confirmed >= len(self.script)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, payload = await self.handle(target, headers.get("content-type", ""), body)
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def handle(self, target: str, content_type: str, body: bytes) -> tuple[int, dict]:
+        url = urlsplit(target)
+        api_method = url.path.rsplit("/", 1)[-1]
+        if content_type.startswith("application/json"):
+            params = json.loads(body or b"{}")
+        else:
+            params = {}
+            for key, value in parse_qsl(url.query) + parse_qsl(body.decode("utf-8")):
+                # PTB кодує складні значення (списки, об'єкти) як JSON-рядки
+                try:
+                    params[key] = json.loads(value)
+                except ValueError:
+                    params[key] = value
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        if api_method == "getUpdates":
+            return 200, {"ok": True, "result": await self._get_updates(params)}
+        if api_method != "getMe":
+            await asyncio.sleep(self.latency)
+        if api_method in RETRY_AFTER_METHODS and self._rng.random() < self.retry_after_rate:
+            self.retry_afters += 1
+            return 429, {"ok": False, "error_code": 429,
+                         "description": f"Too Many Requests: retry after {self.retry_after}",
+                         "parameters": {"retry_after": self.retry_after}}
+        self.log.append((time.monotonic(), api_method, params))
+        return fake_result(api_method, params, self.admins_ok)
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        # Long polling: чекаємо, поки за сценарієм з'явиться хоч один апдейт, або timeout
+        if self.started is None:
+            self.started = time.monotonic()
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+        while self.confirmed < len(self.script) and self.script[self.confirmed][1]["update_id"] < offset:
+            self.confirmed += 1
+        while True:
+            now = time.monotonic()
+            ready = []
+            for at, update in self.script[self.confirmed:self.confirmed + limit]:
+                if self.started + at > now:
+                    break
+                ready.append(self._appear(at, update))
+            if ready or now >= deadline:
+                return ready
+            wait = deadline - now
+            if self.confirmed < len(self.script):
+                wait = min(wait, self.started + self.script[self.confirmed][0] - now)
+            await asyncio.sleep(max(wait, 0.001))
+
+    def _appear(self, at: float, update: dict) -> dict:
+        if update["update_id"] > self._delivered:
+            self._delivered = update["update_id"]
+            event = update.get("message") or update.get("chat_member")
+            event["date"] = int(time.time())
+            if "message" in update:
+                self.appeared_at[(update["message"]["chat"]["id"], update["message"]["message_id"])] = self.started + at
+        return update
+
+    def report(self) -> dict:
+        deleted = deleted_at(self.log)
+        latencies = [deleted[key] - at for key, at in self.appeared_at.items() if key in deleted]
+        result = {"updates": len(self.script), "delivered": self._delivered, "messages": len(self.appeared_at),
+                  "deleted": len(latencies), "retry_after": self.retry_afters, "calls": dict(sorted(self.calls.items()))}
+        if latencies:
+            result.update({f"delete_p{pct}_ms": round(percentile(latencies, pct) * 1000, 1) for pct in (50, 95, 99)})
+            result["delete_max_ms"] = round(max(latencies) * 1000, 1)
+            result["delete_mean_ms"] = round(statistics.mean(latencies) * 1000, 1)
+        return result
+
+
+def print_report(name: str, report: dict, elapsed: float):
+    print(f"сценарій {name}: {report['delivered']} з {report['updates']} апдейтів за {elapsed:.1f} с, "
+          f"видалено {report['deleted']} з {report['messages']} повідомлень")
+    if report["deleted"]:
+        print(f"від появи апдейта до видалення: p50 {report['delete_p50_ms']:.0f} мс, p95 {report['delete_p95_ms']:.0f} мс, "
+              f"p99 {report['delete_p99_ms']:.0f} мс, макс {report['delete_max_ms']:.0f} мс")
+    print(f"відповідей 429 (RetryAfter): {report['retry_after']}")
+    print("виклики Bot API:", report["calls"])
+
+
+# ─── Драйвер: bot.py окремим процесом проти сервера ───
+async def drive(args, script: list[tuple[float, dict]]) -> dict:
+    server = FakeBotApiServer(script, args.latency_ms / 1000, args.retry_after, args.retry_after_seconds)
+    base_url = await server.start(port=args.port)
+    chats = {update["message"]["chat"]["id"] for _, update in script if "message" in update}
+    env = dict(os.environ, BOT_TOKEN=FAKE_TOKEN, OWNER_ID=str(FAKE_OWNER_ID), OWNER_PRIVATE_ID=str(FAKE_OWNER_ID),
+               ALLOWED_CHAT_IDS=",".join(map(str, sorted(chats))), BOT_API_BASE_URL=base_url,
+               DELIVERY_MODE="polling", WORKERS=str(args.workers), METRICS_PORT="0")
+    env.setdefault("LOGGER_LEVEL", "WARNING")
+    if args.scenario == "raid":
+        # Детектор рейдів за замовчуванням вимкнений; сценарій raid перевіряє його з типовими порогами
+        for key, value in (("RAID_MESSAGES_PER_SECOND", "20"), ("RAID_NEW_SENDERS_PER_MINUTE", "30"),
+                           ("RAID_JOINS_PER_MINUTE", "30")):
+            env.setdefault(key, value)
+    work_dir = tempfile.mkdtemp(prefix="abcwarrior-fakeapi-")
+    bot_process = await asyncio.create_subprocess_exec(sys.executable, str(REPO_DIR / "bot.py"), cwd=work_dir, env=env)
+    started = time.monotonic()
+    try:
+        # Чекаємо, поки бот забере весь сценарій, а потім — тиші без викликів (видалення, мути, сповіщення)
+        while not server.done:
+            if bot_process.returncode is not None:
+                raise RuntimeError(f"bot.py завершився з кодом {bot_process.returncode}, логи: {work_dir}")
+            if time.monotonic() - started > args.max_seconds:
+                print(f"не дочекалися кінця сценарію за {args.max_seconds} с")
+                break
+            await asyncio.sleep(0.2)
+        settle = max(args.settle, args.retry_after_seconds + 1 if args.retry_after else 0)
+        last_calls = -1
+        while len(server.log) != last_calls:
+            last_calls = len(server.log)
+            await asyncio.sleep(settle)
+        elapsed = time.monotonic() - (server.started or started)
+    finally:
+        if bot_process.returncode is None:
+            bot_process.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(bot_process.wait(), 30)
+            except asyncio.TimeoutError:
+                bot_process.kill()
+        await server.stop()
+    report = server.report()
+    report.update({"scenario": args.scenario, "workers": args.workers, "latency_ms": args.latency_ms,
+                   "elapsed_s": round(elapsed, 2), "work_dir": work_dir})
+    print_report(args.scenario, report, elapsed)
+    print(f"дані й логи бота: {work_dir}")
+    return report
+
+
+async def serve(args, script: list[tuple[float, dict]]):
+    server = FakeBotApiServer(script, args.latency_ms / 1000, args.retry_after, args.retry_after_seconds)
+    base_url = await server.start(port=args.port or 8081)
+    print(f"фейковий Bot API: BOT_API_BASE_URL={base_url} (токен будь-який, OWNER_ID={FAKE_OWNER_ID}, "
+          f"ALLOWED_CHAT_IDS={SCENARIO_CHAT_ID}...); Ctrl+C — зупинити і показати звіт")
+    started = time.monotonic()
+    stopped = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signum, stopped.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    try:
+        await stopped.wait()
+    finally:
+        await server.stop()
+        print_report(args.scenario, server.report(), time.monotonic() - (server.started or started))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Фейковий Bot API і навантажувальний прогін bot.py без мережі")
+    parser.add_argument("--scenario", choices=("flood", "voice", "raid", "steady"), default="flood")
+    parser.add_argument("--updates", type=int, default=1000, help="скільки апдейтів у сценарії")
+    parser.add_argument("--rate", type=float, default=200, help="апдейтів за секунду")
+    parser.add_argument("--chats", type=int, default=1, help="на скільки чатів розкласти користувачів")
+    parser.add_argument("--latency-ms", type=float, default=20, help="затримка кожного виклику Bot API")
+    parser.add_argument("--retry-after", type=float, default=0, help="частка викликів, що отримують 429 (0..1)")
+    parser.add_argument("--retry-after-seconds", type=int, default=1, help="retry_after у відповіді 429")
+    parser.add_argument("--workers", type=int, default=0, help="WORKERS для bot.py")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--settle", type=float, default=2, help="скільки секунд тиші вважати кінцем прогону")
+    parser.add_argument("--max-seconds", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--serve", action="store_true", help="лише сервер, bot.py запускаєте самі")
+    parser.add_argument("--json", type=Path, help="зберегти звіт у JSON")
+    args = parser.parse_args()
+
+    script = scenario_updates(args.scenario, args.updates, args.rate, args.chats, args.seed)
+    if args.serve:
+        asyncio.run(serve(args, script))
+        return
+    report = asyncio.run(drive(args, script))
+    if args.json:
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
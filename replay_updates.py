@@ -0,0 +1,168 @@
+# Відтворення записаних апдейтів через webhook: POST кожного апдейта на вбудований сервер бота.
+#
+#   python replay_updates.py updates.json            — на запущеного бота (DELIVERY_MODE=webhook),
+#                                                     адреса і секрет беруться з .env
+#   python replay_updates.py --local updates.json    — підняти бота з фейковим Bot API і webhook-сервером
+#                                                     тут же і виміряти час від POST до видалення
+#   python replay_updates.py --local --generate 500  — замість файлу згенерувати флуд
+#
+# Файл: JSON-масив апдейтів, відповідь getUpdates ({"ok": true, "result": [...]}) або JSONL.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+
+REPO_DIR = Path(__file__).resolve().parent
+GENERATED_CHAT_ID = -1000000000001
+
+
+def load_updates(path: Path) -> list[dict]:
+    text = path.read_text(encoding="utf-8")
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(data, dict):
+        return data.get("result", [data])
+    return data
+
+
+def generate_updates(count: int, users: int = 5, seed: int = 1) -> list[dict]:
+    # Кілька користувачів флудять в одному чаті, частина повідомлень — голосові
+    rng = random.Random(seed)
+    updates = []
+    for i in range(count):
+        user_id = 1000 + i % users
+        message = {"message_id": i + 1, "date": 0,
+                   "chat": {"id": GENERATED_CHAT_ID, "type": "supergroup", "title": "replay"},
+                   "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}}
+        if rng.random() < 0.05:
+            message["voice"] = {"file_id": "v", "file_unique_id": "v", "duration": 1}
+        else:
+            message["text"] = f"спам {i}"
+        updates.append({"update_id": i + 1, "message": message})
+    return updates
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def post_updates(url: str, secret: str, updates: list[dict], rate: float,
+                       fresh_dates: bool) -> tuple[dict[tuple[int, int], float], list[float]]:
+    # Повертає час відправки кожного повідомлення (chat_id, message_id) і тривалості POST-запитів
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    posted_at = {}
+    durations = []
+    async with httpx.AsyncClient(timeout=10) as client:
+        for update in updates:
+            message = update.get("message")
+            if message and fresh_dates:
+                message["date"] = int(time.time())
+            started = time.monotonic()
+            response = await client.post(url, json=update, headers=headers)
+            durations.append(time.monotonic() - started)
+            if response.status_code != 200:
+                print(f"update {update.get('update_id')}: HTTP {response.status_code} {response.text[:100]}")
+            if message:
+                posted_at[(message["chat"]["id"], message["message_id"])] = started
+            if rate:
+                await asyncio.sleep(1 / rate)
+    return posted_at, durations
+
+
+async def replay_local(args, updates: list[dict]):
+    # Бот у цьому ж процесі: справжні хендлери і webhook-сервер PTB, Bot API — фейковий
+    chats = {u["message"]["chat"]["id"] for u in updates if u.get("message")}
+    os.environ["BOT_TOKEN"] = "123456:replay"
+    os.environ["ALLOWED_CHAT_IDS"] = ",".join(str(chat_id) for chat_id in chats)
+    os.environ.setdefault("OWNER_ID", "1")
+    os.environ.setdefault("LOGGER_LEVEL", "WARNING")
+    os.chdir(tempfile.mkdtemp(prefix="abcwarrior-replay-"))
+    sys.path.insert(0, str(REPO_DIR))
+    import bot
+    from fake_bot_api import FakeBotRequest
+
+    secret = args.secret or secrets.token_urlsafe(24)
+    port = args.port or bot.WEBHOOK_PORT
+    path = bot.WEBHOOK_PATH.lstrip("/")
+    request = FakeBotRequest(args.latency_ms / 1000, record=True)
+    app = bot.build_application(request=request)
+    await app.initialize()
+    await app.updater.start_webhook(listen="127.0.0.1", port=port, url_path=path, secret_token=secret,
+                                    webhook_url=f"http://127.0.0.1:{port}/{path}",
+                                    allowed_updates=bot.ALLOWED_UPDATES)
+    await app.start()
+    try:
+        posted_at, durations = await post_updates(f"http://127.0.0.1:{port}/{path}", secret, updates,
+                                                  args.rate, not args.keep_dates)
+        # Даємо черзі видалень дочекатися свого вікна
+        await asyncio.sleep(bot.DELETE_BATCH_DELAY_MS / 1000 + args.latency_ms / 1000 + 0.5)
+    finally:
+        await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+    deleted = request.deleted_at()
+    time_to_delete = [deleted[key] - at for key, at in posted_at.items() if key in deleted]
+    report(len(updates), durations)
+    if time_to_delete:
+        print(f"видалено {len(time_to_delete)} з {len(posted_at)} повідомлень; час від POST до видалення: "
+              f"p50 {percentile(time_to_delete, 50) * 1000:.0f} мс, p95 {percentile(time_to_delete, 95) * 1000:.0f} мс, "
+              f"макс {max(time_to_delete) * 1000:.0f} мс")
+    else:
+        print(f"жодне з {len(posted_at)} повідомлень не видалено")
+    print("виклики Bot API:", dict(sorted(request.calls.items())))
+
+
+def report(count: int, durations: list[float]):
+    if durations:
+        print(f"надіслано {count} апдейтів; POST: середнє {statistics.mean(durations) * 1000:.1f} мс, "
+              f"p99 {percentile(durations, 99) * 1000:.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POST записаних апдейтів на webhook бота")
+    parser.add_argument("file", nargs="?", type=Path, help="JSON / JSONL з апдейтами")
+    parser.add_argument("--generate", type=int, default=0, help="згенерувати N апдейтів-флуду замість файлу")
+    parser.add_argument("--local", action="store_true", help="підняти бота з фейковим Bot API в цьому процесі")
+    parser.add_argument("--url", help="адреса webhook (за замовчуванням http://127.0.0.1:WEBHOOK_PORT/WEBHOOK_PATH)")
+    parser.add_argument("--secret", help="секрет (за замовчуванням WEBHOOK_SECRET_TOKEN з .env)")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=0, help="апдейтів за секунду (0 — без пауз)")
+    parser.add_argument("--latency-ms", type=float, default=50, help="затримка фейкового Bot API (--local)")
+    parser.add_argument("--keep-dates", action="store_true", help="не підміняти дату повідомлень на поточну")
+    args = parser.parse_args()
+
+    if args.generate:
+        updates = generate_updates(args.generate)
+    elif args.file:
+        updates = load_updates(args.file)
+    else:
+        parser.error("потрібен файл з апдейтами або --generate N")
+
+    if args.local:
+        asyncio.run(replay_local(args, updates))
+        return
+    load_dotenv(REPO_DIR / ".env")
+    port = args.port or int(os.getenv("WEBHOOK_PORT", 8443))
+    url = args.url or f"http://127.0.0.1:{port}/{os.getenv('WEBHOOK_PATH', 'telegram').lstrip('/')}"
+    secret = args.secret if args.secret is not None else os.getenv("WEBHOOK_SECRET_TOKEN", "")
+    _, durations = asyncio.run(post_updates(url, secret, updates, args.rate, not args.keep_dates))
+    report(len(updates), durations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+# Як і в benchmark.py: змінні середовища задаються до імпорту bot.py, дані й лог — у тимчасовій теці
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+os.environ["BOT_TOKEN"] = "123456:tests"
+os.environ.setdefault("LOGGER_LEVEL", "WARNING")
+os.chdir(tempfile.mkdtemp(prefix="abcwarrior-tests-"))
+sys.path.insert(0, str(REPO_DIR))
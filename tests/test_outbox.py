@@ -0,0 +1,52 @@
+# Outbox: порядок повідомлень одного чату зберігається і при одночасних запитах, і після RetryAfter
+import asyncio
+
+from telegram.error import RetryAfter
+
+from bot import Outbox
+
+CHAT_ID = -100
+
+
+class FlakyBot:
+    # Перші retry_after викликів для чату відповідають RetryAfter, решта проходить
+    def __init__(self, retry_after: int = 0):
+        self.retry_after = retry_after
+        self.sent = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send_message(self, chat_id, text, parse_mode=None, disable_notification=False):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.005)
+            if self.retry_after:
+                self.retry_after -= 1
+                raise RetryAfter(0.02)
+            self.sent.append(text)
+        finally:
+            self.in_flight -= 1
+
+
+def deliver(bot, texts):
+    async def run():
+        outbox = Outbox(1000, 600, 100, 4, 0)
+        for text in texts:
+            outbox.send(bot, CHAT_ID, text)
+        await asyncio.sleep(0)
+        await asyncio.wait_for(outbox._drain(), 10)
+    asyncio.run(run())
+
+
+def test_retry_after_keeps_chat_order():
+    bot = FlakyBot(retry_after=3)
+    deliver(bot, ["a", "b", "c", "d", "e"])
+    assert bot.sent == ["a", "b", "c", "d", "e"]
+
+
+def test_one_request_per_chat_in_flight():
+    bot = FlakyBot()
+    deliver(bot, [str(i) for i in range(8)])
+    assert bot.sent == [str(i) for i in range(8)]
+    assert bot.max_in_flight == 1
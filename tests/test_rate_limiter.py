@@ -0,0 +1,123 @@
+# RateLimiter (кільце + partial) проти прямого перенесення старої логіки handle_message:
+# списки short_term → hourly → daily, повідомлення, на якому спрацював рівень, у довші не потрапляє
+import random
+
+from bot import RateLimiter, RateTier
+
+START = 1_700_000_000
+DAY = 86400
+
+
+def make_tiers(rng):
+    short = RateTier("short", rng.choice((60, 120, 300)), rng.randint(1, 5), 5, "short")
+    hourly = RateTier("hourly", 3600, rng.randint(3, 12), 60, "hourly")
+    daily = RateTier("daily", DAY, rng.randint(5, 40), 1440, "daily")
+    return short, hourly, daily
+
+
+def make_trace(rng, length=120):
+    ts = START
+    trace = []
+    for _ in range(length):
+        ts += rng.choice((0, 1, 3, 10, 30, 90, 400, 1500, 20000))
+        trace.append(ts)
+    return trace
+
+
+class Baseline:
+    # Перенесення 0.0.30: short_term і hourly — списки позначок, daily — лічильник за датою
+    def __init__(self, short, hourly, daily):
+        self.short, self.hourly, self.daily = short, hourly, daily
+        self.short_term = []
+        self.hourly_data = []
+        self.day = None
+        self.count = 0
+
+    def hit(self, ts):
+        self.short_term.append(ts)
+        self.short_term = [t for t in self.short_term if t >= ts - self.short.window]
+        if len(self.short_term) > self.short.limit:
+            return "short"
+        self.hourly_data.append(ts)
+        self.hourly_data = [t for t in self.hourly_data if t >= ts - self.hourly.window]
+        if len(self.hourly_data) > self.hourly.limit:
+            return "hourly"
+        if self.day != ts // DAY:
+            self.day = ts // DAY
+            self.count = 0
+        self.count += 1
+        if self.count > self.daily.limit:
+            return "daily"
+        return None
+
+
+class WindowModel:
+    # Те саме правило для довільного набору рівнів: повідомлення, на якому спрацював рівень
+    # з вікном w, рахується лише у вікнах не довших за w
+    def __init__(self, tiers):
+        self.tiers = sorted(tiers, key=lambda t: t.window)
+        self.entries = []
+
+    def hit(self, ts):
+        for tier in self.tiers:
+            count = sum(1 for t, w in self.entries if t >= ts - tier.window and w >= tier.window)
+            if count + 1 > tier.limit:
+                self.entries.append((ts, tier.window))
+                return tier.name
+        self.entries.append((ts, float("inf")))
+        return None
+
+
+def test_hit_matches_baseline_on_random_traces():
+    rng = random.Random(5)
+    for _ in range(3000):
+        short, hourly, daily = make_tiers(rng)
+        limiter = RateLimiter([short, hourly], daily)
+        baseline = Baseline(short, hourly, daily)
+        for ts in make_trace(rng):
+            tier = limiter.hit(1, ts, ts // DAY)
+            assert (tier.name if tier else None) == baseline.hit(ts)
+        counts = limiter.counts(1, ts, ts // DAY)
+        assert counts["short"] == len([t for t in baseline.short_term if t >= ts - short.window])
+        assert counts["hourly"] == len([t for t in baseline.hourly_data if t >= ts - hourly.window])
+        assert counts["daily"] == (baseline.count if baseline.day == ts // DAY else 0)
+
+
+def test_reconfigure_keeps_tripped_messages_counted():
+    rng = random.Random(7)
+    daily = RateTier("daily", DAY, 10 ** 6, 1440, "daily")
+    for _ in range(1000):
+        tiers = [RateTier("short", 60, rng.randint(1, 4), 5, "short"),
+                 RateTier("hourly", 3600, rng.randint(3, 10), 60, "hourly")]
+        limiter = RateLimiter(tiers, daily)
+        model = WindowModel(tiers)
+        trace = make_trace(rng, 80)
+        split = rng.randrange(len(trace))
+        for i, ts in enumerate(trace):
+            if i == split:
+                # /reloadconfig: інші ліміти, додатковий рівень між наявними або без short
+                tiers = [RateTier("short", 60, rng.randint(1, 4), 5, "short"),
+                         RateTier("extra", 600, rng.randint(2, 6), 30, "extra"),
+                         RateTier("hourly", 3600, rng.randint(3, 10), 60, "hourly")]
+                if rng.random() < 0.3:
+                    tiers = tiers[1:]
+                limiter.reconfigure(tiers, daily)
+                entries = model.entries
+                model = WindowModel(tiers)
+                model.entries = entries
+            tier = limiter.hit(1, ts, ts // DAY)
+            assert (tier.name if tier else None) == model.hit(ts)
+
+
+def test_repeat_after_trip_within_window_is_muted_again():
+    # Одразу після /reloadconfig з тими самими лімітами наступне повідомлення у вікні знову ловиться
+    short = RateTier("short", 60, 2, 5, "short")
+    hourly = RateTier("hourly", 3600, 10, 60, "hourly")
+    daily = RateTier("daily", DAY, 100, 1440, "daily")
+    limiter = RateLimiter([short, hourly], daily)
+    assert limiter.hit(1, START, 0) is None
+    assert limiter.hit(1, START + 1, 0) is None
+    assert limiter.hit(1, START + 2, 0) is short
+    limiter.reconfigure([short, hourly], daily)
+    assert limiter.counts(1, START + 2, 0)["short"] == 3
+    assert limiter.hit(1, START + 3, 0) is short
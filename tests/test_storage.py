@@ -0,0 +1,126 @@
+# Відновлення після аварії: обірваний хвіст журналу, CRC бінарного знімка, знімок ↔ журнал
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from bot import (BINARY_JOURNAL_FILENAME, BINARY_SNAPSHOT_FILENAME, DATASET_FILES, JOURNAL_FILENAME,
+                 SNAPSHOT_FILENAME, BinaryBackend, JournalBackend, StorageBackend, decode_binary_snapshot,
+                 encode_binary_snapshot)
+
+
+def open_journal(directory, compact_bytes=1 << 30):
+    return JournalBackend(directory / SNAPSHOT_FILENAME, directory / JOURNAL_FILENAME, DATASET_FILES,
+                          compact_bytes, fsync=False)
+
+
+def open_binary(directory, compact_bytes=1 << 30):
+    return BinaryBackend(directory / BINARY_SNAPSHOT_FILENAME, directory / BINARY_JOURNAL_FILENAME, DATASET_FILES,
+                         compact_bytes, fsync=False)
+
+
+def now_ts():
+    return int(datetime.now(timezone.utc).timestamp())
+
+
+def test_journal_drops_torn_tail_and_keeps_later_appends(tmp_path):
+    backend = open_journal(tmp_path)
+    backend.write({"mutes": {1: "2099-01-01T00:00:00+00:00"}})
+    backend.write({"meta": {0: {"locked": True}}, "mutes": {2: "2099-01-02T00:00:00+00:00"}})
+    backend.close()
+    journal = tmp_path / JOURNAL_FILENAME
+    good_size = journal.stat().st_size
+    with open(journal, "ab") as f:
+        f.write(b'{"seq":3,"ops":{"mutes":{"3":"20')
+
+    backend = open_journal(tmp_path)
+    assert journal.stat().st_size == good_size
+    assert backend.load("mutes") == {"1": "2099-01-01T00:00:00+00:00", "2": "2099-01-02T00:00:00+00:00"}
+    backend.write({"mutes": {1: None, 4: "2099-01-04T00:00:00+00:00"}})
+    backend.close()
+
+    backend = open_journal(tmp_path)
+    assert backend.load("mutes") == {"2": "2099-01-02T00:00:00+00:00", "4": "2099-01-04T00:00:00+00:00"}
+    assert backend.load("meta") == {"0": {"locked": True}}
+    backend.close()
+
+
+def test_journal_compaction_round_trip(tmp_path):
+    backend = open_journal(tmp_path)
+    for user_id in range(20):
+        backend.write({"mutes": {user_id: f"2099-01-01T00:00:{user_id:02d}+00:00"}})
+    backend.compact()
+    backend.write({"mutes": {0: None}})
+    backend.close()
+    # У журналі після компакції — лише запис, зроблений після знімка
+    assert len((tmp_path / JOURNAL_FILENAME).read_bytes().splitlines()) == 1
+
+    backend = open_journal(tmp_path)
+    mutes = backend.load("mutes")
+    assert len(mutes) == 19 and "0" not in mutes and mutes["19"] == "2099-01-01T00:00:19+00:00"
+    backend.close()
+
+
+def test_binary_snapshot_round_trip():
+    ts = now_ts()
+    rates = [(5, [ts - 30, ts - 10], 738000, 3), (42, [], 738001, 7), (1 << 40, [ts], 0, 0)]
+    mutes = {5: ts + 600, 9: ts - 1}
+    blob = encode_binary_snapshot(17, rates, mutes, {"meta": {"0": {"locked": False}}})
+    seq, snapshot, live_mutes, extra = decode_binary_snapshot(blob, ts)
+    assert seq == 17
+    assert [(uid, list(stamps), day, count) for uid, stamps, day, count in map(snapshot.entry, range(len(snapshot)))] \
+        == [(uid, stamps, day, count) for uid, stamps, day, count in rates]
+    assert snapshot.find(42) == 1 and snapshot.find(43) == -1
+    assert live_mutes == {5: ts + 600}
+    assert extra == {"meta": {"0": {"locked": False}}}
+
+
+@pytest.mark.parametrize("position", [-1, 40])
+def test_binary_snapshot_rejects_corrupted_payload(position):
+    ts = now_ts()
+    blob = bytearray(encode_binary_snapshot(1, [(5, [ts], 0, 0)], {5: ts + 60}, {}))
+    blob[position] ^= 0xFF
+    with pytest.raises(ValueError, match="контрольна сума"):
+        decode_binary_snapshot(bytes(blob), ts)
+    with pytest.raises(ValueError):
+        decode_binary_snapshot(bytes(blob[:-1]), ts)
+
+
+def test_binary_backend_compaction_and_recovery(tmp_path):
+    ts = now_ts()
+    today = datetime.now(timezone.utc).date().isoformat()
+    # Знімок зберігає мути в цілих секундах (округлення вгору), тож беремо вже цілу
+    mute_until = (datetime.now(timezone.utc) + timedelta(hours=1)).replace(microsecond=0).isoformat()
+    backend = open_binary(tmp_path)
+    backend.write({"rates": {7: {"t": [ts - 20, ts - 5], "d": today, "c": 2}}, "mutes": {7: mute_until}})
+    backend.compact()
+    backend.write({"rates": {8: {"t": [ts - 1], "d": today, "c": 1}}})
+    backend.close()
+    with open(tmp_path / BINARY_JOURNAL_FILENAME, "ab") as f:
+        f.write(b'{"seq":9,"ops":{"rat')
+
+    backend = open_binary(tmp_path)
+    cold = backend.cold_rates()
+    uid, stamps, _, day_count = cold.entry(cold.find(7))
+    assert (uid, list(stamps), day_count) == (7, [ts - 20, ts - 5], 2)
+    assert backend.load("rates") == {"8": {"t": [ts - 1], "d": today, "c": 1}}
+    assert backend.load("mutes") == {"7": mute_until}
+    backend.close()
+
+    # Знімок з пошкодженою CRC не читається: лишається тільки відтворений хвіст журналу
+    snapshot = tmp_path / BINARY_SNAPSHOT_FILENAME
+    blob = bytearray(snapshot.read_bytes())
+    blob[-1] ^= 0xFF
+    snapshot.write_bytes(bytes(blob))
+    backend = open_binary(tmp_path)
+    assert len(backend.cold_rates()) == 0
+    assert backend.load("rates") == {"8": {"t": [ts - 1], "d": today, "c": 1}}
+    backend.close()
+
+
+def test_backend_without_write_fails_on_creation():
+    class ReadOnlyBackend(StorageBackend):
+        def load(self, name):
+            return {}
+
+    with pytest.raises(TypeError):
+        ReadOnlyBackend()